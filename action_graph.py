@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware scheduler for the shutdown sequence.
+
+Each Step names the steps it must wait for. Steps whose dependencies are
+finished run concurrently on a bounded thread pool, so independent devices
+are switched off in parallel while required orderings are kept.
+Dependencies only order the steps: a failed step does not stop its
+dependents (the safety sequence always tries every device).
+
+A watchdog in the scheduler enforces per-step time budgets and run
+deadlines: an overrunning step is marked OVERRUN, its backup (if any) is
+started, and its dependents go ahead on time.
+"""
+import queue
+import threading
+import time
+
+# Step states
+PENDING = "pending"
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+OVERRUN = "overrun"
+
+# Guards the status fields a step's thread and the watchdog both write
+_state_lock = threading.Lock()
+# The step (and its run's start) that the current step thread is running
+_current = threading.local()
+
+
+class StepOverrun(Exception):
+  """
+  The step was still running when its budget or the run deadline expired.
+  A step may raise it itself when it gave up at its limit (e.g. killed its
+  subprocess at time_left()): it then ends as OVERRUN, like at the watchdog.
+  """
+
+
+class Step:
+  """
+  One node of the action graph.
+
+  func is called without arguments; an exception marks the step FAILED.
+  enabled, if given, is called right before the step would start; when it
+  returns False the step is SKIPPED (e.g. post-wait steps after a cancel).
+
+  When several steps are ready at once, lower 'priority' values start first.
+
+  budget (seconds from the step's own start) and deadline (seconds from the
+  start of the run) limit the step. When one expires the step is OVERRUN:
+  backup, if given, is called in a thread of its own, and the overrunning
+  call is abandoned. It keeps its thread until it returns (threads cannot
+  be killed), and its late outcome goes to late_status/late_error.
+  """
+
+  def __init__(self, name, func, deps=(), label=None, enabled=None, budget=None, deadline=None, backup=None,
+               priority=0):
+    self.name = name
+    self.func = func
+    self.deps = tuple(deps)
+    self.label = label or name
+    self.enabled = enabled
+    self.budget = budget
+    self.deadline = deadline
+    self.backup = backup
+    self.priority = priority
+    self.reset()
+
+  def reset(self):
+    self.status = PENDING
+    self.start = None
+    self.end = None
+    self.error = None
+    self.result = None
+    self.late_status = None
+    self.late_error = None
+    self.late_end = None
+    self.backup_status = None
+    self.backup_error = None
+
+  def expiry(self, run_start):
+    """
+    Time at which the running step overruns, or None if it is not limited.
+    """
+    limits = []
+    if self.budget is not None:
+      limits.append(self.start + self.budget)
+    if self.deadline is not None:
+      limits.append(run_start + self.deadline)
+    return min(limits) if limits else None
+
+  @property
+  def duration(self):
+    if self.start is None or self.end is None:
+      return None
+    return self.end - self.start
+
+  def __repr__(self):
+    return f"Step({self.name!r}, status={self.status!r})"
+
+
+def validate_graph(steps):
+  """
+  Raise ValueError on duplicate names, unknown dependencies or cycles.
+  """
+  names = {}
+  for step in steps:
+    if step.name in names:
+      raise ValueError(f"Duplicate step name: {step.name}")
+    names[step.name] = step
+  for step in steps:
+    for dep in step.deps:
+      if dep not in names:
+        raise ValueError(f"Step '{step.name}' depends on unknown step '{dep}'")
+
+  # Kahn's algorithm: every step must become ready at some point
+  remaining = {step.name: set(step.deps) for step in steps}
+  while remaining:
+    ready = [name for name, deps in remaining.items() if not deps]
+    if not ready:
+      raise ValueError(f"Dependency cycle among steps: {sorted(remaining)}")
+    for name in ready:
+      del remaining[name]
+    for deps in remaining.values():
+      deps.difference_update(ready)
+
+
+class GraphRun:
+  """
+  Result of run_graph: the steps (with their timings) and the total wall-clock time.
+  """
+
+  def __init__(self, steps):
+    self.steps = list(steps)
+    self.start = None
+    self.end = None
+    self.completed = set() # Steps finished in an earlier run (see run_graph)
+
+  @property
+  def duration(self):
+    if self.start is None or self.end is None:
+      return None
+    return self.end - self.start
+
+  def step(self, name):
+    for step in self.steps:
+      if step.name == name:
+        return step
+    raise KeyError(name)
+
+  def failed(self):
+    return [step for step in self.steps if step.status in (FAILED, OVERRUN)]
+
+  def overruns(self):
+    return [step for step in self.steps if step.status == OVERRUN]
+
+  def timing_lines(self):
+    """
+    One human-readable line per step, in start order.
+    """
+    started = [s for s in self.steps if s.start is not None]
+    origin = self.start if self.start is not None else 0.0
+    lines = []
+    for s in sorted(started, key=lambda s: s.start):
+      if s.name in self.completed:
+        lines.append(f"{s.label}: {s.status} in an earlier run, took {s.duration:.2f}s")
+      else:
+        lines.append(f"{s.label}: {s.status} at +{s.start - origin:.2f}s, took {s.duration:.2f}s")
+    for s in self.steps:
+      if s.start is None:
+        lines.append(f"{s.label}: {s.status}")
+    return lines
+
+
+def _finish(step, status, result, error):
+  with _state_lock:
+    if step.status == RUNNING:
+      step.status, step.result, step.error, step.end = status, result, error, time.time()
+    else:
+      # Already given up on by the watchdog
+      step.late_status, step.late_error, step.late_end = status, error, time.time()
+
+
+def time_left():
+  """
+  Seconds until the step running in this thread overruns (its budget or
+  the run deadline), or None outside a step or for an unlimited step.
+  A step uses it to bound its subprocesses by its own limit.
+  """
+  step = getattr(_current, "step", None)
+  if step is None:
+    return None
+  expiry = step.expiry(_current.run_start)
+  return None if expiry is None else expiry - time.time()
+
+
+def _run_step(step, done, run_start):
+  _current.step, _current.run_start = step, run_start
+  try:
+    result = step.func()
+  except StepOverrun as e:
+    # Gave up on its own just before its limit; the backup may start now
+    if not _overrun(step, time.time(), e):
+      _finish(step, FAILED, None, e)
+  except BaseException as e:
+    _finish(step, FAILED, None, e)
+  else:
+    _finish(step, OK, result, None)
+  done.put(step)
+
+
+def _run_backup(step):
+  try:
+    step.backup()
+    step.backup_status = OK
+  except BaseException as e:
+    step.backup_error = e
+    step.backup_status = FAILED
+
+
+def _overrun(step, now, error=None):
+  """
+  Give up on a running step whose limit expired. Returns False if it
+  finished (or was given up on) in the meantime.
+  """
+  with _state_lock:
+    if step.status != RUNNING:
+      return False
+    limits = []
+    if step.budget is not None:
+      limits.append(f"budget {step.budget:g}s")
+    if step.deadline is not None:
+      limits.append(f"deadline +{step.deadline:g}s")
+    step.status = OVERRUN
+    step.end = now
+    step.error = error or StepOverrun(f"still running after {now - step.start:.1f}s ({', '.join(limits)})")
+  if step.backup is not None:
+    step.backup_status = RUNNING
+    threading.Thread(target=_run_backup, args=(step,), name=f"backup-{step.name}", daemon=True).start()
+  return True
+
+
+def run_graph(steps, max_workers=8, on_step_done=None, completed=None):
+  """
+  Run 'steps' respecting their dependencies, at most 'max_workers' at a time.
+  on_step_done(step) is called from the scheduler thread after each step
+  finishes, is skipped or overruns. Returns a GraphRun as soon as no step
+  is left running (abandoned overrunning calls do not hold it up).
+
+  completed, {name: (start, end)}, lists steps that already finished OK in
+  an earlier run (e.g. before a restart): they are marked OK with those
+  times and not run again. Unknown names are ignored.
+  """
+  validate_graph(steps)
+  run = GraphRun(steps)
+  for step in steps:
+    step.reset()
+
+  pending = {step.name: step for step in steps}
+  finished = set()
+  for name, (start, end) in (completed or {}).items():
+    step = pending.pop(name, None)
+    if step is not None:
+      step.status, step.start, step.end = OK, start, end
+      finished.add(name)
+      run.completed.add(name)
+  running = set()
+  done = queue.Queue()
+  run.start = time.time()
+
+  while pending or running:
+    # Start (or skip) every step whose dependencies are all finished
+    progressed = True
+    while progressed:
+      progressed = False
+      for name, step in sorted(pending.items(), key=lambda item: item[1].priority):
+        if len(running) >= max_workers:
+          break
+        if not all(dep in finished for dep in step.deps):
+          continue
+        del pending[name]
+        if step.enabled is not None and not step.enabled():
+          step.status = SKIPPED
+          finished.add(name)
+          progressed = True # Skipping may unblock other steps
+          if on_step_done:
+            on_step_done(step)
+          continue
+        step.start = time.time()
+        step.status = RUNNING
+        running.add(step)
+        threading.Thread(target=_run_step, args=(step, done, run.start), name=f"action-{name}", daemon=True).start()
+
+    if not running:
+      break
+
+    # Wait for a step to finish, or for the earliest limit to expire
+    expiries = [e for e in (step.expiry(run.start) for step in running) if e is not None]
+    timeout = max(0.0, min(expiries) - time.time()) if expiries else None
+    completed = []
+    try:
+      step = done.get(timeout=timeout)
+      while True:
+        if step in running: # Late completions of abandoned steps are ignored
+          completed.append(step)
+        step = done.get_nowait()
+    except queue.Empty:
+      pass
+
+    # Watchdog: give up on steps past their budget or the run deadline
+    now = time.time()
+    for step in running.difference(completed):
+      expiry = step.expiry(run.start)
+      if expiry is not None and now >= expiry and _overrun(step, now):
+        completed.append(step)
+
+    for step in completed:
+      running.discard(step)
+      finished.add(step.name)
+      if on_step_done:
+        on_step_done(step)
+
+  run.end = time.time()
+  return run
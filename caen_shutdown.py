@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+CAEN SY1527 (caenhv1) shutdown engine.
+
+One login to the crate serves every group: the crate map is read once and
+cached, and each slot (or channel group of a slot) is switched off with a
+single list-valued set_ch_param call. Groups:
+  chamber : every channel of slot 4
+  t0      : slot 8, boosters first, then (after their ramp-down) the PMTs
+
+After each set_ch_param the stage reads VMon/Pw/Status of all its channels
+back (one batched get_ch_param per parameter), polling fast at first and
+then backing off, until every channel is below RAMP_OFF_THRESHOLD_V or the
+stage deadline passes. Per-channel ramp times are returned and appended to
+RAMP_LOG_PATH (JSON lines) for later comparison.
+
+restore() switches a group back on in the reverse stage order, confirmed
+the same way (Pw 1 and VMon at the channel's V0Set).
+
+Usage:
+  python caen_shutdown.py            # chamber, then t0
+  python caen_shutdown.py t0
+  python caen_shutdown.py --restore  # power restore, chamber then t0
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from caen_libs import caenhvwrapper as hv
+
+import telemetry
+
+host = '192.168.20.51' # caenhv1
+systype = 'SY1527'
+linktype = 'TCPIP'
+
+# --- Chamber (A1535 in slot 4, all channels) ---
+CHAMBER_SLOT = 4
+
+# --- T0 (A1535 in slot 8) ---
+T0_SLOT = 8
+PMT_CHANNELS = [
+  0, 1, 2, 3, 4, # UP-PMT 1-5
+  5, 6, 7, 8, 9, # Down-PMT 1-5
+]
+BOOSTER_CHANNELS = [
+  10, 11, 12, # Booster 1 (1-3)
+  13, 14, 15, # Booster 2 (1-3)
+  16, 17, 18, # Booster 3 (1-3)
+]
+
+# --- Ramp-down verification ---
+RAMP_OFF_THRESHOLD_V = 10.0 # A channel counts as off when Pw is 0 and VMon is below this
+RAMP_POLL_FIRST_SEC = 0.1 # First readback interval
+RAMP_POLL_MAX_SEC = 1.0 # Readback interval limit (grows by RAMP_POLL_FACTOR)
+RAMP_POLL_FACTOR = 1.5
+CHAMBER_RAMP_DEADLINE_SEC = 120
+BOOSTER_RAMP_DEADLINE_SEC = 30 # The PMTs are switched off after this even if boosters are still up
+PMT_RAMP_DEADLINE_SEC = 60
+# --- Ramp-up verification (restore) ---
+RAMP_ON_TOLERANCE_V = 10.0 # A channel counts as on when Pw is 1 and VMon is within this of V0Set
+CHAMBER_RAMP_UP_DEADLINE_SEC = 300
+PMT_RAMP_UP_DEADLINE_SEC = 120 # The boosters are only switched on once the PMTs are up
+BOOSTER_RAMP_UP_DEADLINE_SEC = 60
+RAMP_LOG_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "caen_ramp_history.jsonl")
+
+# Bits of the channel 'Status' parameter (shown for channels that did not ramp down)
+STATUS_FLAGS = ["ON", "RUP", "RDWN", "OVC", "OVV", "UNV", "EXTTRIP", "MAXV",
+                "EXTDIS", "INTTRIP", "CALERR", "UNPLUGGED"]
+
+# One set_ch_param call; channels None means every channel of the board
+Stage = namedtuple("Stage", "label slot channels deadline")
+
+GROUPS = {
+  "chamber": [
+    Stage("Chamber", CHAMBER_SLOT, None, CHAMBER_RAMP_DEADLINE_SEC),
+  ],
+  "t0": [
+    Stage("T0 Boosters", T0_SLOT, BOOSTER_CHANNELS, BOOSTER_RAMP_DEADLINE_SEC),
+    Stage("T0 PMTs", T0_SLOT, PMT_CHANNELS, PMT_RAMP_DEADLINE_SEC),
+  ],
+}
+
+# Power restore: the stages of GROUPS in reverse order
+RESTORE_GROUPS = {
+  "chamber": [
+    Stage("Chamber", CHAMBER_SLOT, None, CHAMBER_RAMP_UP_DEADLINE_SEC),
+  ],
+  "t0": [
+    Stage("T0 PMTs", T0_SLOT, PMT_CHANNELS, PMT_RAMP_UP_DEADLINE_SEC),
+    Stage("T0 Boosters", T0_SLOT, BOOSTER_CHANNELS, BOOSTER_RAMP_UP_DEADLINE_SEC),
+  ],
+}
+
+# Outcome of one stage. ramp_times: {channel: seconds from the Pw change to
+# off (or on, at V0Set)}; stuck: {channel: (VMon, Pw, Status)} of channels
+# that did not get there. power is the direction, 'off' or 'on'.
+RampResult = namedtuple("RampResult", "group label slot ramp_times stuck elapsed power", defaults=("off",))
+
+#______________________________________________________________________________
+class RampDownError(Exception):
+  """
+  Raised when channels are still above the threshold at the stage deadline.
+  """
+
+  def __init__(self, results):
+    self.results = results
+    super().__init__("; ".join(describe(r) for r in results if r.stuck))
+
+#______________________________________________________________________________
+class RampUpError(RampDownError):
+  """
+  Raised by restore() when channels did not reach V0Set by the stage
+  deadline; the later stages of the group were not switched on.
+  """
+
+#______________________________________________________________________________
+def status_flags(status):
+  return "|".join(name for bit, name in enumerate(STATUS_FLAGS) if int(status) >> bit & 1) or "OFF"
+
+#______________________________________________________________________________
+def describe(result):
+  """
+  One-line summary of a stage: slowest channel, or the channels still up.
+  """
+  text = f"{result.label} (slot {result.slot}): "
+  if result.stuck:
+    stuck = ", ".join(f"ch{ch} {v:.0f}V {status_flags(st)}" for ch, (v, pw, st) in result.stuck.items())
+    return text + f"{len(result.stuck)}/{len(result.ramp_times) + len(result.stuck)} channels NOT {result.power} after {result.elapsed:.0f}s ({stuck})"
+  if not result.ramp_times:
+    return text + "no channels"
+  slowest = max(result.ramp_times, key=result.ramp_times.get)
+  return text + f"{len(result.ramp_times)} channels {result.power} in {result.elapsed:.1f}s (slowest ch{slowest} {result.ramp_times[slowest]:.1f}s)"
+
+#______________________________________________________________________________
+def channel_times(result):
+  """
+  Per-channel ramp times as compact text ('0:3.2 1:3.4 ...').
+  """
+  return " ".join(f"{ch}:{t:.1f}" for ch, t in sorted(result.ramp_times.items()))
+
+#______________________________________________________________________________
+def record_ramp_times(results, path=RAMP_LOG_PATH):
+  """
+  Append one JSON line per stage to the ramp history file, with the
+  criterion the stage was checked against (off threshold or on tolerance).
+  """
+  now = time.time()
+  with open(path, "a", encoding="utf-8") as f:
+    for r in results:
+      if r.power == "on":
+        criterion = {"tolerance_v": RAMP_ON_TOLERANCE_V}
+      else:
+        criterion = {"threshold_v": RAMP_OFF_THRESHOLD_V}
+      f.write(json.dumps({
+        "time": now, "group": r.group, "stage": r.label, "slot": r.slot, "power": r.power,
+        **criterion, "elapsed": round(r.elapsed, 3),
+        "ramp_times": {str(ch): round(t, 3) for ch, t in r.ramp_times.items()},
+        "stuck": {str(ch): list(v) for ch, v in r.stuck.items()},
+      }) + "\n")
+
+#______________________________________________________________________________
+def open_device():
+  return hv.Device.open(hv.SystemType[systype], hv.LinkType[linktype],
+                        host, 'admin', 'admin')
+
+#______________________________________________________________________________
+class CaenCrate:
+  """
+  Shared session on the crate. The device handle is not thread-safe, so
+  every call holds the crate lock; groups can run from several threads and
+  their readback polls interleave.
+  """
+
+  def __init__(self, device, log=print, history_path=RAMP_LOG_PATH):
+    self.device = device
+    self.log = log
+    self.history_path = history_path
+    self._boards = None
+    self._lock = threading.RLock()
+
+  @classmethod
+  def open(cls, log=print):
+    with telemetry.span("caen.open", host=host):
+      return cls(open_device(), log)
+
+  def boards(self):
+    """
+    {slot: board} of the installed boards (crate map read on first use).
+    """
+    with self._lock:
+      if self._boards is None:
+        with telemetry.span("caen.get_crate_map"):
+          self._boards = {b.slot: b for b in self.device.get_crate_map() if b is not None}
+      return self._boards
+
+  def set_power(self, slot, channels, value):
+    """
+    Set Pw of 'channels' of one slot (all of them if None) in one call.
+    Returns the channel list.
+    """
+    with self._lock:
+      board = self.boards().get(slot)
+      if board is None:
+        raise RuntimeError(f'No board found in slot {slot}')
+      if channels is None:
+        channels = list(range(board.n_channel))
+      with telemetry.span("caen.set_ch_param", slot=slot, channels=len(channels), param='Pw', value=value):
+        self.device.set_ch_param(slot, channels, 'Pw', value)
+      return channels
+
+  def power_off(self, slot, channels=None):
+    return self.set_power(slot, channels, 0)
+
+  def power_on(self, slot, channels=None):
+    return self.set_power(slot, channels, 1)
+
+  def read_channels(self, slot, channels):
+    """
+    Batched readback: lists of VMon, Pw and Status for 'channels'.
+    """
+    with self._lock, telemetry.span("caen.get_ch_param", slot=slot, channels=len(channels),
+                                    param='VMon,Pw,Status'):
+      return (self.device.get_ch_param(slot, channels, 'VMon'),
+              self.device.get_ch_param(slot, channels, 'Pw'),
+              self.device.get_ch_param(slot, channels, 'Status'))
+
+  def read_setpoints(self, slot, channels):
+    with self._lock, telemetry.span("caen.get_ch_param", slot=slot, channels=len(channels), param='V0Set'):
+      return self.device.get_ch_param(slot, channels, 'V0Set')
+
+  def ping(self):
+    """
+    One cheap read (Pw of the first chamber channel) to check the login.
+    """
+    with self._lock, telemetry.span("caen.ping"):
+      self.device.get_ch_param(CHAMBER_SLOT, [0], 'Pw')
+
+  def wait_ramp_down(self, slot, channels, deadline, start=None):
+    """
+    Poll until every channel is off (Pw 0, VMon below the threshold) or
+    'deadline' seconds pass. Returns (ramp_times, stuck) as in RampResult.
+    """
+    return self._wait_channels(slot, channels, deadline, start,
+                               lambda ch, v, p: int(p) == 0 and v < RAMP_OFF_THRESHOLD_V)
+
+  def wait_ramp_up(self, slot, channels, deadline, start=None):
+    """
+    Poll until every channel is on (Pw 1, VMon within RAMP_ON_TOLERANCE_V
+    of its V0Set) or 'deadline' seconds pass. Returns (ramp_times, stuck).
+    """
+    setpoints = dict(zip(channels, self.read_setpoints(slot, channels)))
+    return self._wait_channels(slot, channels, deadline, start,
+                               lambda ch, v, p: int(p) == 1 and abs(v - setpoints[ch]) <= RAMP_ON_TOLERANCE_V)
+
+  def _wait_channels(self, slot, channels, deadline, start, reached):
+    start = time.monotonic() if start is None else start
+    end = start + deadline
+    ramp_times = {}
+    last = {}
+    pending = list(channels)
+    delay = RAMP_POLL_FIRST_SEC
+    while True:
+      vmon, pw, status = self.read_channels(slot, pending)
+      now = time.monotonic()
+      for ch, v, p, st in zip(pending, vmon, pw, status):
+        if reached(ch, v, p):
+          ramp_times[ch] = now - start
+        else:
+          last[ch] = (float(v), int(p), int(st))
+      pending = [ch for ch in pending if ch not in ramp_times]
+      if not pending or now >= end:
+        return ramp_times, {ch: last[ch] for ch in pending}
+      time.sleep(min(delay, end - now))
+      delay = min(delay * RAMP_POLL_FACTOR, RAMP_POLL_MAX_SEC)
+
+  def _run_stages(self, group, stages, power):
+    results = []
+    for stage in stages:
+      start = time.monotonic()
+      started = time.time()
+      if power == "on":
+        channels = self.power_on(stage.slot, stage.channels)
+      else:
+        channels = self.power_off(stage.slot, stage.channels)
+      self.log(f'{stage.slot:02d}.[{channels[0]:04d}-{channels[-1]:04d}] Pw {power.upper()} '
+               f'({stage.label}, {len(channels)} channels)')
+      wait = self.wait_ramp_up if power == "on" else self.wait_ramp_down
+      ramp_times, stuck = wait(stage.slot, channels, stage.deadline, start)
+      result = RampResult(group, stage.label, stage.slot, ramp_times, stuck, time.monotonic() - start, power)
+      telemetry.record_span("caen.stage", started, time.time(), "error" if stuck else "ok",
+                            group=group, stage=stage.label, slot=stage.slot, power=power,
+                            slowest=max(ramp_times.values(), default=None), stuck=sorted(stuck))
+      self.log(describe(result))
+      results.append(result)
+      if stuck and power == "on":
+        break # Do not switch on the next stage (boosters) over channels that are not up
+
+    if self.history_path:
+      try:
+        record_ramp_times(results, self.history_path)
+      except OSError as e:
+        self.log(f'Cannot record ramp times to {self.history_path}: {e}')
+    return results
+
+  def shutdown(self, group):
+    """
+    Run the stages of one group in order, each confirmed by readback before
+    the next starts. Returns a RampResult per stage; raises RampDownError
+    (after every stage was tried) if some channels did not ramp down.
+    """
+    results = self._run_stages(group, GROUPS[group], "off")
+    if any(r.stuck for r in results):
+      raise RampDownError(results)
+    return results
+
+  def restore(self, group):
+    """
+    Switch one group back on, stages in reverse order, each confirmed at
+    V0Set before the next starts. Returns a RampResult per stage; raises
+    RampUpError at the first stage that did not come up.
+    """
+    results = self._run_stages(group, RESTORE_GROUPS[group], "on")
+    if any(r.stuck for r in results):
+      raise RampUpError(results)
+    return results
+
+  def close(self):
+    with self._lock:
+      self.device.close()
+
+#______________________________________________________________________________
+def main():
+  args = sys.argv[1:]
+  restore = bool(args) and args[0] == "--restore"
+  groups = (args[1:] if restore else args) or list(GROUPS)
+  unknown = [g for g in groups if g not in GROUPS]
+  if unknown:
+    print(f"Usage: {sys.argv[0]} [--restore] [{'|'.join(GROUPS)} ...]", file=sys.stderr)
+    sys.exit(1)
+  try:
+    crate = CaenCrate.open()
+    try:
+      for group in groups:
+        if restore:
+          crate.restore(group)
+        else:
+          crate.shutdown(group)
+    finally:
+      crate.close()
+  except hv.Error as e:
+    print(f"\n[CAEN HV Error] {e}", file=sys.stderr)
+    sys.exit(1)
+  except RampDownError as e:
+    print(f"\n[Ramp-{'up' if restore else 'down'} Error] {e}", file=sys.stderr)
+    sys.exit(1)
+
+#______________________________________________________________________________
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Crash-safe checkpoint of the running action sequence.
+
+The state is a small JSON object. Every save writes it to a temporary file
+next to the checkpoint, fsyncs it and renames it over the old one, so a
+crash at any point leaves either the previous or the new state on disk,
+never a partial file. The directory is fsynced too, so the rename itself
+survives a power cut.
+"""
+import json
+import os
+import threading
+import time
+
+FORMAT_VERSION = 1
+
+
+class Checkpoint:
+  """
+  One checkpoint file. save() may be called from several threads.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+
+  def save(self, state):
+    record = dict(state, version=FORMAT_VERSION, saved=time.time(), pid=os.getpid())
+    data = json.dumps(record, indent=1, default=str).encode("utf-8")
+    tmp_path = self.path + ".tmp"
+    with self._lock:
+      fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+      try:
+        os.write(fd, data)
+        os.fsync(fd)
+      finally:
+        os.close(fd)
+      os.replace(tmp_path, self.path)
+      self._sync_directory()
+
+  def _sync_directory(self):
+    try:
+      fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+    except OSError:
+      return
+    try:
+      os.fsync(fd)
+    except OSError:
+      pass # Not supported by every filesystem
+    finally:
+      os.close(fd)
+
+  def load(self):
+    """
+    The saved state, or None if there is no checkpoint. Raises ValueError
+    if the file cannot be parsed or was written by another format version.
+    """
+    try:
+      with open(self.path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    except FileNotFoundError:
+      return None
+    if not isinstance(record, dict) or record.get("version") != FORMAT_VERSION:
+      raise ValueError(f"unsupported checkpoint format in {self.path}")
+    return record
+
+  def clear(self):
+    with self._lock:
+      try:
+        os.remove(self.path)
+      except FileNotFoundError:
+        pass
+      self._sync_directory()
+
+  def discard(self, suffix=".discarded"):
+    """
+    Move the checkpoint aside (kept for inspection) instead of deleting it.
+    """
+    with self._lock:
+      try:
+        os.replace(self.path, self.path + suffix)
+      except FileNotFoundError:
+        pass
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Operator control channel for the Action 4 wait and the power restore.
+
+The monitor listens on a Unix domain socket for one-line commands
+(skip, cancel, extend [minutes], status) and answers each with one JSON
+line as soon as the command is applied. WaitControl wakes the waiting
+thread through a Condition, so a command takes effect immediately instead
+of on the next countdown tick. The old trigger files in /tmp keep working
+through an inotify watch on the directory. The socket server and the
+trigger-file watch both run on the monitor's asyncio event loop.
+
+Usage (client):
+  python control.py status
+  python control.py skip
+  python control.py cancel
+  python control.py extend        # Reset the timer to the full wait
+  python control.py extend 10     # Add 10 minutes
+  python control.py restore       # Power everything back on (refused during an alert)
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from status_watcher import IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO, InotifyWatch, inotify_supported
+
+CONTROL_SOCKET_PATH = "/tmp/lh2-monitor.sock"
+CLIENT_TIMEOUT_SECONDS = 5
+TRIGGER_POLL_SECONDS = 1 # Only used when inotify is unavailable for the trigger directory
+
+COMMANDS = ("skip", "cancel", "extend", "status", "restore")
+
+# Wait outcomes
+SKIP = "skip"
+CANCEL = "cancel"
+
+# 'touch' on a new file gives IN_CREATE/IN_CLOSE_WRITE, on an existing one IN_ATTRIB
+TRIGGER_EVENT_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB
+
+
+class ControlError(Exception):
+  """
+  A command that cannot be applied (e.g. no wait in progress).
+  """
+
+
+class WaitControl:
+  """
+  State of the Action 4 wait, shared between the waiting thread and the
+  control channel. Every change notifies the waiting thread.
+  """
+
+  def __init__(self):
+    self._cond = threading.Condition()
+    self._version = 0
+    self.active = False
+    self.duration = None
+    self.deadline = None # time.time() at which the wait ends
+    self.outcome = None # None, SKIP or CANCEL
+
+  def _changed(self):
+    self._version += 1
+    self._cond.notify_all()
+
+  def begin(self, duration, deadline=None):
+    """
+    Start a wait of 'duration' seconds, or until 'deadline' (time.time())
+    when resuming a wait that began earlier.
+    """
+    with self._cond:
+      self.active = True
+      self.duration = duration
+      self.deadline = time.time() + duration if deadline is None else deadline
+      self.outcome = None
+      self._changed()
+
+  def finish(self):
+    with self._cond:
+      self.active = False
+      self._changed()
+
+  def _require_active(self):
+    if not self.active:
+      raise ControlError("no wait in progress")
+
+  def skip(self):
+    with self._cond:
+      self._require_active()
+      if self.outcome == CANCEL:
+        raise ControlError("wait already canceled")
+      self.outcome = SKIP
+      self._changed()
+
+  def cancel(self):
+    with self._cond:
+      self._require_active()
+      self.outcome = CANCEL
+      self._changed()
+
+  def extend(self, minutes=None):
+    """
+    Add 'minutes' to the deadline, or restart the full wait when None.
+    Returns the new deadline.
+    """
+    with self._cond:
+      self._require_active()
+      if minutes is None:
+        self.deadline = time.time() + self.duration
+      else:
+        self.deadline += minutes * 60
+      self._changed()
+      return self.deadline
+
+  def remaining(self):
+    with self._cond:
+      return max(0.0, self.deadline - time.time()) if self.active else 0.0
+
+  def wait(self, timeout):
+    """
+    Block until the state changes, the deadline passes or 'timeout' seconds
+    pass. Returns the current outcome (None while still waiting normally).
+    """
+    with self._cond:
+      version = self._version
+      timeout = min(timeout, max(0.0, self.deadline - time.time()))
+      self._cond.wait_for(lambda: self._version != version, timeout)
+      return self.outcome
+
+  def status(self):
+    with self._cond:
+      if not self.active:
+        return {"waiting": False}
+      return {
+        "waiting": True,
+        "remaining_seconds": round(max(0.0, self.deadline - time.time()), 1),
+        "deadline": time.ctime(self.deadline),
+        "outcome": self.outcome,
+      }
+
+
+def parse_command(line):
+  """
+  Split a command line into (command, minutes). Raises ControlError.
+  """
+  words = line.split()
+  if not words or words[0].lower() not in COMMANDS:
+    raise ControlError(f"unknown command {line.strip()!r} (expected one of: {', '.join(COMMANDS)})")
+  command = words[0].lower()
+  minutes = None
+  if command == "extend" and len(words) > 1:
+    try:
+      minutes = float(words[1])
+    except ValueError:
+      raise ControlError(f"invalid number of minutes {words[1]!r}")
+    if minutes <= 0:
+      raise ControlError("minutes must be positive")
+  return command, minutes
+
+
+# --- Server side (runs inside the monitor) ---
+
+class ControlServer:
+  """
+  Unix socket server on the running asyncio loop. handle_command(command,
+  minutes, source) is called on the loop, applies a command and returns a
+  dict with at least a 'message' (raise ControlError to reject it).
+  """
+
+  def __init__(self, path, handle_command):
+    self.path = path
+    self.handle_command = handle_command
+    self._server = None
+
+  async def start(self):
+    _remove_stale_socket(self.path)
+    self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+    os.chmod(self.path, 0o660)
+
+  async def _handle(self, reader, writer):
+    try:
+      async for raw in reader:
+        line = raw.decode("utf-8", "replace").strip()
+        if not line:
+          continue
+        try:
+          command, minutes = parse_command(line)
+          reply = {"ok": True, **self.handle_command(command, minutes, "socket")}
+        except ControlError as e:
+          reply = {"ok": False, "message": str(e)}
+        writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+        await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+  def close(self):
+    if self._server is not None:
+      self._server.close()
+    try:
+      os.remove(self.path)
+    except OSError:
+      pass
+
+
+def _remove_stale_socket(path):
+  """
+  Remove a socket left behind by a monitor that exited; refuse to start if
+  another monitor is still listening on it.
+  """
+  if not os.path.exists(path):
+    return
+  probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    probe.connect(path)
+  except OSError:
+    os.remove(path)
+  else:
+    raise OSError(f"another monitor is already listening on {path}")
+  finally:
+    probe.close()
+
+
+class TriggerFileWatcher:
+  """
+  Watch a directory for trigger files and call on_trigger(path) for each
+  one that appears; the file is removed first. Uses inotify (a reader on
+  the running asyncio loop) when possible, otherwise a task that checks
+  the files every TRIGGER_POLL_SECONDS.
+  """
+
+  def __init__(self, paths, on_trigger, log=None):
+    self.paths = list(paths)
+    self.directory = os.path.dirname(self.paths[0])
+    self.on_trigger = on_trigger
+    self.log = log or (lambda text: None)
+    self._inotify = None
+    self.fallback_reason = None
+    ok, reason = inotify_supported(self.directory)
+    if ok:
+      try:
+        self._inotify = InotifyWatch(self.directory, TRIGGER_EVENT_MASK)
+      except OSError as e:
+        reason = str(e)
+    self.fallback_reason = None if self._inotify else reason
+    self._loop = None
+    self._task = None
+
+  @property
+  def backend(self):
+    return "inotify" if self._inotify else "polling"
+
+  def start(self):
+    self._loop = asyncio.get_running_loop()
+    if self._inotify:
+      self._loop.add_reader(self._inotify.fileno(), self._on_events)
+    else:
+      self._task = self._loop.create_task(self._poll())
+
+  def _on_events(self):
+    by_name = {os.path.basename(p): p for p in self.paths}
+    names = self._inotify.read_names()
+    for path in list(by_name.values()) if "" in names else [by_name[n] for n in names if n in by_name]:
+      self._consume(path)
+
+  async def _poll(self):
+    while True:
+      await asyncio.sleep(TRIGGER_POLL_SECONDS)
+      for path in self.paths:
+        self._consume(path)
+
+  def _consume(self, path):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      return # Already handled (one 'touch' gives several events)
+    except OSError as e:
+      self.log(f"Error removing trigger file {path}: {e}")
+    self.on_trigger(path)
+
+  def close(self):
+    if self._task is not None:
+      self._task.cancel()
+    if self._inotify:
+      if self._loop is not None:
+        self._loop.remove_reader(self._inotify.fileno())
+      self._inotify.close()
+      self._inotify = None
+
+
+# --- Client side ---
+
+def send_command(line, path=CONTROL_SOCKET_PATH, timeout=CLIENT_TIMEOUT_SECONDS):
+  """
+  Send one command line to the monitor and return the decoded reply.
+  """
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.settimeout(timeout)
+    sock.connect(path)
+    sock.sendall((line.strip() + "\n").encode("utf-8"))
+    with sock.makefile("r", encoding="utf-8") as f:
+      reply = f.readline()
+  if not reply:
+    raise ConnectionError("monitor closed the connection without a reply")
+  return json.loads(reply)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Control the LH2 monitor's Action 4 wait, or start the power restore.")
+  parser.add_argument("command", choices=COMMANDS)
+  parser.add_argument("minutes", nargs="?", type=float,
+                      help="For 'extend': minutes to add (default: restart the full wait)")
+  parser.add_argument("--socket", default=CONTROL_SOCKET_PATH, help=f"Control socket (default: {CONTROL_SOCKET_PATH})")
+  parser.add_argument("--json", action="store_true", help="Print the raw JSON reply")
+  args = parser.parse_args()
+
+  line = args.command
+  if args.minutes is not None:
+    if args.command != "extend":
+      parser.error("minutes are only accepted with 'extend'")
+    line += f" {args.minutes:g}"
+
+  try:
+    reply = send_command(line, args.socket)
+  except (OSError, ValueError) as e:
+    print(f"Error: cannot reach the monitor on {args.socket}: {e}", file=sys.stderr)
+    sys.exit(2)
+
+  if args.json:
+    print(json.dumps(reply, indent=2))
+  else:
+    print(reply.get("message", ""))
+  sys.exit(0 if reply.get("ok") else 1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+In-place terminal dashboard.
+
+The screen is built from named sections (lists of lines) plus a pane of
+recent log messages. render() moves the cursor with ANSI escape codes and
+rewrites only the lines that changed since the previous frame, so nothing
+flickers and no 'clear' process is started. When the output is not a
+terminal, log messages are printed as plain lines and render() does nothing.
+"""
+import collections
+import re
+import shutil
+import sys
+import threading
+import time
+
+_ANSI_RE = re.compile(r"\033\[[0-9;?]*[A-Za-z]")
+_RESET = "\033[0m"
+
+LOG_LINES = 12 # Log messages kept for the bottom pane
+
+
+def visible_len(text):
+  return len(_ANSI_RE.sub("", text))
+
+
+def truncate(text, width):
+  """
+  Cut 'text' to 'width' visible characters, keeping escape codes intact.
+  """
+  if visible_len(text) <= width:
+    return text
+  out, count, pos = [], 0, 0
+  for match in _ANSI_RE.finditer(text):
+    chunk = text[pos:match.start()]
+    if count + len(chunk) >= width:
+      out.append(chunk[:width - count])
+      return "".join(out) + _RESET
+    out.append(chunk)
+    count += len(chunk)
+    out.append(match.group())
+    pos = match.end()
+  out.append(text[pos:pos + width - count])
+  return "".join(out) + _RESET
+
+
+class Dashboard:
+  """
+  Thread-safe screen made of sections. Sections are drawn in the order they
+  were first set; the log pane fills the rows that are left.
+  """
+
+  def __init__(self, stream=None, log_lines=LOG_LINES):
+    self.stream = stream or sys.stdout
+    self.interactive = self.stream.isatty()
+    self._sections = {}
+    self._log = collections.deque(maxlen=log_lines)
+    self._screen = [] # Lines currently on the terminal
+    self._size = None
+    self._lock = threading.RLock()
+
+  def set_section(self, name, lines):
+    """
+    'lines' is a list of strings, or a callable returning one that is
+    evaluated on every render (for live values such as step states).
+    """
+    with self._lock:
+      self._sections[name] = lines if callable(lines) else list(lines)
+
+  def clear_section(self, name):
+    with self._lock:
+      self._sections.pop(name, None)
+
+  def log(self, text):
+    """
+    Add a message to the log pane (or print it when not on a terminal).
+    """
+    stamped = f"{time.strftime('%H:%M:%S')} {text}"
+    with self._lock:
+      if not self.interactive:
+        self.stream.write(stamped + "\n")
+        self.stream.flush()
+        return
+      self._log.append(stamped)
+    self.render()
+
+  def compose(self, width, height):
+    lines = []
+    for section in self._sections.values():
+      lines.extend(section() if callable(section) else section)
+      lines.append("")
+    log_rows = max(0, height - len(lines) - 1)
+    if log_rows and self._log:
+      lines.append("-" * min(width, 30))
+      lines.extend(list(self._log)[-(log_rows - 1):] if log_rows > 1 else [])
+    return [truncate(line, width) for line in lines[:height]]
+
+  def render(self):
+    """
+    Redraw the lines that changed since the last frame.
+    """
+    if not self.interactive:
+      return
+    with self._lock:
+      size = shutil.get_terminal_size()
+      if size != self._size:
+        self._screen = [] # Terminal resized: redraw everything
+        self._size = size
+      frame = self.compose(size.columns, size.lines)
+      out = []
+      if not self._screen:
+        out.append("\033[H\033[2J") # First frame: start from a blank screen
+      for row, line in enumerate(frame):
+        if row >= len(self._screen) or self._screen[row] != line:
+          out.append(f"\033[{row + 1};1H{line}\033[K")
+      if len(frame) < len(self._screen):
+        out.append(f"\033[{len(frame) + 1};1H\033[J") # Erase leftover rows
+      if out:
+        self.stream.write("".join(out))
+        self.stream.flush()
+      self._screen = frame
+
+  def invalidate(self):
+    """
+    Force a full redraw on the next render (e.g. after a terminal resize).
+    """
+    with self._lock:
+      self._screen = []
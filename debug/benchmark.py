@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+End-to-end time-to-safe benchmark against the simulators (no hardware).
+
+Runs the real monitor loop and action graph in-process with every device
+replaced by its simulator (see simulators.py), flips Alert_H2leak 0 -> 1 in
+a local status file and measures, per run:
+  detection           file write -> action sequence started
+  alert_notification  file write -> initial alert received by the webhook sink
+  step.<name>         duration of each action step
+  time_to_safe        file write -> last pre-wait step (Actions 1-3) finished
+  sequence_total      file write -> whole graph finished (the wait is 0 here)
+  summary_notification file write -> final summary received by the sink
+
+Results are saved as JSON (with the git commit) so runs can be compared:
+  python debug/benchmark.py --runs 10
+  python debug/benchmark.py --runs 10 --hv-latency 0.2 --compare debug/bench_results/<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEBUG_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(DEBUG_DIR)
+RESULTS_DIR = os.path.join(DEBUG_DIR, "bench_results")
+STATUS_TEMPLATE = os.path.join(DEBUG_DIR, "H2tgtPresentStatus.txt")
+
+sys.path.insert(0, REPO_DIR)
+import simulators as sim
+
+RUN_TIMEOUT_SECONDS = 120
+
+
+def git_revision():
+  def git(*args):
+    return subprocess.run(["git", "-C", REPO_DIR, *args], stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, text=True).stdout.strip()
+  commit = git("rev-parse", "--short", "HEAD") or "unknown"
+  dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+  return commit + ("-dirty" if dirty else "")
+
+
+def write_status(path, alert):
+  """
+  Rewrite the status file in place (like the logger) with a fresh Time:
+  header and the given Alert_H2leak value. Returns the write time.
+  """
+  with open(STATUS_TEMPLATE, "r", encoding="utf-8") as f:
+    lines = f.read().splitlines()
+  out = []
+  for line in lines:
+    if line.startswith("Time:"):
+      line = "Time: " + time.strftime("%Y/%m/%d %H:%M:%S")
+    elif line.startswith("Alert_H2leak:"):
+      line = f"Alert_H2leak:\t{alert}"
+    out.append(line)
+  t = time.time()
+  with open(path, "w", encoding="utf-8") as f:
+    f.write("\n".join(out) + "\n")
+  return t
+
+
+def summarize(values):
+  values = sorted(values)
+  if not values:
+    return None
+  p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+  return {"n": len(values), "min": values[0], "median": statistics.median(values),
+          "mean": statistics.fmean(values), "p95": p95, "max": values[-1]}
+
+
+class Bench:
+  """
+  Simulators plus an instrumented monitor, set up once for all runs.
+  """
+
+  def __init__(self, args, workdir):
+    self.args = args
+    self.workdir = workdir
+    self.status_path = os.path.join(workdir, "H2tgtPresentStatus.txt")
+    self.ssh_log = os.path.join(workdir, "uhubctl.log")
+
+    # --- Simulators ---
+    self.sink = sim.WebhookSink(faults=sim.faults_from_args(args, "webhook")).start()
+    self.hv = [sim.HVControllerSim(sim.LOCAL_IP_BASE + o, faults=sim.faults_from_args(args, "hv")).start()
+               for o in ("12", "13")]
+    self.kikusui = [sim.KikusuiSim(sim.LOCAL_IP_BASE + o, faults=sim.faults_from_args(args, "kikusui")).start()
+                    for o in ("42", "45")]
+    sys.path.insert(0, sim.SIM_CAEN_LIBS_DIR)
+    # Device scripts run as subprocesses (watchdog backups) use the fake caen_libs too
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [sim.SIM_CAEN_LIBS_DIR, os.environ.get("PYTHONPATH")]))
+    self.caen = sim.caen_module(sim.faults_from_args(args, "caen"), ramp_rate=args.caen_ramp_rate)
+    os.environ.update(sim.ssh_env(sim.faults_from_args(args, "ssh"), self.ssh_log))
+    os.environ.update(sim.faults_from_args(args, "massflow").to_env("SIM_MASSFLOW"))
+    for name in os.listdir(tempfile.gettempdir()):
+      if name.startswith("sim-ssh-master-"):
+        os.remove(os.path.join(tempfile.gettempdir(), name))
+
+    # --- Monitor, pointed at the simulators ---
+    os.environ["DISCORD_WEBHOOK_URL"] = self.sink.url
+    import monitor
+    import turn_off_hv
+    import toggle_kikusui
+    import caen_shutdown
+    from dashboard import Dashboard
+    from drivers import load_drivers
+    self.monitor = monitor
+    turn_off_hv.IP_BASE = sim.LOCAL_IP_BASE
+    toggle_kikusui.IP_BASE = sim.LOCAL_IP_BASE
+    caen_shutdown.RAMP_LOG_PATH = os.path.join(workdir, "caen_ramp_history.jsonl")
+    caen_shutdown.CaenCrate.__init__.__defaults__ = (print, caen_shutdown.RAMP_LOG_PATH)
+
+    monitor.dashboard = Dashboard(stream=open(os.path.join(workdir, "monitor.log"), "w", encoding="utf-8"))
+    monitor.HISTORY_FILE = os.path.join(workdir, "status_history.ring")
+    monitor.DETECTOR_MODE = "off"
+    monitor.WAIT_TIME_SECONDS = 0
+    monitor.MASSFLOW_IN_SCRIPT_PATH = sim.SIM_MASSFLOW_SCRIPT
+    monitor.MASSFLOW_OUT_SCRIPT_PATH = sim.SIM_MASSFLOW_SCRIPT
+    monitor.CONTROL_SOCKET_PATH = os.path.join(workdir, "control.sock")
+    monitor.TRIGGER_COMMANDS = {os.path.join(workdir, os.path.basename(p)): c
+                                for p, c in monitor.TRIGGER_COMMANDS.items()}
+    monitor.notifier.spool_path = os.path.join(workdir, "discord_spool.jsonl")
+    monitor.sequence_checkpoint.path = os.path.join(workdir, "sequence_checkpoint.json")
+    # Probe the simulators (the fake ssh has no server to connect to: no port, so ping)
+    monitor.HEALTH_TARGETS = [(name, host.replace("192.168.20.", sim.LOCAL_IP_BASE), None if port == 22 else port, steps)
+                              for name, host, port, steps in monitor.HEALTH_TARGETS]
+    monitor.SPAN_LOG_PATH = os.path.join(workdir, "spans.jsonl")
+    monitor.METRICS_TEXTFILE = os.path.join(workdir, "lh2_monitor.prom")
+    self.drivers = load_drivers("inprocess", monitor.HV_SCRIPT_PATH, monitor.KIKUSUI_SCRIPT_PATH,
+                                monitor.CAEN_HV_CHAMBER_SCRIPT_PATH, monitor.CAEN_HV_T0_SCRIPT_PATH)
+    if self.drivers.fallbacks:
+      raise SystemExit(f"In-process drivers unavailable: {self.drivers.fallbacks}")
+
+    # --- Instrumentation ---
+    self.trigger_time = None
+    self.last_run = None
+    self.finished = threading.Event()
+    original_run_actions = monitor.run_actions
+    original_run_graph = monitor.run_graph
+
+    def run_actions(*a, **kw):
+      self.trigger_time = time.time()
+      try:
+        original_run_actions(*a, **kw)
+      finally:
+        self.finished.set()
+
+    def run_graph(*a, **kw):
+      self.last_run = original_run_graph(*a, **kw)
+      return self.last_run
+
+    monitor.run_actions = run_actions
+    monitor.run_graph = run_graph
+
+  def start(self):
+    write_status(self.status_path, 0)
+    self.monitor.notifier.start()
+    coroutine = self.monitor.monitor_status_change(self.status_path, self.monitor.POLLING_INTERVAL, self.drivers)
+    threading.Thread(target=asyncio.run, args=(coroutine,), name="monitor", daemon=True).start()
+    time.sleep(1.0) # Let the monitor read the initial state
+
+  def run_once(self):
+    self.finished.clear()
+    self.last_run = None
+    for s in self.hv + self.kikusui:
+      s.reset()
+    self.caen.reset()
+
+    t_write = write_status(self.status_path, 1)
+    if not self.finished.wait(RUN_TIMEOUT_SECONDS):
+      raise RuntimeError(f"action sequence did not finish within {RUN_TIMEOUT_SECONDS}s")
+    run = self.last_run
+    alert_t = self.sink.wait_for("ALERT: LH2 leak detected", 10, since=t_write)
+    summary_t = self.sink.wait_for("Process", 10, since=t_write)
+
+    pre_wait = [s for s in run.steps if s.name not in ("wait", "kikusui_45") and not s.name.startswith("uhubctl")]
+    metrics = {
+      "detection": self.trigger_time - t_write,
+      "time_to_safe": max(s.end for s in pre_wait if s.end is not None) - t_write,
+      "sequence_total": run.end - t_write,
+    }
+    if alert_t is not None:
+      metrics["alert_notification"] = alert_t - t_write
+    if summary_t is not None:
+      metrics["summary_notification"] = summary_t - t_write
+    for step in run.steps:
+      if step.duration is not None:
+        metrics[f"step.{step.name}"] = step.duration
+    failed = [f"{s.name}: {s.error}" for s in run.failed()]
+
+    # Back to normal before the next run
+    t_reset = write_status(self.status_path, 0)
+    self.sink.wait_for("recovered", 10, since=t_reset)
+    return metrics, failed
+
+  def stop(self):
+    for s in [self.sink] + self.hv + self.kikusui:
+      s.stop()
+
+
+def print_table(summary, previous=None):
+  header = f"{'metric':<28}{'median':>10}{'p95':>10}{'max':>10}"
+  if previous:
+    header += f"{'prev median':>14}{'change':>10}"
+  print(header)
+  for name, stats in summary.items():
+    line = f"{name:<28}{stats['median'] * 1000:>8.1f}ms{stats['p95'] * 1000:>8.1f}ms{stats['max'] * 1000:>8.1f}ms"
+    old = (previous or {}).get(name)
+    if old:
+      change = (stats["median"] - old["median"]) / old["median"] * 100 if old["median"] else 0.0
+      line += f"{old['median'] * 1000:>12.1f}ms{change:>+9.1f}%"
+    print(line)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Time-to-safe benchmark of the shutdown sequence against simulators.")
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--output", help="Result file (default: debug/bench_results/<time>_<commit>.json)")
+  parser.add_argument("--compare", help="Earlier result file to compare the medians with")
+  parser.add_argument("--caen-ramp-rate", type=float, default=1000.0, help="Simulated CAEN ramp-down speed (V/s)")
+  for name in ("hv", "kikusui", "caen", "ssh", "massflow", "webhook"):
+    sim.add_fault_arguments(parser, name)
+  args = parser.parse_args()
+
+  workdir = tempfile.mkdtemp(prefix="lh2-bench-")
+  bench = Bench(args, workdir)
+  revision = git_revision()
+  print(f"Benchmark at {revision}: {args.runs} runs (work files in {workdir})")
+  runs = []
+  try:
+    bench.start()
+    for i in range(args.runs):
+      metrics, failed = bench.run_once()
+      runs.append({"metrics": metrics, "failed": failed})
+      status = f"{len(failed)} failed step(s)" if failed else "ok"
+      print(f"  run {i + 1}/{args.runs}: time_to_safe {metrics['time_to_safe'] * 1000:.1f} ms, "
+            f"detection {metrics['detection'] * 1000:.1f} ms ({status})")
+  finally:
+    bench.stop()
+
+  names = sorted({name for run in runs for name in run["metrics"]},
+                 key=lambda n: (n.startswith("step."), n))
+  summary = {name: summarize([run["metrics"][name] for run in runs if name in run["metrics"]]) for name in names}
+  result = {
+    "commit": revision,
+    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+    "summary": summary,
+    "runs": runs,
+  }
+
+  previous = None
+  if args.compare:
+    with open(args.compare, "r", encoding="utf-8") as f:
+      old = json.load(f)
+    previous = old["summary"]
+    print(f"\nCompared with {old['commit']} ({old['time']}):")
+  print()
+  print_table(summary, previous)
+
+  output = args.output
+  if output is None:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{revision}.json")
+  with open(output, "w", encoding="utf-8") as f:
+    json.dump(result, f, indent=2)
+  print(f"\nSaved {output}")
+  shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  main()
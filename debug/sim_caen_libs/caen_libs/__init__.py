@@ -0,0 +1,3 @@
+"""
+Simulated caen_libs package (see debug/simulators.py).
+"""
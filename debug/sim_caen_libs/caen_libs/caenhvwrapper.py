@@ -0,0 +1,166 @@
+"""
+Simulated caen_libs.caenhvwrapper: an SY1527 with A1535 boards in slots 4
+and 8. Channels start at their operating voltage (V0Set), ramp down at
+RAMP_RATE_V_PER_S after Pw is set to 0 and back up at the same rate after
+Pw is set to 1. Module settings:
+
+  FAULTS            : object with decide() -> 'ok' / 'error' / 'hang' and a
+                      hang_seconds attribute (simulators.Faults), applied to
+                      every library call; None for no faults
+  RAMP_RATE_V_PER_S : ramp-down speed
+  STUCK_CHANNELS    : {(slot, channel)} that never ramp down (or up)
+  CALLS             : log of (time, call, slot, n_channels, param)
+
+Channel states belong to the crate, not to a login: they survive close()
+and a new Device.open(), until reset().
+"""
+import threading
+import time
+from collections import namedtuple
+from enum import Enum
+
+SIMULATED = True
+
+FAULTS = None
+RAMP_RATE_V_PER_S = 200.0
+STUCK_CHANNELS = set()
+CALLS = []
+
+# slot: (model, channels, operating voltage)
+CRATE = {
+  4: ("A1535", 48, 1500.0),
+  8: ("A1535", 24, 1200.0),
+}
+N_SLOTS = 16
+
+# Crate state shared by every Device (login)
+_lock = threading.Lock()
+_off_since = {} # (slot, ch) -> (time Pw was set to 0, VMon then)
+_on_since = {} # (slot, ch) -> (time Pw was set to 1 again, VMon then)
+
+STATUS_ON = 1 << 0
+STATUS_RUP = 1 << 1
+STATUS_RDWN = 1 << 2
+
+
+class Error(Exception):
+  pass
+
+
+class SystemType(Enum):
+  SY1527 = 0
+  SY2527 = 1
+  SY4527 = 2
+  SY5527 = 3
+
+
+class LinkType(Enum):
+  TCPIP = 0
+  RS232 = 1
+
+
+Board = namedtuple("Board", "slot model description serial_number fw_release n_channel")
+
+
+def reset():
+  """
+  Every channel back on at its operating voltage.
+  """
+  with _lock:
+    _off_since.clear()
+    _on_since.clear()
+
+
+def _call(name, slot=None, channels=(), param=None):
+  CALLS.append((time.time(), name, slot, len(channels), param))
+  if FAULTS is None:
+    return
+  outcome = FAULTS.decide()
+  if outcome == "hang":
+    time.sleep(FAULTS.hang_seconds)
+    raise Error(f"{name}: communication timeout (simulated)")
+  if outcome == "error":
+    raise Error(f"{name}: communication error (simulated)")
+
+
+class Device:
+
+  def __init__(self):
+    self.closed = False
+
+  @classmethod
+  def open(cls, system_type, link_type, arg, username="", password=""):
+    _call("open")
+    return cls()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    _call("close")
+    self.closed = True
+
+  def _check_open(self):
+    if self.closed:
+      raise Error("device closed")
+
+  def get_crate_map(self):
+    self._check_open()
+    _call("get_crate_map")
+    return [Board(slot, *CRATE[slot][:1], "simulated", 0, "1.0", CRATE[slot][1]) if slot in CRATE else None
+            for slot in range(N_SLOTS)]
+
+  def _vmon(self, slot, ch, now):
+    v0 = CRATE[slot][2]
+    off = _off_since.get((slot, ch))
+    if off is not None and (slot, ch) not in STUCK_CHANNELS:
+      return max(0.0, off[1] - RAMP_RATE_V_PER_S * (now - off[0]))
+    on = _on_since.get((slot, ch))
+    if on is not None and (slot, ch) not in STUCK_CHANNELS:
+      return min(v0, on[1] + RAMP_RATE_V_PER_S * (now - on[0]))
+    return v0
+
+  def set_ch_param(self, slot, channels, param, value):
+    self._check_open()
+    channels = list(channels)
+    _call("set_ch_param", slot, channels, param)
+    if slot not in CRATE:
+      raise Error(f"no board in slot {slot}")
+    with _lock:
+      if param == "Pw":
+        now = time.monotonic()
+        for ch in channels:
+          key = (slot, ch)
+          if value and key in _off_since:
+            _on_since[key] = (now, self._vmon(slot, ch, now))
+            del _off_since[key]
+          elif not value and key not in _off_since:
+            _off_since[key] = (now, self._vmon(slot, ch, now))
+            _on_since.pop(key, None)
+
+  def get_ch_param(self, slot, channels, param):
+    self._check_open()
+    channels = list(channels)
+    _call("get_ch_param", slot, channels, param)
+    if slot not in CRATE:
+      raise Error(f"no board in slot {slot}")
+    now = time.monotonic()
+    with _lock:
+      if param == "VMon":
+        return [self._vmon(slot, ch, now) for ch in channels]
+      if param == "V0Set":
+        return [CRATE[slot][2] for ch in channels]
+      if param == "Pw":
+        return [0 if (slot, ch) in _off_since else 1 for ch in channels]
+      if param == "Status":
+        status = []
+        for ch in channels:
+          v = self._vmon(slot, ch, now)
+          off = (slot, ch) in _off_since
+          status.append((STATUS_RDWN if v > 0 else 0) if off else
+                        (STATUS_ON | (STATUS_RUP if v < CRATE[slot][2] else 0)))
+        return status
+    raise Error(f"unknown parameter {param}")
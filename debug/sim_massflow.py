@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the mass-flow controller scripts (see debug/simulators.py).
+Faults come from SIM_MASSFLOW_* variables; 'error' exits 1, 'hang' sleeps.
+"""
+import os
+import random
+import sys
+import time
+
+
+def env_float(name, default=0.0):
+  return float(os.environ.get(name, default))
+
+
+time.sleep(env_float("SIM_MASSFLOW_LATENCY") + random.uniform(0, env_float("SIM_MASSFLOW_JITTER")))
+r = random.random()
+if r < env_float("SIM_MASSFLOW_HANG_RATE"):
+  time.sleep(env_float("SIM_MASSFLOW_HANG_SECONDS", 60))
+if r < env_float("SIM_MASSFLOW_HANG_RATE") + env_float("SIM_MASSFLOW_ERROR_RATE"):
+  print("Simulated mass-flow controller error", file=sys.stderr)
+  sys.exit(1)
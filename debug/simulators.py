@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the hardware touched by the shutdown sequence.
+
+  HVControllerSim : HTTP API of the raspi HV controllers (POST /serial/command)
+  KikusuiSim      : SCPI server of a Kikusui supply (TCP, port 5025)
+  WebhookSink     : Discord webhook endpoint that records every post
+  sim_caen_libs/  : fake caen_libs.caenhvwrapper (put it first on sys.path)
+  sim_bin/        : fake 'ssh' and 'sudo' for the uhubctl path (put it first on PATH)
+  sim_massflow.py : stand-in for the mass-flow controller scripts
+
+Every simulator takes a Faults object: fixed latency plus jitter, and the
+fraction of requests that fail or hang. The servers bind to 127.0.0.x, so
+each device keeps its real port and last octet (set IP_BASE to "127.0.0.").
+
+Usage (run the simulators by hand, e.g. to try the CLI scripts):
+  python debug/simulators.py --hv-latency 0.05 --kikusui-error-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEBUG_DIR = os.path.dirname(os.path.realpath(__file__))
+SIM_CAEN_LIBS_DIR = os.path.join(DEBUG_DIR, "sim_caen_libs")
+SIM_BIN_DIR = os.path.join(DEBUG_DIR, "sim_bin")
+SIM_MASSFLOW_SCRIPT = os.path.join(DEBUG_DIR, "sim_massflow.py")
+
+LOCAL_IP_BASE = "127.0.0."
+
+# Outcomes of Faults.decide()
+OK = "ok"
+ERROR = "error"
+HANG = "hang"
+
+
+class Faults:
+  """
+  Fault model of one simulator. latency (+ uniform jitter) is added to every
+  request; error_rate and hang_rate are the fractions of requests that fail
+  or never get an answer (held for hang_seconds).
+  """
+
+  def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, hang_rate=0.0, hang_seconds=60.0):
+    self.latency = latency
+    self.jitter = jitter
+    self.error_rate = error_rate
+    self.hang_rate = hang_rate
+    self.hang_seconds = hang_seconds
+
+  def decide(self):
+    """
+    Sleep for the latency, then return OK, ERROR or HANG.
+    """
+    delay = self.latency + random.uniform(0, self.jitter)
+    if delay > 0:
+      time.sleep(delay)
+    r = random.random()
+    if r < self.hang_rate:
+      return HANG
+    if r < self.hang_rate + self.error_rate:
+      return ERROR
+    return OK
+
+  def to_env(self, prefix):
+    """
+    Environment variables for the script-based simulators (fake ssh, mass flow).
+    """
+    return {f"{prefix}_{name.upper()}": str(value) for name, value in vars(self).items()}
+
+  @classmethod
+  def from_env(cls, prefix, environ=os.environ):
+    kwargs = {}
+    for name in ("latency", "jitter", "error_rate", "hang_rate", "hang_seconds"):
+      value = environ.get(f"{prefix}_{name.upper()}")
+      if value is not None:
+        kwargs[name] = float(value)
+    return cls(**kwargs)
+
+  def __repr__(self):
+    return "Faults(" + ", ".join(f"{k}={v}" for k, v in vars(self).items()) + ")"
+
+
+class _Server:
+  """
+  Common start/stop for the threaded servers below.
+  """
+  server = None
+
+  def start(self):
+    self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.2},
+                                    name=type(self).__name__, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+# --- HV controller (HTTP) ---
+
+class _HVHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1" # Keep-alive, like the real controller
+
+  def log_message(self, fmt, *args):
+    pass
+
+  def _reply(self, code, body):
+    data = json.dumps(body).encode("utf-8")
+    self.send_response(code)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_POST(self):
+    sim = self.server.sim
+    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+    if self.path != "/serial/command":
+      self._reply(404, {"error": "not found"})
+      return
+    outcome = sim.faults.decide()
+    sim.record(payload, outcome)
+    if outcome == HANG:
+      time.sleep(sim.faults.hang_seconds)
+      self.close_connection = True
+      return
+    if outcome == ERROR:
+      self._reply(500, {"error": "simulated serial failure"})
+      return
+    if payload.get("command_type") in ("TURN_OFF", "TURN_ON"):
+      sim.port_state[payload.get("port_id")] = payload["command_type"][5:].lower()
+    self._reply(200, {"status": "ok", "port_id": payload.get("port_id")})
+
+
+class HVControllerSim(_Server):
+  """
+  One HV controller. commands holds (time, payload, outcome) of every request.
+  """
+
+  def __init__(self, ip, port=8000, faults=None):
+    self.ip = ip
+    self.port = port
+    self.faults = faults or Faults()
+    self.commands = []
+    self.port_state = {}
+    self._lock = threading.Lock()
+    self.server = ThreadingHTTPServer((ip, port), _HVHandler)
+    self.server.daemon_threads = True
+    self.server.sim = self
+
+  def record(self, payload, outcome):
+    with self._lock:
+      self.commands.append((time.time(), payload, outcome))
+
+  def reset(self):
+    with self._lock:
+      self.commands.clear()
+      self.port_state.clear()
+
+
+# --- Kikusui supply (SCPI over TCP) ---
+
+class _ScpiHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    sim = self.server.sim
+    for raw in self.rfile:
+      line = raw.decode("ascii", "replace").strip()
+      if not line:
+        continue
+      outcome = sim.faults.decide()
+      sim.record(line, outcome)
+      if outcome == HANG:
+        time.sleep(sim.faults.hang_seconds)
+        return
+      reply = sim.execute(line, outcome == ERROR)
+      if reply is not None:
+        self.wfile.write((reply + "\n").encode("ascii"))
+        self.wfile.flush()
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+  allow_reuse_address = True
+  daemon_threads = True
+
+
+class KikusuiSim(_Server):
+  """
+  One supply: OUTP, VOLT, MEAS:VOLT?/CURR?, *OPC?, SYST:ERR? and an error
+  queue. A simulated error puts -200 'Execution error' on the queue instead
+  of executing the command.
+  """
+
+  def __init__(self, ip, port=5025, faults=None, load_ohms=40.0):
+    self.ip = ip
+    self.port = port
+    self.faults = faults or Faults()
+    self.load_ohms = load_ohms
+    self.commands = []
+    self.output_on = False
+    self.voltage = 0.0
+    self.errors = []
+    self._lock = threading.Lock()
+    self.server = _ThreadingTCPServer((ip, port), _ScpiHandler)
+    self.server.sim = self
+
+  def record(self, line, outcome):
+    with self._lock:
+      self.commands.append((time.time(), line, outcome))
+
+  def reset(self):
+    with self._lock:
+      self.commands.clear()
+      self.errors.clear()
+
+  def execute(self, line, fail):
+    with self._lock:
+      command = line.upper()
+      if command == "SYST:ERR?":
+        return self.errors.pop(0) if self.errors else '0,"No error"'
+      if fail:
+        self.errors.append('-200,"Execution error"')
+        return "1" if command == "*OPC?" else ("0" if command.endswith("?") else None)
+      if command == "*OPC?":
+        return "1"
+      if command == "OUTP?":
+        return "1" if self.output_on else "0"
+      if command == "MEAS:VOLT?":
+        return f"{self.voltage if self.output_on else 0.0:.3f}"
+      if command == "MEAS:CURR?":
+        return f"{self.voltage / self.load_ohms if self.output_on else 0.0:.4f}"
+      if command in ("OUTP ON", "OUTP 1"):
+        self.output_on = True
+      elif command in ("OUTP OFF", "OUTP 0"):
+        self.output_on = False
+      elif command.startswith("VOLT "):
+        self.voltage = float(command.split()[1])
+      else:
+        self.errors.append('-113,"Undefined header"')
+      return None
+
+
+# --- Discord webhook ---
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+
+  def log_message(self, fmt, *args):
+    pass
+
+  def do_POST(self):
+    sim = self.server.sim
+    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+    outcome = sim.faults.decide()
+    if outcome == HANG:
+      time.sleep(sim.faults.hang_seconds)
+      self.close_connection = True
+      return
+    if outcome == ERROR:
+      code, reply = sim.error_status, {"message": "simulated error"}
+      if code == 429:
+        reply["retry_after"] = sim.retry_after
+    else:
+      sim.record(body)
+      code, reply = 204, None
+    data = b"" if reply is None else json.dumps(reply).encode("utf-8")
+    self.send_response(code)
+    self.send_header("Content-Length", str(len(data)))
+    if data:
+      self.send_header("Content-Type", "application/json")
+    self.end_headers()
+    self.wfile.write(data)
+
+
+class WebhookSink(_Server):
+  """
+  Records (time, content) of every delivered message. Failures answer with
+  error_status (429 adds retry_after, like Discord's rate limit).
+  """
+
+  def __init__(self, ip="127.0.0.1", port=0, faults=None, error_status=500, retry_after=0.5):
+    self.faults = faults or Faults()
+    self.error_status = error_status
+    self.retry_after = retry_after
+    self.messages = []
+    self._cond = threading.Condition()
+    self.server = ThreadingHTTPServer((ip, port), _WebhookHandler)
+    self.server.daemon_threads = True
+    self.server.sim = self
+
+  @property
+  def url(self):
+    host, port = self.server.server_address[:2]
+    return f"http://{host}:{port}/webhook"
+
+  def record(self, body):
+    with self._cond:
+      self.messages.append((time.time(), body.get("content", "")))
+      self._cond.notify_all()
+
+  def wait_for(self, text, timeout, since=0.0):
+    """
+    Return the time the first message containing 'text' (received after
+    'since') arrived, or None after 'timeout' seconds.
+    """
+    def find():
+      return next((t for t, content in self.messages if t >= since and text in content), None)
+    with self._cond:
+      self._cond.wait_for(lambda: find() is not None, timeout)
+      return find()
+
+  def reset(self):
+    with self._cond:
+      self.messages.clear()
+
+
+# --- Script-based simulators (fake ssh/sudo, mass flow) ---
+
+def ssh_env(faults, log_path):
+  """
+  Environment for the fake ssh in sim_bin/: its faults and the file the
+  fake sudo appends the uhubctl calls to.
+  """
+  env = faults.to_env("SIM_SSH")
+  env["SIM_SSH_LOG"] = log_path
+  env["PATH"] = SIM_BIN_DIR + os.pathsep + os.environ.get("PATH", "")
+  return env
+
+
+def caen_module(faults=None, ramp_rate=None, stuck=None):
+  """
+  Import the fake caenhvwrapper (sim_caen_libs must be on sys.path) and
+  configure it.
+  """
+  from caen_libs import caenhvwrapper as hv
+  if not getattr(hv, "SIMULATED", False):
+    raise ImportError("the real caen_libs was imported; put debug/sim_caen_libs first on sys.path")
+  if faults is not None:
+    hv.FAULTS = faults
+  if ramp_rate is not None:
+    hv.RAMP_RATE_V_PER_S = ramp_rate
+  if stuck is not None:
+    hv.STUCK_CHANNELS = set(stuck)
+  return hv
+
+
+def add_fault_arguments(parser, name, flag=None):
+  flag = flag or name
+  parser.add_argument(f"--{flag}-latency", type=float, default=0.0, help=f"{name}: added latency (s)")
+  parser.add_argument(f"--{flag}-jitter", type=float, default=0.0, help=f"{name}: extra uniform jitter (s)")
+  parser.add_argument(f"--{flag}-error-rate", type=float, default=0.0, help=f"{name}: fraction of failed requests")
+  parser.add_argument(f"--{flag}-hang-rate", type=float, default=0.0, help=f"{name}: fraction of hanging requests")
+
+
+def faults_from_args(args, flag):
+  prefix = flag.replace("-", "_")
+  return Faults(latency=getattr(args, f"{prefix}_latency"), jitter=getattr(args, f"{prefix}_jitter"),
+                error_rate=getattr(args, f"{prefix}_error_rate"), hang_rate=getattr(args, f"{prefix}_hang_rate"))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Run the HV, Kikusui and webhook simulators until Ctrl+C.")
+  parser.add_argument("--hv", default="12,13", help="HV controller octets (127.0.0.x:8000)")
+  parser.add_argument("--kikusui", default="42,45", help="Kikusui octets (127.0.0.x:5025)")
+  parser.add_argument("--webhook-port", type=int, default=8099)
+  for flag in ("hv", "kikusui", "webhook"):
+    add_fault_arguments(parser, flag)
+  args = parser.parse_args()
+
+  servers = [HVControllerSim(LOCAL_IP_BASE + o, faults=faults_from_args(args, "hv")) for o in args.hv.split(",")]
+  servers += [KikusuiSim(LOCAL_IP_BASE + o, faults=faults_from_args(args, "kikusui")) for o in args.kikusui.split(",")]
+  sink = WebhookSink(port=args.webhook_port, faults=faults_from_args(args, "webhook"))
+  servers.append(sink)
+  for server in servers:
+    server.start()
+  print("HV controllers: " + ", ".join(f"{LOCAL_IP_BASE}{o}:8000" for o in args.hv.split(",")))
+  print("Kikusui:        " + ", ".join(f"{LOCAL_IP_BASE}{o}:5025" for o in args.kikusui.split(",")))
+  print(f"Webhook:        {sink.url}")
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    for server in servers:
+      server.stop()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Device drivers used by the shutdown sequence.
+
+In-process drivers import the device modules (turn_off_hv, toggle_kikusui,
+caen_shutdown) once at monitor startup and call their functions
+directly, so no interpreter start-up or library import sits on the alert
+path. Subprocess drivers run the same scripts with 'python3' as before;
+they are used when DRIVER_MODE is 'subprocess', or as a fallback when a
+script's libraries (requests, caen_libs) cannot be imported.
+
+The step methods take timeout=, the time the calling step has left: a
+subprocess driver kills its script after it, so no child outlives its
+step (and meets the watchdog's backup). In-process calls cannot be killed
+and ignore it; the device modules enforce their own deadlines.
+"""
+import os
+import subprocess
+import threading
+
+INPROCESS = "inprocess"
+SUBPROCESS = "subprocess"
+
+
+# Upper bound for a device script run without a step timeout
+SCRIPT_TIMEOUT_SECONDS = 300
+
+# Engine behind the CAEN group scripts; also runs the power restore
+CAEN_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "caen_shutdown.py")
+
+
+def run_script(args, timeout=None, **kwargs):
+  """
+  Run a Python script in a new interpreter (raises on non-zero exit, and
+  kills it after 'timeout' seconds, SCRIPT_TIMEOUT_SECONDS if None).
+  """
+  timeout = SCRIPT_TIMEOUT_SECONDS if timeout is None else timeout
+  return subprocess.run(["python3", *args], check=True, timeout=timeout, **kwargs)
+
+
+# --- HV controllers (raspi, HTTP API) ---
+
+class HVControllerDriver:
+  mode = INPROCESS
+
+  def __init__(self):
+    import turn_off_hv
+    self._hv = turn_off_hv
+
+  def turn_off_ports(self, ip_last, ports, timeout=None):
+    """
+    Turn off all 'ports' of one controller concurrently over its pooled session.
+    Returns the per-port results; raises HVCommandError if any port failed.
+    Nothing is printed: retries and errors are in the results.
+    """
+    results = self._hv.turn_off_ports(str(ip_last), ports, verbose=False)
+    if not all(r.ok for r in results):
+      raise self._hv.HVCommandError(results)
+    return results
+
+  def turn_on_ports(self, ip_last, ports, timeout=None):
+    """
+    Power restore: turn 'ports' back on; raises HVCommandError if any failed.
+    """
+    results = self._hv.turn_on_ports(str(ip_last), ports, verbose=False)
+    if not all(r.ok for r in results):
+      raise self._hv.HVCommandError(results)
+    return results
+
+
+class SubprocessHVControllerDriver:
+  mode = SUBPROCESS
+
+  def __init__(self, script_path):
+    self.script_path = script_path
+
+  def turn_off_ports(self, ip_last, ports, timeout=None):
+    run_script([self.script_path, "--ip_last", str(ip_last), "--port", *[str(p) for p in ports]], timeout)
+
+  def turn_on_ports(self, ip_last, ports, timeout=None):
+    run_script([self.script_path, "--ip_last", str(ip_last), "--port", *[str(p) for p in ports], "--on"], timeout)
+
+
+# --- Kikusui power supplies (SCPI) ---
+
+class KikusuiDriver:
+  mode = INPROCESS
+
+  def __init__(self):
+    import toggle_kikusui
+    self._kikusui = toggle_kikusui
+
+  def on(self, ip_last, timeout=None):
+    self._kikusui.power_on(self._kikusui.ip_from_octet(ip_last))
+
+  def off(self, ip_last, timeout=None):
+    self._kikusui.power_off(self._kikusui.ip_from_octet(ip_last))
+
+  def status(self, ip_last, timeout=None):
+    """
+    Return SupplyStatus(output_on, voltage, current) with measured values.
+    """
+    return self._kikusui.read_status(self._kikusui.ip_from_octet(ip_last))
+
+  def warm(self, ip_lasts):
+    """
+    Open the persistent SCPI connections ahead of an alert.
+    """
+    self._kikusui.for_each_supply(map(self._kikusui.ip_from_octet, ip_lasts),
+                                  lambda ip: self._kikusui.get_client(ip).query("*IDN?"))
+
+
+class SubprocessKikusuiDriver:
+  mode = SUBPROCESS
+
+  def __init__(self, script_path):
+    self.script_path = script_path
+
+  def on(self, ip_last, timeout=None):
+    run_script([self.script_path, str(ip_last), "on"], timeout)
+
+  def off(self, ip_last, timeout=None):
+    run_script([self.script_path, str(ip_last), "off"], timeout)
+
+  def status(self, ip_last, timeout=None):
+    """
+    Run the status query and parse the printed values into (output_on, voltage, current).
+    """
+    output = run_script([self.script_path, str(ip_last)], timeout, stdout=subprocess.PIPE, text=True).stdout
+    values = dict(line.strip().split(": ", 1) for line in output.splitlines() if ": " in line)
+    return (values["Output"] == "ON", float(values["Measured Voltage"].split()[0]),
+            float(values["Measured Current"].split()[0]))
+
+
+# --- CAEN SY1527 crate ---
+
+class CaenDriver:
+  """
+  Both groups (chamber, T0) run on one shared login to the crate, opened on
+  first use and kept until close(); the crate map is read once per login.
+  The groups may run at the same time: CaenCrate serializes the device
+  calls, so their ramp-down readbacks interleave on the one session.
+  Each shutdown returns the per-stage RampResults; channels that did not
+  ramp down raise caen_shutdown.RampDownError (which carries them too).
+  A crate error (hv.Error) drops the login, so the next call logs in again.
+  """
+  mode = INPROCESS
+
+  def __init__(self):
+    import caen_shutdown
+    self._caen = caen_shutdown
+    self._crate = None
+    self._lock = threading.Lock()
+
+  def _session(self):
+    with self._lock:
+      if self._crate is None:
+        self._crate = self._caen.CaenCrate.open(log=lambda text: None)
+      return self._crate
+
+  def _call(self, method, group):
+    crate = self._session()
+    try:
+      return getattr(crate, method)(group)
+    except self._caen.hv.Error:
+      # Log in again on the next call instead of reusing a broken login
+      self._drop(crate)
+      raise
+
+  def _drop(self, crate):
+    """
+    Forget and close 'crate' if it is still the shared login (another group
+    may have replaced it already).
+    """
+    with self._lock:
+      if self._crate is not crate:
+        return
+      self._crate = None
+    self._close_crate(crate)
+
+  def _close_crate(self, crate):
+    if crate is not None:
+      try:
+        crate.close()
+      except self._caen.hv.Error:
+        pass
+
+  def warm(self):
+    """
+    Log in to the crate ahead of an alert (kept until close()).
+    """
+    try:
+      self._session()
+    except self._caen.hv.Error:
+      pass # The shutdown steps log in again and report the error
+
+  def probe(self):
+    """
+    Reachability probe of the crate service: a read over the shared login
+    if one is open, otherwise a login that is closed again at once.
+    """
+    with self._lock:
+      crate = self._crate
+    if crate is None:
+      self._close_crate(self._caen.CaenCrate.open(log=lambda text: None))
+      return
+    try:
+      crate.ping()
+    except self._caen.hv.Error:
+      self._drop(crate)
+      raise
+
+  def shutdown_chamber(self, timeout=None):
+    return self._call("shutdown", "chamber")
+
+  def shutdown_t0(self, timeout=None):
+    return self._call("shutdown", "t0")
+
+  def restore_chamber(self, timeout=None):
+    return self._call("restore", "chamber")
+
+  def restore_t0(self, timeout=None):
+    return self._call("restore", "t0")
+
+  def close(self):
+    # Closing waits for a running crate call; the next shutdown logs in anew meanwhile
+    with self._lock:
+      crate, self._crate = self._crate, None
+    self._close_crate(crate)
+
+
+class SubprocessCaenDriver:
+  mode = SUBPROCESS
+
+  def __init__(self, chamber_script_path, t0_script_path):
+    self.chamber_script_path = chamber_script_path
+    self.t0_script_path = t0_script_path
+
+  def shutdown_chamber(self, timeout=None):
+    run_script([self.chamber_script_path], timeout)
+
+  def shutdown_t0(self, timeout=None):
+    run_script([self.t0_script_path], timeout)
+
+  def restore_chamber(self, timeout=None):
+    run_script([CAEN_SCRIPT_PATH, "--restore", "chamber"], timeout)
+
+  def restore_t0(self, timeout=None):
+    run_script([CAEN_SCRIPT_PATH, "--restore", "t0"], timeout)
+
+
+class Drivers:
+  """
+  The set of drivers used by the action graph.
+  fallbacks maps a driver name to the reason it runs as a subprocess
+  although in-process mode was requested.
+  """
+
+  def __init__(self, hv, kikusui, caen, fallbacks=None):
+    self.hv = hv
+    self.kikusui = kikusui
+    self.caen = caen
+    self.fallbacks = fallbacks or {}
+
+  def describe(self):
+    return ", ".join(f"{name}: {getattr(self, name).mode}" for name in ("hv", "kikusui", "caen"))
+
+  def warm(self, kikusui_ip_lasts=()):
+    """
+    Open the in-process drivers' connections ahead of an alert.
+    """
+    if hasattr(self.kikusui, "warm"):
+      self.kikusui.warm(kikusui_ip_lasts)
+    if hasattr(self.caen, "warm"):
+      self.caen.warm()
+
+  def close(self):
+    """
+    Release sessions held between calls (the CAEN login).
+    """
+    for name in ("hv", "kikusui", "caen"):
+      close = getattr(getattr(self, name), "close", None)
+      if close is not None:
+        close()
+
+
+def load_drivers(mode, hv_script, kikusui_script, caen_chamber_script, caen_t0_script):
+  """
+  Build the drivers once. In 'inprocess' mode each driver whose imports
+  fail falls back to its subprocess variant.
+  """
+  if mode not in (INPROCESS, SUBPROCESS):
+    raise ValueError(f"Unknown driver mode '{mode}' (expected '{INPROCESS}' or '{SUBPROCESS}')")
+
+  candidates = {
+    "hv": (HVControllerDriver, lambda: SubprocessHVControllerDriver(hv_script)),
+    "kikusui": (KikusuiDriver, lambda: SubprocessKikusuiDriver(kikusui_script)),
+    "caen": (CaenDriver, lambda: SubprocessCaenDriver(caen_chamber_script, caen_t0_script)),
+  }
+  loaded = {}
+  fallbacks = {}
+  for name, (inprocess_cls, make_subprocess) in candidates.items():
+    if mode == INPROCESS:
+      try:
+        loaded[name] = inprocess_cls()
+        continue
+      except ImportError as e:
+        fallbacks[name] = str(e)
+    loaded[name] = make_subprocess()
+  return Drivers(fallbacks=fallbacks, **loaded)
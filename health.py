@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Background reachability prober for the shutdown targets.
+
+Every target (HV controllers, Kikusui supplies, the CAEN crate, the Pis)
+is checked every 'interval' seconds with a cheap probe: a TCP connect to
+its service port, an ICMP ping when no port is given, or a custom probe
+(e.g. a query over an already open connection). The latest result of each
+target is kept in a cache that the dashboard and the action scheduler
+read without waiting on the network.
+"""
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+UP = "up"
+DOWN = "down"
+UNKNOWN = "unknown"
+
+# Rank used to order steps: reachable targets first, known-down last
+STATE_RANK = {UP: 0, UNKNOWN: 1, DOWN: 2}
+
+# 'probe', if given, is called without arguments and raises when the target is down
+Target = namedtuple("Target", "name host port steps probe")
+Target.__new__.__defaults__ = ((), None)
+
+# Latest outcome for one target; 'changed' is when the state last changed
+ProbeResult = namedtuple("ProbeResult", "state latency error checked changed")
+
+
+class ProbeUnavailable(Exception):
+  """
+  The probe cannot run on this machine (e.g. no 'ping' binary).
+  """
+
+
+def tcp_probe(host, port, timeout):
+  with socket.create_connection((host, port), timeout=timeout):
+    pass
+
+
+def ping_probe(host, timeout):
+  if shutil.which("ping") is None:
+    raise ProbeUnavailable("ping not installed")
+  result = subprocess.run(["ping", "-c", "1", "-W", str(max(1, round(timeout))), host],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout + 2)
+  if result.returncode != 0:
+    raise OSError(result.stderr.strip() or "no reply to ping")
+
+
+class HealthProber:
+  """
+  Probe all targets in parallel every 'interval' seconds from a background
+  thread. on_result(target, result), if given, is called after each probe.
+  """
+
+  def __init__(self, targets, interval=10.0, timeout=1.0, on_result=None):
+    self.targets = list(targets)
+    self.interval = interval
+    self.timeout = timeout
+    self.on_result = on_result or (lambda target, result: None)
+    self._results = {t.name: ProbeResult(UNKNOWN, None, None, None, None) for t in self.targets}
+    self._lock = threading.Lock()
+    self._wake = threading.Event()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def _probe(self, target):
+    start = time.monotonic()
+    try:
+      if target.probe is not None:
+        target.probe()
+      elif target.port is None:
+        ping_probe(target.host, self.timeout)
+      else:
+        tcp_probe(target.host, target.port, self.timeout)
+      state, error = UP, None
+    except ProbeUnavailable as e:
+      state, error = UNKNOWN, str(e)
+    except Exception as e:
+      state, error = DOWN, str(e) or type(e).__name__
+    now = time.time()
+    with self._lock:
+      previous = self._results[target.name]
+      changed = previous.changed if previous.state == state and previous.changed else now
+      result = self._results[target.name] = ProbeResult(state, time.monotonic() - start, error, now, changed)
+    self.on_result(target, result)
+    return result
+
+  def probe_all(self):
+    """
+    Probe every target once (in parallel) and return {name: ProbeResult}.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(self.targets)), thread_name_prefix="probe") as pool:
+      return dict(zip((t.name for t in self.targets), pool.map(self._probe, self.targets)))
+
+  def _run(self):
+    while not self._stop.is_set():
+      self.probe_all()
+      self._wake.wait(self.interval)
+      self._wake.clear()
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+      self._thread.start()
+
+  def probe_now(self):
+    """
+    Ask the background thread for an immediate round of probes.
+    """
+    self._wake.set()
+
+  def stop(self):
+    self._stop.set()
+    self._wake.set()
+    if self._thread is not None:
+      self._thread.join(self.timeout + 3)
+
+  def result(self, name):
+    with self._lock:
+      return self._results[name]
+
+  def results(self):
+    with self._lock:
+      return dict(self._results)
+
+  def step_state(self, step_name):
+    """
+    Worst state of the targets used by an action step (UNKNOWN if none).
+    """
+    states = [self.result(t.name).state for t in self.targets if step_name in t.steps]
+    if not states:
+      return UNKNOWN
+    return max(states, key=STATE_RANK.get)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Early-warning detector on the leak, pressure and vacuum channels.
+
+Keeps a rolling window of the last N samples for every channel and, with
+running sums updated in O(1) per sample, computes for all channels at once
+(vectorized with NumPy):
+  - the least-squares slope over the window (units per minute),
+  - the z-score of the newest sample against the window,
+  - upper threshold crossings.
+A channel raises a finding when one of the checks holds for 'confirm'
+consecutive samples. Only upward excursions are flagged: a leak shows up as
+rising H2leak / pressure / vacuum readings.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from status_file import FIELDS
+
+ATTR_BY_KEY = {key: attr for key, attr, _ in FIELDS}
+
+# key: field in the status file; threshold: upper limit (None = off);
+# slope: rise per minute that counts as a trend (None = off);
+# min_std: floor for the window's standard deviation in the z-score, so a
+# perfectly flat signal does not turn every small step into a huge z
+Channel = namedtuple("Channel", "key threshold slope min_std")
+
+# One flagged channel: kind is 'threshold', 'slope' or 'zscore'
+Finding = namedtuple("Finding", "key kind value limit")
+
+
+class RollingDetector:
+  """
+  Rolling-window detector. update() costs the same for any window length.
+  """
+
+  def __init__(self, channels, window=120, z_limit=6.0, confirm=3):
+    self.channels = list(channels)
+    self.attrs = [ATTR_BY_KEY[c.key] for c in self.channels]
+    self.window = window
+    self.z_limit = z_limit
+    self.confirm = confirm
+
+    n_ch = len(self.channels)
+    self.threshold = np.array([np.inf if c.threshold is None else c.threshold for c in self.channels])
+    self.slope_limit = np.array([np.inf if c.slope is None else c.slope for c in self.channels])
+    self.min_std = np.array([c.min_std for c in self.channels], dtype=float)
+
+    self._x = np.zeros((window, n_ch))
+    self._t = np.zeros(window)
+    self._head = 0 # Next slot to write
+    self._n = 0 # Samples in the window
+    self._since_resum = 0
+    self._t_ref = None
+    self._last = np.full(n_ch, np.nan)
+    self._hits = np.zeros((3, n_ch), dtype=int) # Consecutive hits per check
+    self._reset_sums()
+
+    # Latest statistics (for display / metrics)
+    self.slope_per_min = np.full(n_ch, np.nan)
+    self.zscore = np.full(n_ch, np.nan)
+
+  def _reset_sums(self):
+    n_ch = len(self.channels)
+    self._sx = np.zeros(n_ch)
+    self._sxx = np.zeros(n_ch)
+    self._stx = np.zeros(n_ch)
+    self._st = 0.0
+    self._stt = 0.0
+
+  def _resum(self):
+    """
+    Recompute the running sums from the buffer (once per window length, so
+    the amortized cost stays O(1)). Keeps rounding errors from piling up and
+    re-bases time on the oldest sample to keep the numbers small.
+    """
+    idx = (self._head - self._n + np.arange(self._n)) % self.window
+    t = self._t[idx]
+    new_ref = t[0]
+    self._t[idx] = t - new_ref
+    self._t_ref += new_ref
+    x = self._x[idx]
+    t = self._t[idx]
+    self._sx = x.sum(axis=0)
+    self._sxx = (x * x).sum(axis=0)
+    self._stx = (t[:, None] * x).sum(axis=0)
+    self._st = t.sum()
+    self._stt = (t * t).sum()
+    self._since_resum = 0
+
+  def update(self, t, values):
+    """
+    Add one sample (time in seconds, one value per channel; NaN = missing,
+    the previous value is carried forward). Returns the list of Findings
+    confirmed at this sample.
+    """
+    x = np.asarray(values, dtype=float)
+    missing = np.isnan(x)
+    if missing.any():
+      x = np.where(missing, self._last, x)
+      if np.isnan(x).any():
+        return [] # No value yet for some channel
+    self._last = x
+
+    if self._t_ref is None:
+      self._t_ref = t
+    tr = t - self._t_ref
+    n = self._n
+
+    # z-score of the new sample against the window before it is added
+    if n >= 2:
+      mean = self._sx / n
+      var = np.maximum(self._sxx / n - mean * mean, 0.0)
+      self.zscore = (x - mean) / np.maximum(np.sqrt(var), self.min_std)
+    else:
+      self.zscore = np.zeros_like(x)
+
+    # Drop the oldest sample when the window is full
+    if n == self.window:
+      old_x = self._x[self._head]
+      old_t = self._t[self._head]
+      self._sx -= old_x
+      self._sxx -= old_x * old_x
+      self._stx -= old_t * old_x
+      self._st -= old_t
+      self._stt -= old_t * old_t
+      n -= 1
+
+    self._x[self._head] = x
+    self._t[self._head] = tr
+    self._sx += x
+    self._sxx += x * x
+    self._stx += tr * x
+    self._st += tr
+    self._stt += tr * tr
+    self._head = (self._head + 1) % self.window
+    self._n = n + 1
+
+    self._since_resum += 1
+    if self._since_resum >= self.window:
+      self._resum()
+
+    # Least-squares slope over the window
+    n = self._n
+    denom = n * self._stt - self._st * self._st
+    if n >= 3 and denom > 0:
+      self.slope_per_min = (n * self._stx - self._st * self._sx) / denom * 60.0
+    else:
+      self.slope_per_min = np.zeros_like(x)
+
+    checks = (
+      ("threshold", x > self.threshold, x, self.threshold),
+      ("slope", self.slope_per_min > self.slope_limit, self.slope_per_min, self.slope_limit),
+      ("zscore", self.zscore > self.z_limit, self.zscore, np.full_like(x, self.z_limit)),
+    )
+    findings = []
+    for i, (kind, hit, value, limit) in enumerate(checks):
+      self._hits[i] = np.where(hit, self._hits[i] + 1, 0)
+      for ch in np.flatnonzero(self._hits[i] == self.confirm):
+        findings.append(Finding(self.channels[ch].key, kind, float(value[ch]), float(limit[ch])))
+    return findings
+
+  def update_snapshot(self, snapshot, t):
+    """
+    Feed the detector channels of a StatusSnapshot.
+    """
+    values = [np.nan if v is None else v for v in (getattr(snapshot, a) for a in self.attrs)]
+    return self.update(t, values)
+
+  def active(self):
+    """
+    True while any check is currently confirmed on any channel.
+    """
+    return bool((self._hits >= self.confirm).any())
+
+
+def describe(finding):
+  if finding.kind == "threshold":
+    return f"{finding.key} = {finding.value:.4g} above threshold {finding.limit:.4g}"
+  if finding.kind == "slope":
+    return f"{finding.key} rising {finding.value:.4g}/min (limit {finding.limit:.4g}/min)"
+  return f"{finding.key} jumped (z = {finding.value:.1f}, limit {finding.limit:.1f})"
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Lease shared by a primary and a standby monitor.
+
+The lease is a small JSON file on the shared filesystem holding the
+holder's node id, an epoch (the fencing token, one higher after every
+takeover) and a counter that the holder increments every 'renew' seconds.
+Liveness is judged with each reader's own monotonic clock, so the two
+hosts need not agree on the time:
+
+- The holder counts itself valid for 'ttl' seconds from the start of its
+  last successful renewal. A holder that cannot renew (share unreachable,
+  process frozen) stops acting on its own when that time is up.
+- A standby takes over once it has seen no change of the file for 'ttl'
+  seconds (by then the holder has stopped itself), or the lease was
+  released. It writes a claim with the next epoch, waits 'renew' seconds
+  and reads the file back; the claim stands only if nobody overwrote it in
+  between. A takeover thus takes at most ttl + 3 * renew seconds.
+- A holder that finds another node's claim in the file gives up at once.
+
+held() is the fence: the monitor checks it before every device command and
+checkpoint write, so an instance that lost the lease sends nothing more.
+No flock is held: on NFS the lock of a dead client is only released when
+the server's lock lease runs out, which would hold up the failover.
+"""
+import json
+import os
+import threading
+import time
+
+
+class LeaseLost(Exception):
+  """
+  This instance does not hold the lease (raised instead of a device command).
+  """
+
+
+class Lease:
+  """
+  Hold or watch the lease at 'path' from a background thread.
+  on_change(held, detail) is called from that thread when this node gains
+  the lease (detail: the previous holder) or loses it (detail: the reason).
+  """
+
+  def __init__(self, path, node, ttl=5.0, renew=1.0, on_change=None):
+    if renew * 2 >= ttl:
+      raise ValueError("the lease TTL must be more than twice the renew interval")
+    self.path = path
+    self.node = node
+    self.ttl = ttl
+    self.renew = renew
+    self.on_change = on_change or (lambda held, detail: None)
+    self.epoch = None # Our epoch while we hold the lease
+    self.owner = None # Holder named in the file at the last read
+    self.error = None # Last read/write error
+    self._valid_until = 0.0
+    self._seen = None # (holder, epoch, counter) at the last read, and when it last changed
+    self._seen_at = time.monotonic()
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+
+  def held(self):
+    with self._lock:
+      return self.epoch is not None and time.monotonic() < self._valid_until
+
+  def describe(self):
+    if self.held():
+      return f"primary (lease epoch {self.epoch})"
+    return f"standby (primary: {self.owner or 'none'})"
+
+  def _read(self):
+    try:
+      with open(self.path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    except FileNotFoundError:
+      return None
+    except ValueError:
+      # Not written by a lease holder: treat it as a holder that does not renew
+      return {"holder": "<unreadable>", "epoch": 0, "counter": None}
+    if not isinstance(record, dict):
+      return {"holder": "<unreadable>", "epoch": 0, "counter": None}
+    return record
+
+  def _write(self, record):
+    tmp_path = f"{self.path}.{self.node}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      json.dump(dict(record, written=time.time()), f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, self.path)
+
+  def _renew(self):
+    start = time.monotonic()
+    record = self._read()
+    if record is None or record.get("holder") != self.node or record.get("epoch") != self.epoch:
+      self.owner = record.get("holder") if record else None
+      self._lose(f"lease taken over by {self.owner or 'nobody'}")
+      return
+    record["counter"] = record.get("counter", 0) + 1
+    self._write(record)
+    with self._lock:
+      self._valid_until = start + self.ttl
+
+  def _watch(self):
+    now = time.monotonic()
+    record = self._read()
+    key = None if record is None else (record.get("holder"), record.get("epoch"), record.get("counter"))
+    if key != self._seen:
+      self._seen, self._seen_at = key, now
+    self.owner = record.get("holder") if record else None
+    if self.owner is not None and now - self._seen_at < self.ttl:
+      return
+    self._claim(record)
+
+  def _claim(self, record):
+    epoch = (record.get("epoch") or 0) + 1 if record else 1
+    start = time.monotonic()
+    self._write({"holder": self.node, "epoch": epoch, "counter": 0})
+    if self._stop.wait(self.renew):
+      return
+    check = self._read()
+    if check is None or check.get("holder") != self.node or check.get("epoch") != epoch:
+      return # Another node claimed it, or the holder was alive after all
+    with self._lock:
+      self.epoch = epoch
+      self._valid_until = start + self.ttl
+    previous = self.owner
+    self.owner = self.node
+    self.on_change(True, previous)
+
+  def _lose(self, reason):
+    with self._lock:
+      if self.epoch is None:
+        return
+      self.epoch = None
+      self._valid_until = 0.0
+    self._seen, self._seen_at = None, time.monotonic()
+    self.on_change(False, reason)
+
+  def check(self):
+    """
+    One renewal (holder) or observation (standby) round.
+    """
+    try:
+      if self.epoch is not None:
+        self._renew()
+      else:
+        self._watch()
+      self.error = None
+    except OSError as e:
+      self.error = str(e)
+    if self.epoch is not None and time.monotonic() >= self._valid_until:
+      self._lose(f"could not renew the lease for {self.ttl:g}s ({self.error})")
+
+  def _run(self):
+    while not self._stop.wait(self.renew):
+      self.check()
+
+  def start(self):
+    """
+    Take the lease if it is free (blocks for up to 'renew' seconds), then
+    keep renewing or watching it in the background.
+    """
+    self.check()
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name="lease", daemon=True)
+      self._thread.start()
+
+  def release(self):
+    """
+    Stop, and mark the lease free if we hold it, so a standby takes over
+    without waiting for the TTL.
+    """
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join(self.renew + 2)
+    if self.epoch is None:
+      return
+    try:
+      record = self._read()
+      if record is not None and record.get("holder") == self.node and record.get("epoch") == self.epoch:
+        self._write({"holder": None, "epoch": self.epoch, "counter": record.get("counter", 0)})
+    except OSError as e:
+      self.error = str(e)
+    with self._lock:
+      self.epoch = None
+      self._valid_until = 0.0
@@ -1,11 +1,35 @@
 #!/usr/bin/env python3
+import asyncio
+import re
 import time
 import os
 import subprocess
 import threading
-import requests
+import socket
 import sys
 from dotenv import load_dotenv
+from action_graph import Step, StepOverrun, run_graph, time_left, PENDING, RUNNING, OK, FAILED, SKIPPED, OVERRUN
+from drivers import INPROCESS, SUBPROCESS, load_drivers
+from health import DOWN, STATE_RANK, UNKNOWN, UP, HealthProber, ProbeUnavailable, Target
+from remote_exec import RemoteHost, preopen
+from notifier import DiscordNotifier
+from dashboard import Dashboard
+from control import CANCEL, SKIP, ControlError, ControlServer, TriggerFileWatcher, WaitControl
+import telemetry
+from telemetry import MetricsExporter, Registry
+try:
+  from status_recorder import StatusRecorder # Needs numpy
+  from leak_detector import Channel, RollingDetector, describe as describe_finding
+except ImportError:
+  StatusRecorder = None
+  RollingDetector = None
+from status_file import StatusFileReader, TornReadError
+from status_watcher import StatusWatcher
+from sampling import AdaptiveSampler, SamplingStats
+from toggle_kikusui import VOLTAGE_ON as KIKUSUI_VOLTAGE_ON
+from checkpoint import Checkpoint
+from lease import Lease, LeaseLost
+from rules import CHANGED, CLEARED, INITIAL, SHUTDOWN, CountAbove, Flag, RuleEngine
 
 # --- Load environment variables from .env file ---
 load_dotenv()
@@ -35,8 +59,68 @@ action_lock = threading.Lock()
 # Use the absolute path
 # FILE_TO_WATCH = os.path.join(SCRIPT_DIR, 'debug/H2tgtPresentStatus.txt')
 FILE_TO_WATCH = '/home/sks/share/monitor-tmp/H2tgtPresentStatus.txt'
-# Polling interval (seconds)
+# Binary history of every parsed snapshot (query with 'python status_recorder.py').
+# Memory-mapped, so keep it on local disk, not on the NFS share
+HISTORY_FILE = "/var/tmp/lh2-monitor/status_history.ring"
+HISTORY_FLUSH_INTERVAL_SECONDS = 10 # A crash loses at most this much history
+# --- Early-warning detector (leak_detector.py) ---
+# "off", "warn" (pre-alert notification only) or
+# "prewait" (pre-alert and also run the pre-wait shutdown steps, Actions 1-3)
+DETECTOR_MODE = "warn"
+DETECTOR_WINDOW = 120 # Samples in the rolling window
+DETECTOR_Z_LIMIT = 6.0 # z-score of a new sample against the window
+DETECTOR_CONFIRM = 3 # Consecutive samples a check must hold before it counts
+DETECTOR_CHANNELS = [
+  # (key, upper threshold or None, rise per minute or None, min std for z-score)
+  ("H2leak_1",   None, 0.5,  0.05),
+  ("H2leak_2",   None, 0.5,  0.05),
+  ("H2leak_3",   None, 0.5,  0.05),
+  ("Press.diff", None, 50.0, 5.0),
+  ("H2_press",   None, 0.5,  0.05),
+  ("Vac_cryo",   None, None, 1e-3),
+  ("Vac_tank",   None, None, 1e-3),
+]
+# Base polling interval (seconds), used while the leak sensors are steady.
+# With the inotify backend this is only the screen refresh period; changes
+# are picked up as soon as the file is written. On a polled share it bounds
+# the detection latency of Alert_H2leak, see lh2_detection_latency_worst_seconds.
 POLLING_INTERVAL = 1
+# --- Adaptive sampling (sampling.py) ---
+# A record in which one of SAMPLING_CHANNELS moved by more than its 'enter'
+# step, or in which a SAMPLING_FLAGS flag changed, switches to
+# BURST_INTERVAL_SECONDS. Back to POLLING_INTERVAL after BURST_QUIET_RECORDS
+# records in a row within the 'exit' steps and at least BURST_HOLD_SECONDS.
+BURST_INTERVAL_SECONDS = 0.1
+SAMPLING_CHANNELS = [
+  # (key, change between two records that starts a burst, change that counts as quiet)
+  ("H2leak_1",   0.05, 0.02),
+  ("H2leak_2",   0.05, 0.02),
+  ("H2leak_3",   0.05, 0.02),
+  ("Press.diff", 5.0,  2.0),
+]
+SAMPLING_FLAGS = ("Alert_YBox", "Alert_GL860", "Alert_H2leak", "Alert_User")
+BURST_QUIET_RECORDS = 5
+BURST_HOLD_SECONDS = 30
+# Window of the read rate and worst detection latency metrics
+SAMPLING_STATS_WINDOW_SECONDS = 300
+# "Stale data" alarm when the record's Time: header is older than this
+# (the logger stopped writing, or the share is no longer updated)
+STALE_AFTER_SECONDS = 120
+# --- Rule engine (rules.py) ---
+# Name of FILE_TO_WATCH as a rule source
+MAIN_SOURCE = "lh2"
+# Further status files to follow in this process, {source name: path}
+STATUS_SOURCES = {}
+# Checked against every new snapshot of every source (or only 'source=').
+# Alert_H2leak -> 1 on the main file is the built-in shutdown trigger;
+# action=SHUTDOWN rules start the same sequence, the others notify Discord.
+# Rule types: Flag, Threshold, CountAbove, Transition (rules.py; add them to the import above).
+RULES = [
+  Flag("YBox alert", "Alert_YBox"),
+  Flag("GL860 alert", "Alert_GL860"),
+  Flag("User alert", "Alert_User"),
+  CountAbove("H2 sensors high", ("H2leak_1", "H2leak_2", "H2leak_3"), limit=1.0, count=2, hysteresis=0.1),
+]
 
 # --- Action Settings (Customize these) ---
 HV_SCRIPT_PATH = os.path.join(SCRIPT_DIR, "turn_off_hv.py")
@@ -45,6 +129,13 @@ CAEN_HV_CHAMBER_SCRIPT_PATH = os.path.join(SCRIPT_DIR, "shutdown_caenhv1_chamber
 CAEN_HV_T0_SCRIPT_PATH = os.path.join(SCRIPT_DIR, "shutdown_caenhv1_T0.py")
 MASSFLOW_IN_SCRIPT_PATH  = "/home/sks/share/monitor-tools/mass-flow/mqv0002.py"
 MASSFLOW_OUT_SCRIPT_PATH = "/home/sks/share/monitor-tools/mass-flow/flow2.py"
+# "inprocess": import the HV/Kikusui/CAEN scripts once and call them directly
+# "subprocess": run each script with 'python3' (fallback mode)
+DRIVER_MODE = "inprocess"
+
+# --- HV Controller Settings (raspi, Action 1) ---
+HV_CONTROLLER_IP_LASTS = ["12", "13"]
+HV_PORT_IDS = [0, 1, 2, 3]
 
 # --- Remote Pi Settings (Pi B) ---
 TARGET_PI_USER = "sks"
@@ -58,18 +149,148 @@ REMOTE_COMMANDS_TO_RUN = [
   "sudo /usr/sbin/uhubctl -l 1-1 -p 3 -a 0",
   "sudo /usr/sbin/uhubctl -l 1-1 -p 4 -a 0"
 ]
+# Open the SSH connections to the Pis as soon as an alert starts, so Action 6
+# does not pay for the key exchange after the wait
+SSH_PREOPEN_ON_ALERT = True
 WAIT_TIME_SECONDS = 15 * 60 # 15 minutes
+# Maximum number of shutdown steps running at the same time
+MAX_PARALLEL_ACTIONS = 8
+# The running sequence is saved here after every step, and a monitor started
+# while this file exists resumes it (finished steps are not repeated, the
+# Action 4 countdown keeps its deadline)
+SEQUENCE_CHECKPOINT_PATH = os.path.join(SCRIPT_DIR, "sequence_checkpoint.json")
+# A checkpoint untouched for longer is not resumed (power may have been restored by hand since)
+CHECKPOINT_MAX_AGE_SECONDS = 2 * 60 * 60
+
+# --- Hot standby (lease.py) ---
+# Two monitors (e.g. on two hosts) share this lease file. The holder is the
+# primary and acts; the other one watches the status file without acting and
+# takes over (detection, and the checkpointed sequence) within
+# LEASE_TTL_SECONDS + 3 * LEASE_RENEW_SECONDS after the primary stops renewing.
+# The lease and SEQUENCE_CHECKPOINT_PATH must be on the shared filesystem.
+# None: single instance, always primary.
+LEASE_PATH = None # e.g. "/home/sks/share/monitor-tmp/lh2-monitor.lease"
+LEASE_TTL_SECONDS = 5
+LEASE_RENEW_SECONDS = 1
+
+# --- Watchdog: time budget of each step (seconds from its start) ---
+# An overrunning step is abandoned, reported in the final summary, and (if
+# ACTION_BACKUP_ON_OVERRUN) its device script is run once more as a backup.
+STEP_BUDGET_SECONDS = {
+  "hv": 40, # turn_off_hv gives up on a port after 30 s
+  "massflow": 30,
+  "kikusui": 15,
+  "caen_chamber": 150, # Ramp-down deadline 120 s
+  "caen_t0": 120, # Boosters 30 s + PMTs 60 s
+  "uhubctl": 60,
+}
+TIME_TO_SAFE_DEADLINE_SECONDS = 180 # Actions 1-3 must be finished this long after the alert
+# A step's subprocess is killed this long before the step overruns, so it is
+# gone before the watchdog starts the backup (a second login to the device)
+CHILD_KILL_MARGIN_SECONDS = 1.0
+ACTION_BACKUP_ON_OVERRUN = True
+
+# --- Power restore ('python3 control.py restore', refused during an alert) ---
+REMOTE_RESTORE_COMMANDS = [
+  "sudo /usr/sbin/uhubctl -l 1-1 -p 1 -a 1",
+  "sudo /usr/sbin/uhubctl -l 1-1 -p 2 -a 1",
+  "sudo /usr/sbin/uhubctl -l 1-1 -p 3 -a 1",
+  "sudo /usr/sbin/uhubctl -l 1-1 -p 4 -a 1"
+]
+# Read back afterwards: every port in RESTORE_HUB_PORTS must show 'power'
+REMOTE_PORT_STATUS_COMMAND = "sudo /usr/sbin/uhubctl -l 1-1 -p 1,2,3,4"
+RESTORE_HUB_PORTS = [1, 2, 3, 4]
+KIKUSUI_VOLTAGE_TOLERANCE_V = 0.2 # Measured voltage vs. toggle_kikusui.VOLTAGE_ON
+RESTORE_BUDGET_SECONDS = {
+  "hv": 40,
+  "massflow": 30,
+  "kikusui": 15,
+  "caen_chamber": 330, # Ramp-up deadline 300 s
+  "caen_t0": 210, # PMTs 120 s + boosters 60 s
+  "uhubctl": 60,
+}
+
+# --- Reachability probes (see health.py) ---
+# (name, host, TCP port or None for ping, action steps that depend on it)
+HEALTH_TARGETS = [
+  ("HV .12", "192.168.20.12", 8000, ("hv_12",)),
+  ("HV .13", "192.168.20.13", 8000, ("hv_13",)),
+  ("Kikusui .42", "192.168.20.42", 5025, ("kikusui_42",)),
+  ("Kikusui .45", "192.168.20.45", 5025, ("kikusui_45",)),
+  # In-process CAEN driver: probed with a crate login (ping only in subprocess mode)
+  ("CAEN SY1527", "192.168.20.51", None, ("caen_chamber", "caen_t0")),
+  ("Pi .12 ssh", "192.168.20.12", 22, ("uhubctl_192.168.20.12",)),
+  ("Pi .13 ssh", "192.168.20.13", 22, ("uhubctl_192.168.20.13",)),
+]
+HEALTH_PROBE_INTERVAL_SECONDS = 10
+HEALTH_PROBE_TIMEOUT_SECONDS = 1.0
+DOWN_TARGET_BUDGET_SECONDS = 5 # Budget of a step whose target was down at the last probe
+# Steps confirmed by readback keep their budget on a down probe (only start last):
+# cut short, a healthy ramp-down would overrun and its backup log in a second time
+READBACK_VERIFIED_STEPS = ("caen_chamber", "caen_t0")
+# On an early-warning trend, open the SSH masters, Kikusui connections and the
+# CAEN login ahead of the alert; they are closed again after this if none follows
+WARM_CONNECTION_HOLD_SECONDS = 600
+
+# One multiplexed SSH connection per Pi (see remote_exec.py)
+remote_hosts = {host: RemoteHost(TARGET_PI_USER, host) for host in TARGET_PI_HOSTS}
 
 # Define trigger files
 SKIP_TRIGGER_FILE = "/tmp/skip.now"     # Skips wait, runs in 5s
 CANCEL_TRIGGER_FILE = "/tmp/cancel.now"   # Cancels subsequent actions
 EXTEND_TRIGGER_FILE = "/tmp/extend.now"   # Resets the wait timer
+TRIGGER_COMMANDS = {SKIP_TRIGGER_FILE: "skip", CANCEL_TRIGGER_FILE: "cancel", EXTEND_TRIGGER_FILE: "extend"}
+# Unix socket for operator commands (client: 'python3 control.py skip|cancel|extend [min]|status')
+CONTROL_SOCKET_PATH = "/tmp/lh2-monitor.sock"
+
+# State of the Action 4 wait, changed by the control socket and the trigger files
+wait_control = WaitControl()
 # ------------------------------------
 
+# --- Telemetry ---
+SPAN_LOG_PATH = os.path.join(SCRIPT_DIR, "spans.jsonl") # JSON Lines timing spans (None to disable)
+SPAN_LOG_MAX_BYTES = 20 * 1024 * 1024 # Roll spans.jsonl over to spans.jsonl.1 at this size
+SPAN_LOG_BACKUPS = 3 # Rolled-over span files kept
+METRICS_TEXTFILE = os.path.join(SCRIPT_DIR, "lh2_monitor.prom") # For node_exporter's textfile collector (None to disable)
+METRICS_INTERVAL_SECONDS = 15
+METRICS_HTTP_PORT = None # e.g. 9108 to serve http://127.0.0.1:9108/metrics
+
+metrics = Registry()
+polls_total = metrics.counter("lh2_polls_total", "Monitor loop iterations (status file checks)")
+status_reads_total = metrics.counter("lh2_status_reads_total", "Status file reads by outcome")
+parse_seconds = metrics.histogram("lh2_status_parse_seconds", "Time to read and parse a changed status file")
+detection_latency = metrics.histogram("lh2_detection_latency_seconds", "Status file write to change seen by the watcher")
+notification_latency = metrics.histogram("lh2_notification_latency_seconds", "notify() to Discord post delivered, per message kind")
+action_duration = metrics.histogram("lh2_action_duration_seconds", "Duration of each action step")
+action_outcomes_total = metrics.counter("lh2_action_outcomes_total", "Finished action steps by outcome")
+sequences_total = metrics.counter("lh2_action_sequences_total", "Action sequences by result")
+restore_seconds = metrics.histogram("lh2_restore_seconds", "Total time of a power restore, by result")
+alert_state = metrics.gauge("lh2_alert_h2leak", "Last Alert_H2leak value seen (-1: unreadable)")
+status_age = metrics.gauge("lh2_status_age_seconds", "Wall clock minus the Time: header of the last good record")
+status_stale = metrics.gauge("lh2_status_stale", "1 while the stale-data alarm is raised")
+target_up = metrics.gauge("lh2_target_up", "Last reachability probe per shutdown target (1 up, 0 down, -1 unknown)")
+rule_active = metrics.gauge("lh2_rule_active", "1 while a rule is raised, per rule and source")
+rule_events_total = metrics.counter("lh2_rule_events_total", "Rule events by rule, source and kind")
+source_reads_total = metrics.counter("lh2_source_reads_total", "Reads of the STATUS_SOURCES files by outcome")
+sampling_burst = metrics.gauge("lh2_sampling_burst", "1 while the status file is sampled at the burst interval")
+sampling_interval = metrics.gauge("lh2_sampling_interval_seconds", "Current status file sampling interval")
+sampling_bursts_total = metrics.counter("lh2_sampling_bursts_total", "Switches to the burst sampling interval")
+read_rate = metrics.gauge("lh2_status_read_rate", "Average status file checks per second over SAMPLING_STATS_WINDOW_SECONDS")
+worst_detection_latency = metrics.gauge("lh2_detection_latency_worst_seconds",
+                                        "Largest detection latency over SAMPLING_STATS_WINDOW_SECONDS")
+lease_held = metrics.gauge("lh2_lease_held", "1 while this monitor is the primary (holds the lease)")
+lease_epoch = metrics.gauge("lh2_lease_epoch", "Epoch (fencing token) of the lease held by this monitor")
+lease_changes_total = metrics.counter("lh2_lease_changes_total", "Lease gained or lost by this monitor")
+probe_latency = metrics.gauge("lh2_target_probe_seconds", "Duration of the last reachability probe per target")
+# -----------------
+
 # --- Load Discord URL from .env file ---
 DISCORD_WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK_URL")
 # -----------------------------------------------
 
+# Undelivered notifications are kept here and re-sent when the webhook is reachable
+DISCORD_SPOOL_PATH = os.path.join(SCRIPT_DIR, "discord_spool.jsonl")
+
 # --- Check if the URL was loaded ---
 if not DISCORD_WEBHOOK_URL:
   print(f"{COLORS.FAIL}ERROR: DISCORD_WEBHOOK_URL not found in .env file.{COLORS.ENDC}")
@@ -79,331 +300,1509 @@ if not DISCORD_WEBHOOK_URL:
 # -----------------------------------------------
 
 
-def read_h2_alert_status(filepath):
+# In-place terminal screen; all runtime messages go to its log pane
+dashboard = Dashboard()
+
+def log(text):
+  """
+  Show a message in the dashboard log pane (plain print when not on a terminal).
+  """
+  dashboard.log(text)
+
+def timed_read(reader):
   """
-  Safely read the status file and extract the 'Alert_H2leak' value.
+  reader.read() and the seconds it took (run in a worker thread).
+  """
+  start = time.perf_counter()
+  return reader.read(), time.perf_counter() - start
+
+async def read_status_snapshot(reader, on_new_snapshot=None):
+  """
+  Safely read the status file and return the parsed StatusSnapshot (or None).
+  All fields of the record are parsed in one pass; an unchanged file is served from cache.
+  The read runs in a worker thread, so a slow share (or a torn-read retry)
+  does not hold up the loop. on_new_snapshot(snapshot) is called on the
+  loop for every newly parsed snapshot.
   """
   try:
-    if not os.path.exists(filepath):
-      return None
-    with open(filepath, 'r', encoding='utf-8') as f:
-      for line in f:
-        if line.strip().startswith("Alert_H2leak:"):
-          parts = line.split(':')
-          if len(parts) > 1:
-            value = parts[1].strip()
-            return value
-    print(f"{COLORS.FAIL}Warning: 'Alert_H2leak:' not found in {filepath}{COLORS.ENDC}")
-    return None
+    parse_count = reader.parse_count
+    snapshot, seconds = await asyncio.to_thread(timed_read, reader)
+    if reader.parse_count != parse_count:
+      parse_seconds.observe(seconds)
+      if on_new_snapshot is not None:
+        on_new_snapshot(snapshot)
   except FileNotFoundError:
-    print(f"{COLORS.FAIL}Error: {filepath} not found.{COLORS.ENDC}")
+    status_reads_total.inc(outcome="missing")
+    log(f"{COLORS.FAIL}Error: {reader.filepath} not found.{COLORS.ENDC}")
+    return None
+  except TornReadError as e:
+    status_reads_total.inc(outcome="torn")
+    log(f"{COLORS.WARNING}Partly written record rejected: {e}{COLORS.ENDC}")
     return None
   except Exception as e:
-    print(f"{COLORS.FAIL}File read error: {e}{COLORS.ENDC}")
+    status_reads_total.inc(outcome="error")
+    log(f"{COLORS.FAIL}File read error: {e}{COLORS.ENDC}")
+    return None
+  status_reads_total.inc(outcome="ok")
+  if snapshot.alert_h2leak is None:
+    log(f"{COLORS.FAIL}Warning: 'Alert_H2leak:' not found in {reader.filepath}{COLORS.ENDC}")
+  return snapshot
+
+def h2_alert_status(snapshot):
+  """
+  Return the 'Alert_H2leak' value of a snapshot as a string ('0' or '1'), or None.
+  """
+  if snapshot is None or snapshot.alert_h2leak is None:
     return None
+  return str(snapshot.alert_h2leak)
+
+def log_notification(text, ok):
+  """
+  Print the outcome of a Discord delivery (called from the notifier thread).
+  """
+  color = COLORS.OKCYAN if ok else COLORS.FAIL
+  log(f"  {color}{text}{COLORS.ENDC}")
+
+def record_notification_latency(latency, prefix):
+  """
+  Metric for one delivered message (called from the notifier thread).
+  """
+  notification_latency.observe(latency, kind=prefix)
+
+# Background Discord sender (started in __main__)
+notifier = DiscordNotifier(DISCORD_WEBHOOK_URL, DISCORD_SPOOL_PATH, log=log_notification,
+                           on_delivered=record_notification_latency)
 
 def send_discord_notification(message, log_prefix="Action Log"):
   """
-  Sends a message to the configured Discord Webhook.
+  Queues a message for the configured Discord Webhook. Never blocks:
+  delivery, retries and spooling happen in the notifier thread.
+  A standby monitor only logs it (the primary sends its own).
   """
-  # URL is guaranteed to exist because of the check at startup
-  data = {
-    "content": f"[{time.ctime()}] {message}",
-    "username": "LH2 Monitor Bot"
-  }
+  if not is_primary():
+    log(f"{COLORS.DIM}({log_prefix}) Standby: not sent to Discord.{COLORS.ENDC}")
+    return
+  notifier.notify(message, log_prefix)
+
+def child_timeout(default=None):
+  """
+  Timeout for a subprocess of the running step: the time the step has left
+  (budget or run deadline) less CHILD_KILL_MARGIN_SECONDS, or 'default'
+  outside a limited step.
+  """
+  left = time_left()
+  if left is None:
+    return default
+  return max(0.1, left - CHILD_KILL_MARGIN_SECONDS)
+
+def overrun_on_child_timeout(steps):
+  """
+  A step whose subprocess was killed at child_timeout() ends as OVERRUN, so
+  the watchdog's backup only starts once the first process is gone.
+  """
+  def wrap(func):
+    def run():
+      try:
+        return func()
+      except subprocess.TimeoutExpired as e:
+        raise StepOverrun(f"killed after {e.timeout:.1f}s at the step limit: {' '.join(map(str, e.cmd))}") from e
+    return run
+  for step in steps:
+    step.func = wrap(step.func)
+
+def run_command(cmd, timeout=None):
+  """
+  Run one shutdown command as a subprocess (raises on non-zero exit, and
+  kills it after 'timeout' seconds).
+  """
+  log(f"  {COLORS.OKCYAN}(Action Log)     Executing: {' '.join(cmd)}{COLORS.ENDC}")
+  subprocess.run(cmd, check=True, timeout=timeout)
+
+def run_remote_uhubctl(host):
+  """
+  Action 6 for one Pi: run every REMOTE_COMMANDS_TO_RUN entry in one SSH
+  session over the host's multiplexed connection.
+  """
+  log(f"  {COLORS.OKCYAN}(Action Log)   Targeting Host: {host} ({len(REMOTE_COMMANDS_TO_RUN)} commands, one session){COLORS.ENDC}")
+  remote_hosts[host].run(REMOTE_COMMANDS_TO_RUN, timeout=child_timeout(STEP_BUDGET_SECONDS["uhubctl"]))
+
+def wait_for_final_shutdown(state):
+  """
+  Action 4: wait WAIT_TIME_SECONDS before the post-wait steps. The wait can be
+  skipped, canceled, or extended through the control socket or the trigger
+  files; a command wakes this loop at once. Updates 'state'; the deadline
+  and a cancel are checkpointed at once, and a resumed sequence continues
+  the countdown to the saved deadline.
+  """
+  wait_control.begin(WAIT_TIME_SECONDS, deadline=state["wait_deadline"])
+  state["wait_deadline"] = wait_control.deadline
+  save_checkpoint(state)
   try:
-    response = requests.post(DISCORD_WEBHOOK_URL, json=data)
-    if response.status_code == 204:
-      print(f"  {COLORS.OKCYAN}({log_prefix}) Discord notification sent.{COLORS.ENDC}")
+    while True:
+      remaining = wait_control.remaining()
+      if wait_control.outcome is not None or remaining <= 0:
+        break
+      if not is_primary():
+        raise LeaseLost("lease lost during the wait; the new primary continues the sequence")
+      if wait_control.deadline != state["wait_deadline"]:
+        # Extended
+        state["wait_deadline"] = wait_control.deadline
+        save_checkpoint(state)
+
+      mins_left, secs_left = divmod(int(remaining), 60)
+      countdown_str = f"{mins_left:02}:{secs_left:02}"
+      dashboard.set_section("countdown", [
+        f"{COLORS.OKCYAN}{COLORS.BOLD}--- ACTION 4: WAITING FOR FINAL SHUTDOWN ---{COLORS.ENDC}",
+        f"{COLORS.OKCYAN}Final shutdown scheduled for: {COLORS.BOLD}{time.ctime(wait_control.deadline)}{COLORS.ENDC}",
+        f"{COLORS.OKCYAN}Control (in another terminal): {COLORS.BOLD}python3 control.py skip | cancel | extend [minutes] | status{COLORS.ENDC}",
+        f"{COLORS.OKCYAN}Or trigger files (use 'touch'):{COLORS.ENDC}",
+        f"  {COLORS.BOLD}Skip:  {SKIP_TRIGGER_FILE}{COLORS.ENDC}",
+        f"  {COLORS.BOLD}Cancel:{CANCEL_TRIGGER_FILE}{COLORS.ENDC}",
+        f"  {COLORS.BOLD}Extend:{EXTEND_TRIGGER_FILE}{COLORS.ENDC}",
+        f"{COLORS.WARNING}{COLORS.BOLD}Waiting... {countdown_str} remaining {COLORS.ENDC}",
+      ])
+      dashboard.render()
+
+      # Returns at once on a command, otherwise after a second for the countdown
+      wait_control.wait(1.0)
+  finally:
+    wait_control.finish()
+    # --- End of wait loop ---
+    dashboard.clear_section("countdown")
+
+  # Process wait results
+  if wait_control.outcome == CANCEL:
+    state["run_post_wait_actions"] = False # Do not run subsequent steps
+    save_checkpoint(state)
+    log(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait Canceled by user.{COLORS.ENDC}")
+  elif wait_control.outcome == SKIP:
+    log(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait skipped. Waiting 5s before final steps...{COLORS.ENDC}")
+    state["wait_deadline"] = time.time() + 5
+    save_checkpoint(state)
+    time.sleep(5)
+  else:
+    log(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait finished (Timeout).{COLORS.ENDC}")
+
+def handle_control_command(command, minutes, source, drivers=None):
+  """
+  Apply an operator command from the control socket or a trigger file and
+  return the reply. Raises ControlError if it cannot be applied.
+  """
+  if command == "status":
+    status = wait_control.status()
+    status["actions_running"] = action_lock.locked()
+    status["restore_running"] = restore_running()
+    status["role"] = "primary" if is_primary() else "standby"
+    if lease is not None:
+      status["lease"] = {"node": lease.node, "holder": lease.owner, "epoch": lease.epoch}
+    if not is_primary():
+      message = f"Standby monitor: the primary is {lease.owner or 'unknown'}."
+    elif status["waiting"]:
+      message = f"Action 4 wait: {status['remaining_seconds']:.0f}s left, final shutdown at {status['deadline']}."
+    elif status["restore_running"]:
+      message = "Power restore running."
+    elif status["actions_running"]:
+      message = "Action sequence running (not in the Action 4 wait)."
     else:
-      print(f"  {COLORS.FAIL}({log_prefix}) ERROR sending Discord notification (Status code: {response.status_code}){COLORS.ENDC}")
-  except Exception as e:
-    print(f"  {COLORS.FAIL}({log_prefix}) ERROR sending Discord notification: {e}{COLORS.ENDC}")
+      message = "Idle: no action sequence running."
+    return {"message": message, "status": status}
+
+  if not is_primary():
+    raise ControlError(f"this is the standby monitor; send '{command}' to the primary ({lease.owner or 'unknown'})")
+
+  if command == "restore":
+    if drivers is None:
+      raise ControlError("restore is only accepted on the control socket")
+    if action_lock.locked():
+      raise ControlError("an action sequence or restore is already running")
+    if alert_status != '0':
+      raise ControlError(f"Alert_H2leak is {'unreadable' if alert_status is None else alert_status}: "
+                         "not restoring power during an alert")
+    log(f"{COLORS.WARNING}(Restore Log) RESTORE received ({source})! Starting the power restore...{COLORS.ENDC}")
+    start_restore(drivers)
+    return {"message": "Power restore started: progress on the dashboard, summary on Discord."}
+
+  if command == "cancel":
+    wait_control.cancel()
+    log(f"{COLORS.WARNING}(Action Log) Action 4: CANCEL received ({source})! Aborting post-wait shutdown steps.{COLORS.ENDC}")
+    message = "Wait canceled: Actions 5-6 will not run."
+  elif command == "skip":
+    wait_control.skip()
+    log(f"{COLORS.WARNING}(Action Log) Action 4: SKIP received ({source})! Proceeding to post-wait steps in 5 seconds...{COLORS.ENDC}")
+    message = "Wait skipped: Actions 5-6 start in 5 seconds."
+  else:
+    deadline = wait_control.extend(minutes)
+    what = "Resetting timer" if minutes is None else f"Adding {minutes:g} min"
+    log(f"{COLORS.WARNING}(Action Log) Action 4: EXTEND received ({source})! {what}.{COLORS.ENDC}")
+    log(f"  {COLORS.OKCYAN}(Action Log)   -> WAIT EXTENDED. New shutdown time: {COLORS.BOLD}{time.ctime(deadline)}{COLORS.ENDC}")
+    message = f"Wait extended: final shutdown at {time.ctime(deadline)}."
+  return {"message": message, "status": wait_control.status()}
+
+def on_trigger_file(path):
+  """
+  A trigger file appeared in /tmp (already removed by the watcher).
+  """
+  try:
+    handle_control_command(TRIGGER_COMMANDS[path], None, f"file {path}")
+  except ControlError as e:
+    log(f"{COLORS.WARNING}Ignored trigger file {path}: {e}{COLORS.ENDC}")
 
-def run_actions():
+async def open_control_channel(drivers):
   """
-  Run the sequence of actions. This wait can be skipped,
-  canceled, or extended using trigger files.
+  Start the control socket and the trigger-file watch on the running loop.
+  Returns both (the socket is None if it could not be opened).
   """
-  if not action_lock.acquire(blocking=False):
-    print(f"  {COLORS.FAIL}(Action Log) ERROR: Could not acquire lock, actions already running.{COLORS.ENDC}")
+  def handle(command, minutes, source):
+    return handle_control_command(command, minutes, source, drivers)
+
+  try:
+    server = ControlServer(CONTROL_SOCKET_PATH, handle)
+    await server.start()
+    log(f"{COLORS.HEADER}Control socket: {CONTROL_SOCKET_PATH}{COLORS.ENDC}")
+  except OSError as e:
+    server = None
+    log(f"{COLORS.FAIL}Cannot open control socket {CONTROL_SOCKET_PATH}: {e} (trigger files still work){COLORS.ENDC}")
+  triggers = TriggerFileWatcher(TRIGGER_COMMANDS, on_trigger_file, log=log)
+  triggers.start()
+  if triggers.fallback_reason:
+    log(f"{COLORS.WARNING}Trigger files: polling every second ({triggers.fallback_reason}){COLORS.ENDC}")
+  return server, triggers
+
+def backup_command(cmd, budget):
+  """
+  Backup for an overrunning step: its device script, run once more in a
+  fresh process (new connection / login), or None if disabled.
+  """
+  if not ACTION_BACKUP_ON_OVERRUN:
+    return None
+  def backup():
+    log(f"  {COLORS.WARNING}(Action Log) Watchdog backup: {' '.join(cmd)}{COLORS.ENDC}")
+    run_command(cmd, timeout=budget)
+  return backup
+
+# Background reachability prober (started by monitor_status_change)
+prober = None
+
+def open_prober(drivers):
+  """
+  Start probing HEALTH_TARGETS. In-process Kikusui supplies are probed over
+  their persistent SCPI connection (which also keeps it warm), everything
+  else with a TCP connect or a ping.
+  """
+  def caen_probe():
+    if not is_primary():
+      raise ProbeUnavailable("standby monitor")
+    drivers.caen.probe()
+
+  def kikusui_probe(host):
+    def probe():
+      if not is_primary():
+        # The primary holds the SCPI connection
+        raise ProbeUnavailable("standby monitor")
+      drivers.kikusui.status(host.rsplit(".", 1)[1])
+    return probe
+
+  def on_result(target, result):
+    target_up.set({UP: 1, DOWN: 0}.get(result.state, -1), target=target.name)
+    probe_latency.set(round(result.latency, 4), target=target.name)
+
+  targets = []
+  for name, host, port, steps in HEALTH_TARGETS:
+    probe = None
+    if drivers.kikusui.mode == INPROCESS and any(s.startswith("kikusui_") for s in steps):
+      probe = kikusui_probe(host)
+    elif drivers.caen.mode == INPROCESS and any(s.startswith("caen_") for s in steps):
+      probe = caen_probe
+    targets.append(Target(name, host, port, steps, probe))
+  health = HealthProber(targets, HEALTH_PROBE_INTERVAL_SECONDS, HEALTH_PROBE_TIMEOUT_SECONDS, on_result)
+  health.start()
+  log(f"{COLORS.HEADER}Reachability probes: {len(targets)} targets every {HEALTH_PROBE_INTERVAL_SECONDS}s{COLORS.ENDC}")
+  return health
+
+HEALTH_COLORS = {UP: COLORS.OKGREEN, DOWN: COLORS.FAIL, UNKNOWN: COLORS.DIM}
+
+def health_lines(columns=2):
+  """
+  Dashboard lines with the cached reachability of every target.
+  """
+  cells = []
+  for name, result in prober.results().items():
+    if result.state == UP:
+      detail = f"{result.latency * 1000:.0f} ms"
+    else:
+      detail = (result.error or "not probed yet")[:24]
+    cells.append(f"{HEALTH_COLORS[result.state]}{result.state.upper():<8}{COLORS.ENDC}{name:<13}{COLORS.DIM}{detail:<26}{COLORS.ENDC}")
+  rows = (len(cells) + columns - 1) // columns
+  lines = [f"{COLORS.DIM}--- Targets (probed every {HEALTH_PROBE_INTERVAL_SECONDS}s) ---{COLORS.ENDC}"]
+  lines += [" ".join(cells[row + col * rows] for col in range(columns) if row + col * rows < len(cells))
+            for row in range(rows)]
+  return lines
+
+def apply_health(steps):
+  """
+  Use the cached probe results: steps on a reachable target start first,
+  and a step whose target was down gets the short DOWN_TARGET_BUDGET_SECONDS
+  budget, so the watchdog gives up on it (and starts its backup) quickly.
+  READBACK_VERIFIED_STEPS keep their budget.
+  """
+  if prober is None:
     return
+  for step in steps:
+    state = prober.step_state(step.name)
+    step.priority = STATE_RANK[state]
+    if state != DOWN or step.budget is None or step.budget <= DOWN_TARGET_BUDGET_SECONDS:
+      continue
+    if step.name in READBACK_VERIFIED_STEPS:
+      log(f"  {COLORS.WARNING}(Action Log) {step.label}: target unreachable at the last probe, started last with its full budget{COLORS.ENDC}")
+    else:
+      step.budget = DOWN_TARGET_BUDGET_SECONDS
+      step.label += " [target down]"
+      log(f"  {COLORS.WARNING}(Action Log) {step.label}: target unreachable at the last probe, budget cut to {DOWN_TARGET_BUDGET_SECONDS}s{COLORS.ENDC}")
 
-  # Store error messages for the final report
-  error_messages = []
-  # This flag controls if actions *after* the wait should run
-  run_post_wait_actions = True 
+# time.time() until which connections opened on an early warning are kept
+warm_until = 0.0
 
-  try:
-    print(f"\n  {COLORS.OKCYAN}(Action Log) --- Starting Action Sequence (Lock Acquired) ---{COLORS.ENDC}")
+def warm_connections(drivers):
+  """
+  Open the SSH masters, the Kikusui connections and the CAEN login ahead of
+  a likely alert, in the background, and re-probe the targets now.
+  """
+  global warm_until
+  warm_until = time.time() + WARM_CONNECTION_HOLD_SECONDS
+  if prober is not None:
+    prober.probe_now()
+  preopen(remote_hosts.values())
+  threading.Thread(target=drivers.warm, args=((42, 45),), name="warm-drivers", daemon=True).start()
+  asyncio.get_running_loop().call_later(WARM_CONNECTION_HOLD_SECONDS + 1, release_warm_connections, drivers)
+
+def release_warm_connections(drivers):
+  """
+  Close connections opened by warm_connections() once no alert followed.
+  """
+  if time.time() < warm_until or sequence_tasks or action_lock.locked():
+    return
+  log(f"{COLORS.DIM}No alert followed the early warning: closing the pre-opened connections.{COLORS.ENDC}")
+  def close():
+    drivers.close()
+    for remote in remote_hosts.values():
+      remote.close()
+  threading.Thread(target=close, name="release-warm", daemon=True).start()
 
-    # +--------------------------------------------+
-    # | Action 1: Run Python script (raspi HV Off) |
-    # +--------------------------------------------+
-    print(f"  {COLORS.OKCYAN}(Action Log) Action 1: Running script '{os.path.basename(HV_SCRIPT_PATH)}' (HV OFF)...{COLORS.ENDC}")
-    try:
-      for port in range(4):
-        subprocess.run(["python3", HV_SCRIPT_PATH, "--ip_last", "12", "--port", str(port)], check=True)
-      for port in range(4):
-        subprocess.run(["python3", HV_SCRIPT_PATH, "--ip_last", "13", "--port", str(port)], check=True)
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 1: Script finished.{COLORS.ENDC}")
-    except Exception as e:
-      error_msg = f"Action 1 (HV Off) failed: {e}"
-      print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-      error_messages.append(error_msg)
-
-    # +--------------------------------------+
-    # | Action 2: Stop Mass Flow Controllers |
-    # +--------------------------------------+
-    print(f"  {COLORS.OKCYAN}(Action Log) Action 2: Stopping Mass Flow Controllers...{COLORS.ENDC}")
-    try:
-      print(f"  {COLORS.OKCYAN}(Action Log)   -> Running '{MASSFLOW_OUT_SCRIPT_PATH} off'...{COLORS.ENDC}")
-      subprocess.run(["python3", MASSFLOW_OUT_SCRIPT_PATH, "off"], check=True)
-      print(f"  {COLORS.OKCYAN}(Action Log)   -> Running '{MASSFLOW_IN_SCRIPT_PATH} off'...{COLORS.ENDC}")
-      subprocess.run(["python3", MASSFLOW_IN_SCRIPT_PATH, "off"], check=True)
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 2: Mass Flow Controllers stopped.{COLORS.ENDC}")
-    except Exception as e:
-      error_msg = f"Action 2 (Mass Flow Stop) failed: {e}"
-      print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-      error_messages.append(error_msg)
-      
-    # +------------------------------------------------------------------+
-    # | Action 3: CAEN HV Shutdowns (Kikusui .42, CAEN Chamber, CAEN T0) |
-    # +------------------------------------------------------------------+
-    print(f"  {COLORS.OKCYAN}(Action Log) Action 3: Running initial local shutdown scripts...{COLORS.ENDC}")
-    
-    # --- (A) Kikusui BLC2 Off ---
-    print(f"  {COLORS.OKCYAN}(Action Log)   -> (A) Turning off Kikusui BLC2 (IP: 42)...{COLORS.ENDC}")
-    try:
-      subprocess.run(["python3", KIKUSUI_SCRIPT_PATH, "42", "off"], check=True)
-    except Exception as e:
-      error_msg = f"Action 3 (Kikusui Off for .42) failed: {e}"
-      print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-      error_messages.append(error_msg)
-        
-    # --- (B) CAEN HV Chamber Off ---
-    print(f"  {COLORS.OKCYAN}(Action Log)   -> (B) Shutting down CAEN HV Chamber ('{os.path.basename(CAEN_HV_CHAMBER_SCRIPT_PATH)}')...{COLORS.ENDC}")
+# Lease of the primary/standby pair (None: single instance, see open_lease)
+lease = None
+
+def is_primary():
+  return lease is None or lease.held()
+
+def fenced(func, name):
+  """
+  Wrap a device call so it only runs while this monitor holds the lease.
+  """
+  def call():
+    if not is_primary():
+      raise LeaseLost(f"not the lease holder, {name} not sent")
+    return func()
+  return call
+
+def fence_steps(steps):
+  """
+  Fence every step (and backup) of an action graph, checked when it starts.
+  """
+  for step in steps:
+    step.func = fenced(step.func, step.name)
+    if step.backup is not None:
+      step.backup = fenced(step.backup, f"{step.name} backup")
+
+# Checkpoint of the running action sequence (see run_actions)
+sequence_checkpoint = Checkpoint(SEQUENCE_CHECKPOINT_PATH)
+checkpoint_lock = threading.Lock()
+
+def new_sequence_state(pre_wait_only):
+  """
+  The state of a new action sequence, as saved in the checkpoint.
+  """
+  return {
+    "sequence": f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}",
+    "mode": "prewait" if pre_wait_only else "full",
+    "started": time.time(),
+    "run_post_wait_actions": True, # Cleared by a cancel of the Action 4 wait
+    "wait_deadline": None, # time.time() at which the Action 4 wait ends
+    "steps": {}, # Finished steps: {name: {status, start, end, error}}
+  }
+
+def save_checkpoint(state, step=None):
+  """
+  Record a finished step (if given) in 'state' and write the checkpoint.
+  A failed write is logged; the sequence goes on.
+  """
+  with checkpoint_lock:
+    if step is not None:
+      state["steps"][step.name] = {"status": step.status, "start": step.start, "end": step.end,
+                                   "error": None if step.error is None else str(step.error)}
+    if not is_primary():
+      return # The checkpoint belongs to the new primary now
     try:
-      subprocess.run(["python3", CAEN_HV_CHAMBER_SCRIPT_PATH], check=True)
-    except Exception as e:
-      error_msg = f"Action 3 (CAEN HV Chamber Off) failed: {e}"
-      print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-      error_messages.append(error_msg)
-          
-    # --- (C) CAEN HV T0 Off ---
-    print(f"  {COLORS.OKCYAN}(Action Log)   -> (C) Shutting down CAEN HV T0 ('{os.path.basename(CAEN_HV_T0_SCRIPT_PATH)}')...{COLORS.ENDC}")
+      sequence_checkpoint.save(state)
+    except OSError as e:
+      log(f"  {COLORS.FAIL}(Action Log) ERROR writing sequence checkpoint {sequence_checkpoint.path}: {e}{COLORS.ENDC}")
+
+def clear_checkpoint():
+  with checkpoint_lock:
+    if not is_primary():
+      return
     try:
-      subprocess.run(["python3", CAEN_HV_T0_SCRIPT_PATH], check=True)
-    except Exception as e:
-      error_msg = f"Action 3 (CAEN HV T0 Off) failed: {e}"
-      print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-      error_messages.append(error_msg)
-          
-    print(f"  {COLORS.OKCYAN}(Action Log) Action 3: Initial local shutdown scripts finished.{COLORS.ENDC}")
-
-    # +---------------------------------------------------+
-    # | Action 4: Wait (with trigger logic AND countdown) |
-    # +---------------------------------------------------+
-    future_epoch_time = time.time() + WAIT_TIME_SECONDS
-    future_time_str = time.ctime(future_epoch_time)
-
-    start_time = time.time()
-    wait_duration = WAIT_TIME_SECONDS
-    wait_skipped = False
+      sequence_checkpoint.clear()
+    except OSError as e:
+      log(f"  {COLORS.FAIL}(Action Log) ERROR removing sequence checkpoint {sequence_checkpoint.path}: {e}{COLORS.ENDC}")
 
-    while True:
-      elapsed = time.time() - start_time
-      remaining = wait_duration - elapsed
-
-      if remaining <= 0:
-        break # Time's up
-
-      # Check for CANCEL (Priority 1)
-      if os.path.exists(CANCEL_TRIGGER_FILE):
-        os.system('clear')
-        print(f"\n{COLORS.WARNING}(Action Log) Action 4: CANCEL file found! Aborting post-wait shutdown steps.{COLORS.ENDC}")
-        try: os.remove(CANCEL_TRIGGER_FILE)
-        except Exception as e: print(f"{COLORS.FAIL}Error removing {CANCEL_TRIGGER_FILE}: {e}{COLORS.ENDC}")
-        run_post_wait_actions = False # Do not run subsequent steps
-        break # Exit wait loop
-
-      # Check for SKIP (Priority 2)
-      if os.path.exists(SKIP_TRIGGER_FILE):
-        os.system('clear')
-        print(f"\n{COLORS.WARNING}(Action Log) Action 4: SKIP file found! Proceeding to post-wait steps in 5 seconds...{COLORS.ENDC}")
-        try: os.remove(SKIP_TRIGGER_FILE)
-        except Exception as e: print(f"{COLORS.FAIL}Error removing {SKIP_TRIGGER_FILE}: {e}{COLORS.ENDC}")
-        wait_skipped = True
-        break # Exit wait loop
-
-      # Check for EXTEND (Priority 3)
-      if os.path.exists(EXTEND_TRIGGER_FILE):
-        os.system('clear')
-        print(f"\n{COLORS.WARNING}(Action Log) Action 4: EXTEND file found! Resetting timer.{COLORS.ENDC}")
-        try: os.remove(EXTEND_TRIGGER_FILE)
-        except Exception as e: print(f"{COLORS.FAIL}Error removing {EXTEND_TRIGGER_FILE}: {e}{COLORS.ENDC}")
-        start_time = time.time() # Reset the timer
-        wait_duration = WAIT_TIME_SECONDS # Ensure it uses the original duration
-        new_future_time = time.ctime(time.time() + wait_duration)
-        print(f"  {COLORS.OKCYAN}(Action Log)   -> WAIT EXTENDED. New shutdown time: {COLORS.BOLD}{new_future_time}{COLORS.ENDC}")
-
-      os.system('clear') # Clear the terminal each second
-      print(f"{COLORS.OKCYAN}{COLORS.BOLD}--- ACTION 4: WAITING FOR FINAL SHUTDOWN ---{COLORS.ENDC}")
-      print(f"{COLORS.OKCYAN}Final shutdown scheduled for: {COLORS.BOLD}{time.ctime(start_time + wait_duration)}{COLORS.ENDC}")
-      print(f"{COLORS.OKCYAN}Trigger files (use 'touch' in another terminal):{COLORS.ENDC}")
-      print(f"  {COLORS.BOLD}Skip:  {SKIP_TRIGGER_FILE}{COLORS.ENDC}")
-      print(f"  {COLORS.BOLD}Cancel:{CANCEL_TRIGGER_FILE}{COLORS.ENDC}")
-      print(f"  {COLORS.BOLD}Extend:{EXTEND_TRIGGER_FILE}{COLORS.ENDC}")
-      print("-" * 30)
-
-      mins_left, secs_left = divmod(int(remaining), 60)
-      countdown_str = f"{mins_left:02}:{secs_left:02}"
-      print(f"{COLORS.WARNING}{COLORS.BOLD}Waiting... {countdown_str} remaining {COLORS.ENDC}")
+def log_port_results(results):
+  """
+  Log the HV ports that failed or needed retries (the in-process driver
+  does not print them, so they would otherwise be lost).
+  """
+  for r in results or ():
+    if not r.ok:
+      log(f"  {COLORS.FAIL}(Action Log) HV {r.controller_ip} port {r.port_id}: FAILED after "
+          f"{r.attempts} attempt(s), {r.elapsed:.2f}s: {r.error}{COLORS.ENDC}")
+    elif r.attempts > 1:
+      log(f"  {COLORS.WARNING}(Action Log) HV {r.controller_ip} port {r.port_id}: OK after "
+          f"{r.attempts} attempts, {r.elapsed:.2f}s{COLORS.ENDC}")
+
+def switch_hv_ports(switch, ip_last):
+  """
+  Switch HV_PORT_IDS of one controller with drivers.hv.turn_off_ports or
+  turn_on_ports and log the per-port outcome.
+  """
+  try:
+    results = switch(ip_last, HV_PORT_IDS, timeout=child_timeout())
+  except Exception as e:
+    log_port_results(getattr(e, "results", None))
+    raise
+  log_port_results(results)
+  return results
 
-      time.sleep(1)
+def build_action_graph(state, drivers, pre_wait_only=False):
+  """
+  Encode the shutdown sequence as a dependency graph.
+
+  Actions 1-3 target different devices and run in parallel. The two CAEN
+  groups share one login to the SY1527 crate and run side by side; the
+  subprocess scripts log in separately, so there T0 waits for the chamber.
+  Action 4 (the wait) starts once every pre-wait step is done, and Actions
+  5-6 run after it unless the wait was canceled. With pre_wait_only, the
+  graph stops after Actions 1-3.
+
+  Every device step has a STEP_BUDGET_SECONDS budget; Actions 1-3 also
+  share the TIME_TO_SAFE_DEADLINE_SECONDS deadline. The reachability
+  probes then set the start order and cut the budget of unreachable targets.
+  """
+  steps = []
+  budgets = STEP_BUDGET_SECONDS
+  safe_by = TIME_TO_SAFE_DEADLINE_SECONDS
+
+  # +--------------------------------------------+
+  # | Action 1: Run Python script (raspi HV Off) |
+  # +--------------------------------------------+
+  # All ports of one controller are turned off concurrently over one keep-alive session
+  for ip_last in HV_CONTROLLER_IP_LASTS:
+    steps.append(Step(
+      f"hv_{ip_last}",
+      lambda ip_last=ip_last: switch_hv_ports(drivers.hv.turn_off_ports, ip_last),
+      label=f"Action 1 (HV Off .{ip_last} ports {', '.join(map(str, HV_PORT_IDS))})",
+      budget=budgets["hv"], deadline=safe_by,
+      backup=backup_command(["python3", HV_SCRIPT_PATH, "--ip_last", ip_last, "--port", *map(str, HV_PORT_IDS)],
+                            budgets["hv"])))
+
+  # +--------------------------------------+
+  # | Action 2: Stop Mass Flow Controllers |
+  # +--------------------------------------+
+  for name, script in (("massflow_out", MASSFLOW_OUT_SCRIPT_PATH), ("massflow_in", MASSFLOW_IN_SCRIPT_PATH)):
+    cmd = ["python3", script, "off"]
+    steps.append(Step(name, lambda cmd=cmd: run_command(cmd, timeout=child_timeout(budgets["massflow"])),
+                      label=f"Action 2 (Mass Flow Stop, {name.split('_')[1]})",
+                      budget=budgets["massflow"], deadline=safe_by))
+
+  # +------------------------------------------------------------------+
+  # | Action 3: CAEN HV Shutdowns (Kikusui .42, CAEN Chamber, CAEN T0) |
+  # +------------------------------------------------------------------+
+  steps.append(Step("kikusui_42", lambda: drivers.kikusui.off(42, timeout=child_timeout()),
+                    label="Action 3 (Kikusui Off for .42)", budget=budgets["kikusui"], deadline=safe_by,
+                    backup=backup_command(["python3", KIKUSUI_SCRIPT_PATH, "42", "off"], budgets["kikusui"])))
+  steps.append(Step("caen_chamber", lambda: drivers.caen.shutdown_chamber(timeout=child_timeout()),
+                    label="Action 3 (CAEN HV Chamber Off)", budget=budgets["caen_chamber"], deadline=safe_by,
+                    backup=backup_command(["python3", CAEN_HV_CHAMBER_SCRIPT_PATH], budgets["caen_chamber"])))
+  caen_t0_deps = ("caen_chamber",) if drivers.caen.mode == SUBPROCESS else ()
+  steps.append(Step("caen_t0", lambda: drivers.caen.shutdown_t0(timeout=child_timeout()),
+                    deps=caen_t0_deps, label="Action 3 (CAEN HV T0 Off)", budget=budgets["caen_t0"], deadline=safe_by,
+                    backup=backup_command(["python3", CAEN_HV_T0_SCRIPT_PATH], budgets["caen_t0"])))
+
+  pre_wait_steps = [step.name for step in steps]
+  if pre_wait_only:
+    apply_health(steps)
+    return steps, pre_wait_steps
+
+  # +---------------------------------------------------+
+  # | Action 4: Wait (with trigger logic AND countdown) |
+  # +---------------------------------------------------+
+  steps.append(Step("wait", lambda: wait_for_final_shutdown(state),
+                    deps=pre_wait_steps, label="Action 4 (Wait)"))
+
+  # +-----------------------------------------------------------------+
+  # | Action 5: Turn off Kikusui .45 / Action 6: uhubctl (Post-Wait)  |
+  # +-----------------------------------------------------------------+
+  post_wait_enabled = lambda: state["run_post_wait_actions"]
+  steps.append(Step("kikusui_45", lambda: drivers.kikusui.off(45, timeout=child_timeout()),
+                    deps=("wait",), enabled=post_wait_enabled, label="Action 5 (Kikusui Off for .45)",
+                    budget=budgets["kikusui"],
+                    backup=backup_command(["python3", KIKUSUI_SCRIPT_PATH, "45", "off"], budgets["kikusui"])))
+  for host in TARGET_PI_HOSTS:
+    steps.append(Step(f"uhubctl_{host}", lambda host=host: run_remote_uhubctl(host),
+                      deps=("wait",), enabled=post_wait_enabled, label=f"Action 6 (uhubctl {host})",
+                      budget=budgets["uhubctl"]))
+
+  apply_health(steps)
+  return steps, pre_wait_steps
+
+def caen_ramp_results(run):
+  """
+  The CAEN ramp-down readback results (RampResult list) of a finished run.
+  Empty for the subprocess driver, which does not report them.
+  """
+  results = []
+  for name in ("caen_chamber", "caen_t0"):
+    step = run.step(name)
+    if step.status == OK and step.result:
+      results.extend(step.result)
+    elif getattr(step.error, "results", None):
+      results.extend(step.error.results) # RampDownError
+  return results
+
+def caen_ramp_report(results):
+  """
+  (summary, per-channel times) text for each RampResult.
+  """
+  # Already imported by the in-process CAEN driver that produced the results
+  from caen_shutdown import describe, channel_times
+  return [(describe(result), channel_times(result)) for result in results]
 
-    # --- End of wait loop ---
-    os.system('clear') # Clear the countdown
-
-    # Cleanup any lingering files (safety)
-    for f in [SKIP_TRIGGER_FILE, CANCEL_TRIGGER_FILE, EXTEND_TRIGGER_FILE]:
-      if os.path.exists(f):
-        try: os.remove(f)
-        except Exception as e: print(f"{COLORS.FAIL}Error cleaning up trigger file {f}: {e}{COLORS.ENDC}")
-
-    # Process wait results
-    if wait_skipped:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait skipped. Waiting 5s before final steps...{COLORS.ENDC}")
-      time.sleep(5)
-    elif run_post_wait_actions:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait finished (Timeout).{COLORS.ENDC}")
+def log_step_done(step):
+  """
+  Print the outcome and wall-clock time of a finished action step, and
+  record its span and metrics.
+  """
+  if step.duration is not None:
+    action_duration.observe(step.duration, step=step.name)
+    telemetry.record_span("action", step.start, step.end, "error" if step.status == FAILED else step.status,
+                          step.error, step=step.name, label=step.label)
+  action_outcomes_total.inc(step=step.name, outcome=step.status)
+  if step.status == OK:
+    log(f"  {COLORS.OKCYAN}(Action Log) {step.label}: done in {step.duration:.2f}s{COLORS.ENDC}")
+  elif step.status == OVERRUN:
+    backup = ", backup request sent" if step.backup_status is not None else ""
+    log(f"  {COLORS.FAIL}(Action Log) WATCHDOG: {step.label} {step.error}; abandoned{backup}, continuing.{COLORS.ENDC}")
+  elif step.status == SKIPPED:
+    log(f"  {COLORS.OKCYAN}(Action Log) {step.label}: Skipped (Canceled).{COLORS.ENDC}")
+  else:
+    log(f"  {COLORS.FAIL}(Action Log) ERROR: {step.label} failed after {step.duration:.2f}s: {step.error}{COLORS.ENDC}")
+
+STEP_COLORS = {
+  PENDING: COLORS.DIM,
+  RUNNING: COLORS.OKCYAN,
+  OK: COLORS.OKGREEN,
+  FAILED: COLORS.FAIL,
+  SKIPPED: COLORS.DIM,
+  OVERRUN: COLORS.FAIL,
+}
+
+def action_progress_lines(steps):
+  """
+  One dashboard line per action step with its live state and duration.
+  """
+  lines = [f"{COLORS.OKCYAN}{COLORS.BOLD}--- ACTION SEQUENCE ---{COLORS.ENDC}"]
+  for step in steps:
+    if step.status == RUNNING:
+      timing = f" ({time.time() - step.start:.0f}s)"
+    elif step.duration is not None:
+      timing = f" ({step.duration:.2f}s)"
     else:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 4: Wait Canceled by user.{COLORS.ENDC}")
+      timing = ""
+    lines.append(f"  {STEP_COLORS[step.status]}{step.status.upper():<8}{COLORS.ENDC} {step.label}{timing}")
+  return lines
 
-    # +--------------------------------------------+
-    # | Action 5: Turn off Kikusui .45 (Post-Wait) |
-    # +--------------------------------------------+
-    if run_post_wait_actions:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 5: Turning off Kikusui BLC2 (IP: 45)...{COLORS.ENDC}")
-      try:
-        subprocess.run(["python3", KIKUSUI_SCRIPT_PATH, "45", "off"], check=True)
-      except Exception as e:
-        error_msg = f"Action 5 (Kikusui Off for .45) failed: {e}"
-        print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-        error_messages.append(error_msg)
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 5: Kikusui .45 OFF command sent.{COLORS.ENDC}")
+def overrun_report(run):
+  """
+  One line per step the watchdog gave up on: its limit, the backup outcome
+  and what the abandoned call did afterwards (as far as known now).
+  """
+  lines = []
+  for step in run.overruns():
+    line = f"{step.label}: {step.error}"
+    if step.backup_status == OK:
+      line += "; backup request succeeded"
+    elif step.backup_status == FAILED:
+      line += f"; backup request failed: {step.backup_error}"
+    elif step.backup_status == RUNNING:
+      line += "; backup request still running"
+    if step.late_status == OK:
+      line += f"; the original call finished {step.late_end - step.start:.1f}s after start"
+    elif step.late_status == FAILED:
+      line += f"; the original call failed after {step.late_end - step.start:.1f}s: {step.late_error}"
     else:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 5: Skipped (Canceled).{COLORS.ENDC}")
+      line += "; the original call is still hanging"
+    lines.append(line)
+  return lines
 
+def run_actions(drivers, pre_wait_only=False, resume=None):
+  """
+  Run the shutdown action graph. Independent steps run in parallel; the wait
+  (Action 4) can be skipped, canceled, or extended from the control channel.
+  pre_wait_only runs just Actions 1-3 (early-warning 'prewait' mode).
 
-    # +----------------------------------------+
-    # | Action 6: Run uhubctl REMOTELY via SSH |
-    # +----------------------------------------+
-    if run_post_wait_actions:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 6: Running remote uhubctl commands (USB OFF)...{COLORS.ENDC}")
-      try:
-        for host in TARGET_PI_HOSTS:
-          print(f"  {COLORS.OKCYAN}(Action Log)   Targeting Host: {host}{COLORS.ENDC}")
-          for cmd in REMOTE_COMMANDS_TO_RUN:
-            ssh_command_list = [
-                "ssh", "-T",
-                "-o", "StrictHostKeyChecking=no",
-                f"{TARGET_PI_USER}@{host}",
-                cmd
-            ]
-            print(f"  {COLORS.OKCYAN}(Action Log)     Executing: {' '.join(ssh_command_list)}{COLORS.ENDC}")
-            subprocess.run(ssh_command_list, check=True)
-        print(f"  {COLORS.OKCYAN}(Action Log) Action 6: Remote uhubctl commands finished.{COLORS.ENDC}")
-      except Exception as e:
-        error_msg = f"Action 6 (uhubctl) failed: {e}"
-        print(f"  {COLORS.FAIL}(Action Log) ERROR: {error_msg}{COLORS.ENDC}")
-        error_messages.append(error_msg)
-    else:
-      print(f"  {COLORS.OKCYAN}(Action Log) Action 6: Skipped (Canceled).{COLORS.ENDC}")
+  The state is checkpointed when the sequence starts and after every step.
+  'resume' is the state loaded from the checkpoint of an interrupted
+  sequence: its finished steps are not run again.
+  """
+  if not action_lock.acquire(blocking=False):
+    log(f"  {COLORS.FAIL}(Action Log) ERROR: Could not acquire lock, actions already running.{COLORS.ENDC}")
+    return
 
+  state = new_sequence_state(pre_wait_only) if resume is None else resume
+  completed = {name: (step["start"], step["end"]) for name, step in state["steps"].items() if step["status"] == OK}
+  # Every span of this sequence (also from device scripts) carries its id
+  telemetry.spans.context["sequence"] = state["sequence"]
+  sequence_start = state["started"]
+  result = "error"
+  overruns = []
 
-    # +-------------------------------------+ 
+  def on_step_done(step):
+    log_step_done(step)
+    save_checkpoint(state, step)
+
+  try:
+    if resume is None:
+      log(f"  {COLORS.OKCYAN}(Action Log) --- Starting Action Sequence (Lock Acquired) ---{COLORS.ENDC}")
+    else:
+      log(f"  {COLORS.OKCYAN}(Action Log) --- Resuming Action Sequence {state['sequence']} "
+          f"({len(completed)} steps already done, Lock Acquired) ---{COLORS.ENDC}")
+    save_checkpoint(state)
+
+    if SSH_PREOPEN_ON_ALERT:
+      preopen(remote_hosts.values())
+
+    steps, pre_wait_steps = build_action_graph(state, drivers, pre_wait_only)
+    fence_steps(steps)
+    overrun_on_child_timeout(steps)
+    dashboard.set_section("actions", lambda: action_progress_lines(steps))
+    run = run_graph(steps, max_workers=MAX_PARALLEL_ACTIONS, on_step_done=on_step_done, completed=completed)
+    overruns = overrun_report(run)
+    # A resumed sequence is timed from its original start
+    origin = run.start if resume is None else sequence_start
+    sequence_duration = run.end - origin
+
+    # Store error messages for the final report
+    error_messages = [f"{step.label} failed: {step.error}" for step in run.failed()]
+    pre_wait_duration = max(run.step(name).end for name in pre_wait_steps) - origin
+
+    log(f"  {COLORS.OKCYAN}(Action Log) Step timings:{COLORS.ENDC}")
+    for line in run.timing_lines():
+      log(f"  {COLORS.OKCYAN}(Action Log)   {line}{COLORS.ENDC}")
+    log(f"  {COLORS.OKCYAN}(Action Log) Pre-wait steps finished in {pre_wait_duration:.2f}s; whole sequence took {sequence_duration:.1f}s.{COLORS.ENDC}")
+    ramp_results = caen_ramp_results(run)
+    ramp_report = caen_ramp_report(ramp_results) if ramp_results else []
+    for ramp, (summary, _) in zip(ramp_results, ramp_report):
+      color = COLORS.FAIL if ramp.stuck else COLORS.OKCYAN
+      log(f"  {color}(Action Log) CAEN ramp-down: {summary}{COLORS.ENDC}")
+
+    # +-------------------------------------+
     # | Action 7: Send Discord notification |
-    # +-------------------------------------+ 
-    print(f"  {COLORS.OKCYAN}(Action Log) Action 7: Sending Discord notification...{COLORS.ENDC}")
+    # +-------------------------------------+
+    log(f"  {COLORS.OKCYAN}(Action Log) Action 7: Sending Discord notification...{COLORS.ENDC}")
 
     # Construct the final status message
     status_summary = ""
-    if not run_post_wait_actions:
+    result = "failed" if error_messages else "ok"
+    if pre_wait_only:
+      if error_messages:
+        status_summary = f"Pre-wait steps (Actions 1-3) after early warning FAILED: {'; '.join(error_messages)}"
+      else:
+        status_summary = f"Pre-wait steps (Actions 1-3) after early warning executed successfully."
+    elif not state["run_post_wait_actions"]:
+      result = "canceled"
       status_summary = f"Process CANCELED by user. Ran Actions 1-3 (HV, MassFlow, Kikusui .42, CAENs), but Actions 5-6 (Kikusui .45, uhubctl) were NOT executed."
     elif error_messages:
       errors_str = "; ".join(error_messages)
       status_summary = f"Process FAILED. Errors occurred: {errors_str}"
     else:
       status_summary = f"Process complete. All actions (1-6) executed successfully."
+    status_summary += f" (Actions 1-3 took {pre_wait_duration:.1f}s, whole sequence {sequence_duration:.0f}s)"
+    if resume is not None:
+      status_summary += f"\nResumed after a monitor restart or failover; {len(run.completed)} step(s) had finished before it."
+    if overruns:
+      status_summary += f"\nWATCHDOG: {len(overruns)} step(s) overran (time-to-safe deadline {TIME_TO_SAFE_DEADLINE_SECONDS}s):"
+      for line in overruns:
+        status_summary += f"\n- {line}"
+    if ramp_report:
+      status_summary += "\nCAEN ramp-down (readback, channel:seconds):"
+      for summary, times in ramp_report:
+        status_summary += f"\n- {summary}"
+        if times:
+          status_summary += f"\n  {times}"
 
     send_discord_notification(status_summary, log_prefix="Action 7") # Send the constructed message
 
-    print(f"  {COLORS.OKCYAN}(Action Log) --- Action Sequence Finished ---{COLORS.ENDC}")
+    log(f"  {COLORS.OKCYAN}(Action Log) --- Action Sequence Finished ---{COLORS.ENDC}")
 
   finally:
+    sequences_total.inc(result=result, mode="prewait" if pre_wait_only else "full")
+    telemetry.record_span("sequence", sequence_start, time.time(), result, pre_wait_only=pre_wait_only,
+                          resumed=resume is not None)
+    telemetry.spans.context.pop("sequence", None)
+    clear_checkpoint()
+    # Log out of the CAEN crate (the next sequence logs in again). An abandoned
+    # call may still hold a device session, so then do not wait for it.
+    if overruns:
+      threading.Thread(target=drivers.close, name="drivers-close", daemon=True).start()
+    else:
+      drivers.close()
+    # Close the SSH master connections opened for this sequence
+    # (kept open after an early-warning run, for the full sequence that may follow)
+    if not pre_wait_only:
+      for remote in remote_hosts.values():
+        remote.close()
     # Show cursor again just in case loop was exited abnormally
     print("\033[?25h", end="")
     action_lock.release()
-    print(f"  {COLORS.OKCYAN}(Action Log) Lock Released.{COLORS.ENDC}")
+    log(f"  {COLORS.OKCYAN}(Action Log) Lock Released.{COLORS.ENDC}")
+    dashboard.clear_section("actions")
+
+def powered_ports(output):
+  """
+  Port numbers that uhubctl's status output lists as powered
+  ('  Port 2: 0503 power highspeed enable connect ...').
+  """
+  ports = set()
+  for line in output.splitlines():
+    match = re.match(r"\s*Port (\d+): [0-9a-fA-F]{4} (\S+)", line)
+    if match and match.group(2) == "power":
+      ports.add(int(match.group(1)))
+  return ports
+
+def restore_remote_uhubctl(host):
+  """
+  Restore Action 6 for one Pi: power the hub ports on in one SSH session,
+  then confirm with uhubctl's port status.
+  """
+  remote = remote_hosts[host]
+  remote.run(REMOTE_RESTORE_COMMANDS, timeout=child_timeout(RESTORE_BUDGET_SECONDS["uhubctl"]))
+  powered = powered_ports(remote.output(REMOTE_PORT_STATUS_COMMAND, timeout=child_timeout(RESTORE_BUDGET_SECONDS["uhubctl"])))
+  missing = [port for port in RESTORE_HUB_PORTS if port not in powered]
+  if missing:
+    raise RuntimeError(f"{host}: hub ports {', '.join(map(str, missing))} still unpowered after the power-on commands")
+  return f"hub ports {', '.join(map(str, RESTORE_HUB_PORTS))} read back as powered"
+
+def restore_kikusui(drivers, ip_last):
+  """
+  Switch one supply on and confirm the output state and voltage (OUTP?, MEAS:VOLT?).
+  """
+  drivers.kikusui.on(ip_last, timeout=child_timeout())
+  output_on, voltage, current = drivers.kikusui.status(ip_last, timeout=child_timeout())
+  if not output_on or abs(voltage - KIKUSUI_VOLTAGE_ON) > KIKUSUI_VOLTAGE_TOLERANCE_V:
+    raise RuntimeError(f"Kikusui .{ip_last} reads back output {'ON' if output_on else 'OFF'}, "
+                       f"{voltage:.3f} V (expected ON, {KIKUSUI_VOLTAGE_ON:.1f} V)")
+  return f"output ON, {voltage:.3f} V, {current:.3f} A"
+
+def restore_hv(drivers, ip_last):
+  switch_hv_ports(drivers.hv.turn_on_ports, ip_last)
+  return f"TURN_ON acknowledged by ports {', '.join(map(str, HV_PORT_IDS))} (no state readback in the controller API)"
+
+def restore_massflow(script):
+  run_command(["python3", script, "on"], timeout=child_timeout(RESTORE_BUDGET_SECONDS["massflow"]))
+  return "script exited 0 (no readback available)"
+
+def restore_caen(restore):
+  """
+  Run a CAEN group restore and summarize its ramp-up readback.
+  """
+  results = restore(timeout=child_timeout())
+  if not results:
+    return "Pw/VMon confirmed by caen_shutdown.py --restore"
+  return "; ".join(summary for summary, _ in caen_ramp_report(results))
+
+# Set by an alert: restore steps that have not started yet are skipped
+restore_abort = threading.Event()
+# asyncio task of the running power restore, if any
+restore_task = None
+
+def build_restore_graph(drivers):
+  """
+  The shutdown graph in reverse. The post-wait devices (Pi USB hub ports,
+  Kikusui .45) come back first. Once all of them are confirmed, every
+  device that Actions 1-3 switched off is restored in parallel. A step whose
+  prerequisites were not confirmed is skipped, and an alert skips every
+  step that has not started yet.
+  """
+  steps = []
+  budgets = RESTORE_BUDGET_SECONDS
+  by_name = {}
+  not_aborted = lambda: not restore_abort.is_set()
+
+  # Reverse of Actions 5-6
+  for host in TARGET_PI_HOSTS:
+    steps.append(Step(f"uhubctl_{host}", lambda host=host: restore_remote_uhubctl(host),
+                      label=f"Restore 6 (uhubctl on {host})", enabled=not_aborted, budget=budgets["uhubctl"]))
+  steps.append(Step("kikusui_45", lambda: restore_kikusui(drivers, 45),
+                    label="Restore 5 (Kikusui On for .45)", enabled=not_aborted, budget=budgets["kikusui"]))
+  first = [step.name for step in steps]
+  confirmed = lambda: not_aborted() and all(by_name[name].status == OK for name in first)
+
+  # Reverse of Actions 1-3
+  for ip_last in HV_CONTROLLER_IP_LASTS:
+    steps.append(Step(f"hv_{ip_last}", lambda ip_last=ip_last: restore_hv(drivers, ip_last),
+                      deps=first, enabled=confirmed, label=f"Restore 1 (HV On .{ip_last})", budget=budgets["hv"]))
+  for name, script in (("massflow_out", MASSFLOW_OUT_SCRIPT_PATH), ("massflow_in", MASSFLOW_IN_SCRIPT_PATH)):
+    steps.append(Step(name, lambda script=script: restore_massflow(script),
+                      deps=first, enabled=confirmed, label=f"Restore 2 (Mass Flow Start, {name.split('_')[1]})",
+                      budget=budgets["massflow"]))
+  steps.append(Step("kikusui_42", lambda: restore_kikusui(drivers, 42),
+                    deps=first, enabled=confirmed, label="Restore 3 (Kikusui On for .42)", budget=budgets["kikusui"]))
+  steps.append(Step("caen_chamber", lambda: restore_caen(drivers.caen.restore_chamber),
+                    deps=first, enabled=confirmed, label="Restore 3 (CAEN HV Chamber On)",
+                    budget=budgets["caen_chamber"]))
+  caen_t0_deps = ("caen_chamber",) if drivers.caen.mode == SUBPROCESS else ()
+  steps.append(Step("caen_t0", lambda: restore_caen(drivers.caen.restore_t0),
+                    deps=first + list(caen_t0_deps), enabled=confirmed, label="Restore 3 (CAEN HV T0 On)",
+                    budget=budgets["caen_t0"]))
+
+  by_name.update((step.name, step) for step in steps)
+  apply_health(steps)
+  return steps
+
+def restore_report(steps):
+  """
+  One line per restore step: its readback, or why it failed or was skipped.
+  """
+  lines = []
+  for step in steps:
+    if step.status == OK:
+      lines.append(f"{step.label}: {step.result} ({step.duration:.1f}s)")
+    elif step.status == SKIPPED:
+      reason = "aborted by an alert" if restore_abort.is_set() else "prerequisite not confirmed"
+      lines.append(f"{step.label}: SKIPPED ({reason})")
+    else:
+      lines.append(f"{step.label}: {step.status.upper()}: {step.error}")
+  return lines
+
+def run_restore(drivers):
+  """
+  Power restore after an incident: run the restore graph, confirm every
+  step by readback and report the total time to restore.
+  """
+  if not action_lock.acquire(blocking=False):
+    log(f"  {COLORS.FAIL}(Restore Log) ERROR: Could not acquire lock, actions already running.{COLORS.ENDC}")
+    return
+
+  telemetry.spans.context["sequence"] = f"restore-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+  restore_start = time.time()
+  result = "error"
+  overruns = []
+
+  try:
+    log(f"  {COLORS.OKCYAN}(Restore Log) --- Starting Power Restore (Lock Acquired) ---{COLORS.ENDC}")
+    preopen(remote_hosts.values())
+    steps = build_restore_graph(drivers)
+    fence_steps(steps)
+    overrun_on_child_timeout(steps)
+    dashboard.set_section("actions", lambda: action_progress_lines(steps))
+    run = run_graph(steps, max_workers=MAX_PARALLEL_ACTIONS, on_step_done=log_step_done)
+    overruns = run.overruns()
+
+    report = restore_report(steps)
+    failed = run.failed()
+    skipped = [step for step in steps if step.status == SKIPPED]
+    if restore_abort.is_set():
+      result = "aborted"
+      headline = "Power restore ABORTED by an alert"
+    elif failed or skipped:
+      result = "failed"
+      headline = f"Power restore INCOMPLETE: {len(failed)} step(s) failed, {len(skipped)} skipped"
+    else:
+      result = "ok"
+      headline = "Power restore complete: every step confirmed"
+    restore_seconds.observe(run.duration, result=result)
+
+    color = COLORS.OKCYAN if result == "ok" else COLORS.FAIL
+    log(f"  {color}(Restore Log) {headline} (time to restore {run.duration:.1f}s).{COLORS.ENDC}")
+    for line in report:
+      log(f"  {COLORS.OKCYAN}(Restore Log)   {line}{COLORS.ENDC}")
+    send_discord_notification(f"{headline} (time to restore {run.duration:.1f}s)\n" + "\n".join(f"- {line}" for line in report),
+                              log_prefix="Restore")
+
+  finally:
+    sequences_total.inc(result=result, mode="restore")
+    telemetry.record_span("restore", restore_start, time.time(), result)
+    telemetry.spans.context.pop("sequence", None)
+    if overruns:
+      threading.Thread(target=drivers.close, name="drivers-close", daemon=True).start()
+    else:
+      drivers.close()
+    for remote in remote_hosts.values():
+      remote.close()
+    action_lock.release()
+    log(f"  {COLORS.OKCYAN}(Restore Log) Lock Released.{COLORS.ENDC}")
+    dashboard.clear_section("actions")
+
+def start_restore(drivers):
+  """
+  Start run_restore on the running loop (kept out of sequence_tasks, so an
+  alert still starts the full shutdown sequence, once the restore stops).
+  """
+  global restore_task
+  restore_abort.clear()
+  restore_task = asyncio.get_running_loop().create_task(asyncio.to_thread(run_restore, drivers))
+  return restore_task
+
+def restore_running():
+  return restore_task is not None and not restore_task.done()
+
+def status_field_lines(snapshot, columns=2):
+  """
+  Lay out every parsed status field as 'key: value' in columns.
+  """
+  cells = [f"{key + ':':<16}{'-' if value is None else value!s:>10}" for key, value in snapshot.items()]
+  rows = (len(cells) + columns - 1) // columns
+  return ["   ".join(cells[row + col * rows] for col in range(columns) if row + col * rows < len(cells))
+          for row in range(rows)]
+
+def record_time_line(snapshot):
+  """
+  'Record time' dashboard line with the record's age (red when stale).
+  """
+  age = snapshot.age() if snapshot is not None else None
+  if age is None:
+    return f"{COLORS.DIM}Record time: {snapshot.time_str if snapshot else '-'}{COLORS.ENDC}"
+  if age > STALE_AFTER_SECONDS:
+    return f"{COLORS.FAIL}Record time: {snapshot.time_str} (STALE: {age:.0f}s old){COLORS.ENDC}"
+  return f"{COLORS.DIM}Record time: {snapshot.time_str} ({max(0.0, age):.0f}s old){COLORS.ENDC}"
+
+def check_staleness(snapshot, stale):
+  """
+  Update the freshness metric from the last good snapshot and raise or
+  clear the stale-data alarm. Returns the new alarm state.
+  """
+  age = snapshot.age() if snapshot is not None else None
+  if age is None:
+    return stale
+  status_age.set(round(age, 3))
+  now_stale = age > STALE_AFTER_SECONDS
+  if now_stale and not stale:
+    log(f"{COLORS.FAIL}{COLORS.BOLD}STALE DATA: status record not updated for {age:.0f}s (record time {snapshot.time_str}).{COLORS.ENDC}")
+    send_discord_notification(f"STALE DATA: the LH2 status file has not been updated for {age:.0f}s "
+                              f"(record time {snapshot.time_str}). Alert_H2leak cannot be trusted until the logger writes again.",
+                              log_prefix="Stale Data")
+  elif stale and not now_stale:
+    log(f"{COLORS.OKBLUE}Status record is fresh again (record time {snapshot.time_str}).{COLORS.ENDC}")
+    send_discord_notification(f"OK: the LH2 status file is updated again (record time {snapshot.time_str}).",
+                              log_prefix="Stale Data")
+  status_stale.set(int(now_stale))
+  return now_stale
+
+def update_status_screen(filepath, watcher, snapshot, last_status, engine=None, sampling=None):
+  """
+  Refresh the status and field sections of the dashboard and redraw.
+  """
+  if last_status == '1':
+    status_color = COLORS.WARNING
+    status_text = "ALERT DETECTED"
+  else:
+    status_color = COLORS.OKGREEN
+    status_text = "Normal"
+
+  if watcher.last_latency is not None:
+    watcher_text = f"Watcher: {watcher.backend} (last detection latency: {watcher.last_latency * 1000:.1f} ms)"
+  else:
+    watcher_text = f"Watcher: {watcher.backend}"
+
+  lines = [
+    f"{COLORS.HEADER}--- LH2 MONITOR ---{COLORS.ENDC}",
+    f"Status (Alert_H2leak): {status_color}{last_status} ({status_text}){COLORS.ENDC}",
+    record_time_line(snapshot),
+    f"{COLORS.DIM}Monitoring file: {filepath}{COLORS.ENDC}",
+    f"{COLORS.DIM}Last check: {time.ctime()}{COLORS.ENDC}",
+    f"{COLORS.DIM}{watcher_text}{COLORS.ENDC}",
+  ]
+  if sampling:
+    lines.append(f"{COLORS.DIM}{sampling}{COLORS.ENDC}")
+  if lease is not None:
+    role_color = COLORS.OKGREEN if lease.held() else COLORS.WARNING
+    lines.append(f"Role: {role_color}{lease.describe()}{COLORS.ENDC}")
+  lines.append("(Monitoring... Ctrl+C to stop)")
+  dashboard.set_section("status", lines)
+  if snapshot is not None:
+    dashboard.set_section("fields", status_field_lines(snapshot))
+  if engine is not None:
+    dashboard.set_section("rules", lambda: rule_lines(engine))
+  if prober is not None:
+    dashboard.set_section("health", health_lines)
+  dashboard.render()
+
+def open_recorder():
+  """
+  Open the status history ring file, or return None if it is unavailable.
+  """
+  if StatusRecorder is None:
+    log(f"{COLORS.WARNING}numpy not installed: status history is not recorded.{COLORS.ENDC}")
+    return None
+  try:
+    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+    recorder = StatusRecorder(HISTORY_FILE, flush_interval=HISTORY_FLUSH_INTERVAL_SECONDS)
+  except (OSError, ValueError) as e:
+    log(f"{COLORS.FAIL}Cannot open status history {HISTORY_FILE}: {e}{COLORS.ENDC}")
+    return None
+  log(f"{COLORS.HEADER}Recording status history to {HISTORY_FILE} ({recorder.count} records){COLORS.ENDC}")
+  return recorder
+
+def open_detector():
+  """
+  Build the early-warning detector, or return None if it is disabled.
+  """
+  if DETECTOR_MODE == "off":
+    return None
+  if RollingDetector is None:
+    log(f"{COLORS.WARNING}numpy not installed: early-warning detector disabled.{COLORS.ENDC}")
+    return None
+  detector = RollingDetector([Channel(*c) for c in DETECTOR_CHANNELS], window=DETECTOR_WINDOW,
+                             z_limit=DETECTOR_Z_LIMIT, confirm=DETECTOR_CONFIRM)
+  log(f"{COLORS.HEADER}Early-warning detector: mode '{DETECTOR_MODE}', window {DETECTOR_WINDOW} samples{COLORS.ENDC}")
+  return detector
+
+def check_early_warning(detector, snapshot, drivers):
+  """
+  Feed a new snapshot to the detector; on a finding, send a pre-alert and
+  (in 'prewait' mode) start the pre-wait shutdown steps.
+  """
+  findings = detector.update_snapshot(snapshot, time.time())
+  if not findings:
+    return
+  text = "; ".join(describe_finding(f) for f in findings)
+  log(f"{COLORS.WARNING}{COLORS.BOLD}PRE-ALERT: {text}{COLORS.ENDC}")
+  if not is_primary():
+    return
+  send_discord_notification(f"PRE-ALERT (early warning, Alert_H2leak not set yet): {text}", log_prefix="Pre-Alert")
+  if not action_lock.locked():
+    warm_connections(drivers)
+  if DETECTOR_MODE == "prewait" and not action_lock.locked():
+    log(f"{COLORS.WARNING}Starting pre-wait shutdown steps (Actions 1-3) in background...{COLORS.ENDC}")
+    start_sequence(drivers, pre_wait_only=True)
+
+def open_telemetry():
+  """
+  Start the span log (also used by device scripts run as subprocesses) and
+  the metrics exporter. Returns the exporter, or None if disabled.
+  """
+  if SPAN_LOG_PATH:
+    try:
+      telemetry.spans.configure(SPAN_LOG_PATH, SPAN_LOG_MAX_BYTES, SPAN_LOG_BACKUPS)
+      os.environ[telemetry.SPAN_LOG_ENV] = SPAN_LOG_PATH
+      log(f"{COLORS.HEADER}Timing spans: {SPAN_LOG_PATH}{COLORS.ENDC}")
+    except OSError as e:
+      log(f"{COLORS.FAIL}Cannot open span log {SPAN_LOG_PATH}: {e}{COLORS.ENDC}")
+  if not METRICS_TEXTFILE and METRICS_HTTP_PORT is None:
+    return None
+  try:
+    exporter = MetricsExporter(metrics, METRICS_TEXTFILE, METRICS_INTERVAL_SECONDS, METRICS_HTTP_PORT)
+  except OSError as e:
+    log(f"{COLORS.FAIL}Cannot start metrics endpoint on port {METRICS_HTTP_PORT}: {e}{COLORS.ENDC}")
+    return None
+  exporter.start()
+  targets = [t for t in (METRICS_TEXTFILE, METRICS_HTTP_PORT and f"http://127.0.0.1:{METRICS_HTTP_PORT}/metrics") if t]
+  log(f"{COLORS.HEADER}Metrics: {', '.join(targets)}{COLORS.ENDC}")
+  return exporter
+
+# Running action sequences; each is an asyncio task whose blocking device
+# calls run in a worker thread, so the loop stays free for the status watch
+sequence_tasks = set()
+
+def start_sequence(drivers, pre_wait_only=False, resume=None):
+  """
+  Start run_actions as a task on the running loop.
+  """
+  task = asyncio.get_running_loop().create_task(asyncio.to_thread(run_actions, drivers, pre_wait_only, resume))
+  task.pre_wait_only = pre_wait_only
+  sequence_tasks.add(task)
+  task.add_done_callback(sequence_tasks.discard)
+  return task
+
+# Full sequence waiting for an early-warning (pre-wait only) run or a restore to finish
+full_sequence_queued = False
+# Alert_H2leak as last seen by the monitor loop ('0', '1', or None if unreadable)
+alert_status = None
+# Cause of an alert seen as standby, until the primary is seen to act on it
+standby_alert = None
+
+def raise_alert(drivers, cause):
+  """
+  Start the full action sequence for an alert, or note that it is already
+  running (or queued behind an early-warning run). A standby only notes
+  the alert, in case it takes over before the primary acted on it.
+  """
+  global full_sequence_queued, standby_alert
+  if not is_primary():
+    log(f"{COLORS.WARNING}{cause}: standby monitor, the primary ({lease.owner or 'unknown'}) runs the sequence.{COLORS.ENDC}")
+    standby_alert = cause
+    return
+  full_sequence_running = any(not task.pre_wait_only for task in sequence_tasks)
+  if not full_sequence_running and not full_sequence_queued:
+    # --- Send initial alert notification ---
+    log(f"{COLORS.WARNING}Sending initial alert to Discord...{COLORS.ENDC}")
+    send_discord_notification(f"ALERT: {cause}! Safety sequence initiated.", log_prefix="Initial Alert")
+    # --- END ---
+    if not action_lock.locked():
+      log(f"{COLORS.WARNING}{cause}. Starting actions in background...{COLORS.ENDC}")
+      start_sequence(drivers)
+    elif restore_running():
+      restore_abort.set()
+      log(f"{COLORS.WARNING}Power restore in progress: its remaining steps are skipped; the full sequence starts when it stops.{COLORS.ENDC}")
+      full_sequence_queued = True
+    else:
+      log(f"{COLORS.WARNING}Early-warning run in progress; the full sequence starts when it is done.{COLORS.ENDC}")
+      full_sequence_queued = True
+  else:
+    # Raised again while the sequence is running: it just goes on
+    log(f"{COLORS.WARNING}Action sequence already running; not starting another one.{COLORS.ENDC}")
+    send_discord_notification(f"ALERT: {cause} again while the safety sequence is running; it continues.",
+                              log_prefix="Initial Alert")
+
+def resume_sequence(drivers):
+  """
+  Resume the action sequence left in the checkpoint by a monitor that was
+  killed while running it. Returns the resumed mode ("full" or "prewait"),
+  or None. An unreadable or too old checkpoint is moved aside and reported.
+  """
+  try:
+    state = sequence_checkpoint.load()
+  except (OSError, ValueError) as e:
+    sequence_checkpoint.discard(".bad")
+    log(f"{COLORS.FAIL}Cannot read sequence checkpoint {sequence_checkpoint.path}: {e}{COLORS.ENDC}")
+    send_discord_notification(f"WARNING: the sequence checkpoint could not be read ({e}). "
+                              "A sequence interrupted by the restart is NOT resumed; check the devices.",
+                              log_prefix="Resume")
+    return None
+  if state is None:
+    return None
+
+  # An extended wait can keep a valid checkpoint unchanged for a long time
+  last_activity = max(state["saved"], state["wait_deadline"] or 0)
+  if time.time() - last_activity > CHECKPOINT_MAX_AGE_SECONDS:
+    sequence_checkpoint.discard()
+    log(f"{COLORS.WARNING}Sequence checkpoint from {time.ctime(state['saved'])} is too old; not resumed.{COLORS.ENDC}")
+    send_discord_notification(f"WARNING: found the checkpoint of a safety sequence started {time.ctime(state['started'])} "
+                              f"and last saved {time.ctime(state['saved'])}; too old, NOT resumed.", log_prefix="Resume")
+    return None
+
+  done = [name for name, step in state["steps"].items() if step["status"] == OK]
+  message = (f"RESUMED: the safety sequence started {time.ctime(state['started'])} was interrupted by a monitor "
+             f"restart or failover. {len(done)} finished step(s) are not repeated.")
+  if state["mode"] == "full" and state["wait_deadline"] is not None and "wait" not in done:
+    message += f" Final shutdown still due at {time.ctime(state['wait_deadline'])}."
+  if not state["run_post_wait_actions"]:
+    message += " The wait had been canceled: Actions 5-6 will not run."
+  log(f"{COLORS.WARNING}{message}{COLORS.ENDC}")
+  send_discord_notification(message, log_prefix="Resume")
+  start_sequence(drivers, state["mode"] == "prewait", resume=state)
+  return state["mode"]
+
+def on_lease_change(held, detail):
+  """
+  Lease gained (detail: previous holder) or lost (detail: reason); called
+  from the lease thread. The main loop takes over the duties (take_over).
+  """
+  lease_held.set(int(held))
+  lease_epoch.set(lease.epoch if held else 0)
+  lease_changes_total.inc(change="gained" if held else "lost")
+  if not held:
+    log(f"{COLORS.FAIL}{COLORS.BOLD}Lease lost ({detail}): now STANDBY, no more device commands from this monitor.{COLORS.ENDC}")
+  elif detail is None:
+    log(f"{COLORS.HEADER}Lease acquired (epoch {lease.epoch}): this monitor is the PRIMARY.{COLORS.ENDC}")
+  else:
+    message = f"FAILOVER: {lease.node} took over as the primary LH2 monitor (lease epoch {lease.epoch}); {detail} stopped renewing the lease."
+    log(f"{COLORS.WARNING}{COLORS.BOLD}{message}{COLORS.ENDC}")
+    send_discord_notification(message, log_prefix="Failover")
+
+def open_lease():
+  """
+  Join the primary/standby pair (if LEASE_PATH is set). Blocks until the
+  lease is taken or found held by the other monitor.
+  """
+  global lease
+  if LEASE_PATH is None:
+    lease_held.set(1)
+    return
+  lease = Lease(LEASE_PATH, f"{socket.gethostname()}:{os.getpid()}", LEASE_TTL_SECONDS, LEASE_RENEW_SECONDS,
+                on_change=on_lease_change)
+  lease.start()
+  if not lease.held():
+    lease_held.set(0)
+    log(f"{COLORS.WARNING}Lease held by {lease.owner}: this monitor is the STANDBY "
+        f"(takes over within {LEASE_TTL_SECONDS + 3 * LEASE_RENEW_SECONDS}s of the primary stopping).{COLORS.ENDC}")
+
+def take_over(drivers, status):
+  """
+  Start acting as the primary (at startup, or after a failover): resume a
+  checkpointed sequence, or start one for an alert seen as standby that the
+  primary did not act on.
+  """
+  global full_sequence_queued, standby_alert
+  missed, standby_alert = standby_alert, None
+  resumed = resume_sequence(drivers)
+  if resumed == "prewait" and status == '1':
+    # The 0 -> 1 edge came while no primary was watching
+    log(f"{COLORS.WARNING}Alert_H2leak is 1: the full sequence follows the resumed early-warning run.{COLORS.ENDC}")
+    send_discord_notification("ALERT: LH2 leak flag set while the monitor was down! Safety sequence initiated.",
+                              log_prefix="Initial Alert")
+    full_sequence_queued = True
+  elif resumed is None and missed is not None:
+    raise_alert(drivers, f"{missed} (seen as standby, not handled by the old primary)")
+
+def handle_rule_events(events, drivers):
+  """
+  Log, count and notify rule events; a raised SHUTDOWN rule starts the
+  safety sequence. Rules already true at startup are only logged.
+  """
+  for event in events:
+    rule, where = event.rule, f"{event.rule.name} [{event.source}]"
+    rule_events_total.inc(rule=rule.name, source=event.source, kind=event.kind)
+    if event.kind != CHANGED:
+      rule_active.set(int(event.kind != CLEARED), rule=rule.name, source=event.source)
+    if event.kind == INITIAL:
+      log(f"{COLORS.WARNING}Rule already raised at startup: {where}: {event.detail}{COLORS.ENDC}")
+    elif event.kind == CLEARED:
+      log(f"{COLORS.OKBLUE}Rule cleared: {where}: {event.detail}{COLORS.ENDC}")
+      send_discord_notification(f"OK: rule '{rule.name}' cleared on {event.source} ({event.detail}).", log_prefix="Rule")
+    elif rule.action == SHUTDOWN:
+      log(f"{COLORS.WARNING}{COLORS.BOLD}Rule {event.kind}: {where}: {event.detail}{COLORS.ENDC}")
+      raise_alert(drivers, f"rule '{rule.name}' {event.kind} on {event.source} ({event.detail})")
+    else:
+      log(f"{COLORS.WARNING}Rule {event.kind}: {where}: {event.detail}{COLORS.ENDC}")
+      send_discord_notification(f"WARNING: rule '{rule.name}' {event.kind} on {event.source} ({event.detail}).", log_prefix="Rule")
 
-def monitor_status_change(filepath, interval):
+def rule_lines(engine):
+  """
+  Dashboard lines listing the raised rules.
+  """
+  lines = [f"{COLORS.DIM}--- Rules ({len(engine.rules)} on {1 + len(STATUS_SOURCES)} sources) ---{COLORS.ENDC}"]
+  active = engine.active()
+  if not active:
+    lines.append(f"{COLORS.OKGREEN}No rule raised{COLORS.ENDC}")
+  for name, source, since, detail in active:
+    lines.append(f"{COLORS.WARNING}{name} [{source}]{COLORS.ENDC} {detail} {COLORS.DIM}(since {time.strftime('%H:%M:%S', time.localtime(since))}){COLORS.ENDC}")
+  return lines
+
+def open_sampler(interval):
+  """
+  Build the adaptive sampler with POLLING_INTERVAL ('interval') as base rate.
+  """
+  sampler = AdaptiveSampler(interval, BURST_INTERVAL_SECONDS, SAMPLING_CHANNELS, SAMPLING_FLAGS,
+                            quiet=BURST_QUIET_RECORDS, hold=BURST_HOLD_SECONDS)
+  sampling_interval.set(sampler.interval)
+  sampling_burst.set(0)
+  return sampler
+
+def check_sampling(sampler, snapshot):
+  """
+  Feed a new snapshot to the adaptive sampler and log mode switches.
+  """
+  if not sampler.update(snapshot):
+    return
+  if sampler.burst:
+    sampling_bursts_total.inc()
+    log(f"{COLORS.OKCYAN}Burst sampling every {sampler.interval}s: {sampler.reason}{COLORS.ENDC}")
+  else:
+    log(f"{COLORS.OKCYAN}Channels steady again: sampling every {sampler.interval}s.{COLORS.ENDC}")
+  sampling_burst.set(int(sampler.burst))
+  sampling_interval.set(sampler.interval)
+
+def sampling_text(sampler, stats):
+  """
+  One dashboard line: sampling mode, read rate and worst detection latency.
+  """
+  if sampler.burst:
+    text = f"Sampling: burst every {sampler.interval}s ({sampler.reason})"
+  else:
+    text = f"Sampling: every {sampler.interval}s"
+  text += f", {stats.read_rate():.2f} reads/s"
+  worst = stats.worst_latency()
+  if worst is not None:
+    text += f", worst detection {worst * 1000:.1f} ms"
+  return text
+
+async def watch_source(name, filepath, interval, engine, drivers):
+  """
+  Follow one of the STATUS_SOURCES files and check the rules on each new
+  snapshot. One task per file on the monitor loop (the reads run in a
+  worker thread); a read failure is logged when it starts and when it
+  ends, not on every poll.
+  """
+  watcher = StatusWatcher(filepath, interval)
+  reader = StatusFileReader(filepath)
+  log(f"{COLORS.HEADER}Rule source '{name}': {filepath} ({watcher.describe()}){COLORS.ENDC}")
+  failing = None
+  changed = True
+  try:
+    while True:
+      if changed or failing:
+        parse_count = reader.parse_count
+        try:
+          snapshot = await asyncio.to_thread(reader.read)
+        except (OSError, ValueError) as e:
+          outcome = "torn" if isinstance(e, TornReadError) else "error"
+          source_reads_total.inc(source=name, outcome=outcome)
+          if failing is None:
+            log(f"{COLORS.FAIL}Rule source '{name}': cannot read {filepath}: {e}{COLORS.ENDC}")
+          failing = outcome
+        else:
+          source_reads_total.inc(source=name, outcome="ok")
+          if failing:
+            log(f"{COLORS.OKBLUE}Rule source '{name}': readable again.{COLORS.ENDC}")
+            failing = None
+          if reader.parse_count != parse_count:
+            handle_rule_events(engine.evaluate(name, snapshot), drivers)
+      changed = await watcher.wait_async(interval)
+  finally:
+    watcher.close()
+
+async def poll(watcher, sampler, stats, status):
+  """
+  One monitor loop wait: record the loop metrics, then wait for a change
+  of the status file (True) or the sampler's current interval (False).
+  """
+  global alert_status
+  alert_status = status
+  polls_total.inc()
+  alert_state.set(-1 if status is None else int(status))
+  changed = await watcher.wait_async(sampler.interval)
+  stats.read()
+  if changed and watcher.last_latency is not None:
+    detection_latency.observe(watcher.last_latency)
+    stats.detected(watcher.last_latency)
+  read_rate.set(round(stats.read_rate(), 3))
+  worst = stats.worst_latency()
+  if worst is not None:
+    worst_detection_latency.set(round(worst, 6))
+  return changed
+
+async def monitor_status_change(filepath, interval, drivers):
   """
   Monitors the 'Alert_H2leak' value for a change from '0' to '1'.
+
+  Everything runs on one asyncio loop: the status file watch (this
+  coroutine), the control socket and trigger files, and the action
+  sequences (tasks whose device calls run in worker threads). Status
+  changes are therefore processed and shown while a sequence is running.
   """
-  print(f"{COLORS.HEADER}Monitoring started: {filepath} (Interval: {interval}s){COLORS.ENDC}")
-  print(f"{COLORS.HEADER}Will trigger actions on 'Alert_H2leak:' -> '1' change. (Ctrl+C to stop){COLORS.ENDC}")
+  watcher = StatusWatcher(filepath, interval)
+  reader = StatusFileReader(filepath)
+  recorder = open_recorder()
+  detector = open_detector()
+  control_server, trigger_watcher = await open_control_channel(drivers)
+  exporter = open_telemetry()
+  global prober, full_sequence_queued, standby_alert
+  open_lease()
+  prober = open_prober(drivers)
+  engine = RuleEngine(RULES)
+  sampler = open_sampler(interval)
+  stats = SamplingStats(SAMPLING_STATS_WINDOW_SECONDS)
+  source_tasks = [asyncio.create_task(watch_source(name, path, interval, engine, drivers))
+                  for name, path in STATUS_SOURCES.items()]
+
+  def on_new_snapshot(new_snapshot):
+    if recorder is not None:
+      recorder.append(new_snapshot)
+    if detector is not None:
+      check_early_warning(detector, new_snapshot, drivers)
+    handle_rule_events(engine.evaluate(MAIN_SOURCE, new_snapshot), drivers)
+    check_sampling(sampler, new_snapshot)
+
+  log(f"{COLORS.HEADER}Monitoring started: {filepath} (Interval: {interval}s, burst: {BURST_INTERVAL_SECONDS}s){COLORS.ENDC}")
+  log(f"{COLORS.HEADER}Watcher backend: {watcher.describe()}{COLORS.ENDC}")
+  log(f"{COLORS.HEADER}Will trigger actions on 'Alert_H2leak:' -> '1' change. (Ctrl+C to stop){COLORS.ENDC}")
+  log(f"{COLORS.HEADER}Rules: {len(RULES)} ({', '.join(r.name for r in RULES)}){COLORS.ENDC}")
 
   last_status = '0'
-  initial_content = read_h2_alert_status(filepath)
+  snapshot = await read_status_snapshot(reader, on_new_snapshot)
+  initial_content = h2_alert_status(snapshot)
   if initial_content is not None:
     last_status = initial_content
-    print(f"Current initial state (Alert_H2leak): '{last_status}'")
+    log(f"Current initial state (Alert_H2leak): '{last_status}'")
   else:
-    print(f"{COLORS.FAIL}File not found or key missing. Assuming '{last_status}' state.{COLORS.ENDC}")
+    log(f"{COLORS.FAIL}File not found or key missing. Assuming '{last_status}' state.{COLORS.ENDC}")
+
+  current_status = initial_content
+  file_changed = False
+  full_sequence_queued = False
+  # Set on the first loop pass (or failover) by take_over
+  primary = False
+  # Last successfully read record, for the stale-data check
+  good_snapshot = snapshot
+  stale = False
 
   try:
     while True:
 
-      # If actions are running, the 'run_actions' function controls the screen
-      if action_lock.locked():
-        time.sleep(interval)
-        continue
+      if is_primary() != primary:
+        primary = not primary
+        if primary:
+          # A sequence interrupted by a restart or failover continues at once (skip/cancel already work)
+          take_over(drivers, current_status)
+      elif not primary and standby_alert is not None and os.path.exists(sequence_checkpoint.path):
+        # The primary started the sequence for it
+        standby_alert = None
+
+      if full_sequence_queued and not action_lock.locked() and not sequence_tasks:
+        log(f"{COLORS.WARNING}Early-warning run or power restore finished. Starting the full action sequence...{COLORS.ENDC}")
+        start_sequence(drivers)
+        full_sequence_queued = False
+
+      # Only re-read the file when the watcher saw a change (or the last read failed)
+      if file_changed or current_status is None:
+        snapshot = await read_status_snapshot(reader, on_new_snapshot)
+        current_status = h2_alert_status(snapshot)
+        file_changed = False
+        if snapshot is not None:
+          good_snapshot = snapshot
+
+      # Checked on every poll: a logger that stopped writing causes no file event
+      stale = check_staleness(good_snapshot, stale)
 
-      current_status = read_h2_alert_status(filepath)
       if current_status is None:
         # Handle file read error
-        os.system('clear')
-        print(f"{COLORS.FAIL}Monitoring... (File read error or key missing){COLORS.ENDC}")
-        print(f"{COLORS.FAIL}Last check: {time.ctime()}{COLORS.ENDC}")
-        time.sleep(interval)
+        dashboard.set_section("status", [
+          f"{COLORS.HEADER}--- LH2 MONITOR ---{COLORS.ENDC}",
+          f"{COLORS.FAIL}Monitoring... (File read error or key missing){COLORS.ENDC}",
+          f"{COLORS.FAIL}Last check: {time.ctime()}{COLORS.ENDC}",
+        ])
+        dashboard.render()
+        file_changed = await poll(watcher, sampler, stats, current_status)
         continue
 
       if current_status == '1' and last_status == '0':
-        os.system('clear') # Clear screen for the log
-        print(f"\n{COLORS.WARNING}{COLORS.BOLD}--- LH2 leak flag is detected ---{COLORS.ENDC}")
-        print(f"{COLORS.WARNING}Timestamp: {time.ctime()}{COLORS.ENDC}")
-
-        # --- Send initial alert notification ---
-        print(f"{COLORS.WARNING}Sending initial alert to Discord...{COLORS.ENDC}")
-        send_discord_notification(f"ALERT: LH2 leak detected (0 -> 1)! Safety sequence initiated.", log_prefix="Initial Alert")
-        # --- END ---
+        log(f"{COLORS.WARNING}{COLORS.BOLD}--- LH2 leak flag is detected ---{COLORS.ENDC}")
+        log(f"{COLORS.WARNING}Timestamp: {time.ctime()}{COLORS.ENDC}")
+        if watcher.last_latency is not None:
+          log(f"{COLORS.WARNING}Detected {watcher.last_latency * 1000:.1f} ms after the file was written ({watcher.backend}).{COLORS.ENDC}")
 
-        # (Lock is guaranteed to be free here, but we check just in case)
-        if not action_lock.locked():
-          print(f"{COLORS.WARNING}Status changed from '0' to '1'. Starting actions in background...{COLORS.ENDC}")
-          action_thread = threading.Thread(target=run_actions)
-          action_thread.start()
+        raise_alert(drivers, "LH2 leak detected (0 -> 1)")
 
         last_status = current_status
 
       elif current_status == '0' and last_status == '1':
-        os.system('clear') # Clear screen for the log
-        print(f"\n{COLORS.OKBLUE}({time.ctime()}) Status changed back to '0'.{COLORS.ENDC}")
+        log(f"{COLORS.OKBLUE}({time.ctime()}) Status changed back to '0'.{COLORS.ENDC}")
 
         # --- Send recovery notification ---
-        print(f"{COLORS.OKBLUE}Sending recovery alert to Discord...{COLORS.ENDC}")
-        send_discord_notification(f"OK: LH2 leak alert recovered (1 -> 0).", log_prefix="Recovery Alert")
+        log(f"{COLORS.OKBLUE}Sending recovery alert to Discord...{COLORS.ENDC}")
+        message = f"OK: LH2 leak alert recovered (1 -> 0)."
+        if action_lock.locked():
+          message += " The safety sequence is still running ('python3 control.py cancel' stops Actions 5-6)."
+        send_discord_notification(message, log_prefix="Recovery Alert")
         # --- END ---
 
         last_status = current_status
@@ -411,27 +1810,29 @@ def monitor_status_change(filepath, interval):
       elif current_status != last_status:
         last_status = current_status
 
-      # Update normal monitoring screen
-      os.system('clear')
-      print(f"{COLORS.HEADER}--- LH2 MONITOR ---{COLORS.ENDC}")
-
-      if last_status == '1':
-          status_color = COLORS.WARNING
-          status_text = "ALERT DETECTED"
-      else:
-          status_color = COLORS.OKGREEN
-          status_text = "Normal"
-
-      print(f"Status (Alert_H2leak): {status_color}{last_status} ({status_text}){COLORS.ENDC}")
-      print(f"{COLORS.DIM}Monitoring file: {filepath}{COLORS.ENDC}")
-      print(f"{COLORS.DIM}Last check: {time.ctime()}{COLORS.ENDC}")
-      print("\n(Monitoring... Ctrl+C to stop)")
+      # Update normal monitoring screen (with the action progress, if running)
+      update_status_screen(filepath, watcher, snapshot, last_status, engine, sampling_text(sampler, stats))
 
-      time.sleep(interval)
+      file_changed = await poll(watcher, sampler, stats, current_status)
 
-  except KeyboardInterrupt:
-    print("\nMonitoring stopped.")
+  except asyncio.CancelledError:
+    log("Monitoring stopped.")
   finally:
+    for task in source_tasks:
+      task.cancel()
+    if lease is not None:
+      lease.release()
+    watcher.close()
+    trigger_watcher.close()
+    if control_server is not None:
+      control_server.close()
+    if recorder is not None:
+      recorder.close()
+    prober.stop()
+    notifier.stop()
+    if exporter is not None:
+      exporter.stop()
+    telemetry.spans.close()
     # Ensure cursor is visible on exit
     print("\033[?25h")
 
@@ -446,6 +1847,7 @@ if __name__ == "__main__":
     print(f"{COLORS.HEADER}  Skip:   {SKIP_TRIGGER_FILE}{COLORS.ENDC}")
     print(f"{COLORS.HEADER}  Cancel: {CANCEL_TRIGGER_FILE}{COLORS.ENDC}")
     print(f"{COLORS.HEADER}  Extend: {EXTEND_TRIGGER_FILE}{COLORS.ENDC}")
+    print(f"{COLORS.HEADER}Control socket: {CONTROL_SOCKET_PATH} (python3 control.py --help){COLORS.ENDC}")
 
     trigger_files = [SKIP_TRIGGER_FILE, CANCEL_TRIGGER_FILE, EXTEND_TRIGGER_FILE]
 
@@ -458,8 +1860,23 @@ if __name__ == "__main__":
                 print(f"{COLORS.FAIL}ERROR: Could not remove old trigger file '{f}'. Exiting: {e}{COLORS.ENDC}")
                 sys.exit(1) # Exit if we can't clean up
 
+    # Load the device drivers once, so no import happens on the alert path
+    drivers = load_drivers(DRIVER_MODE, HV_SCRIPT_PATH, KIKUSUI_SCRIPT_PATH,
+                           CAEN_HV_CHAMBER_SCRIPT_PATH, CAEN_HV_T0_SCRIPT_PATH)
+    print(f"{COLORS.HEADER}Device drivers: {drivers.describe()}{COLORS.ENDC}")
+    for name, reason in drivers.fallbacks.items():
+        print(f"{COLORS.WARNING}  {name}: in-process driver unavailable ({reason}), using subprocess.{COLORS.ENDC}")
+
+    notifier.start()
+
     print("--- Starting Monitor ---")
-    time.sleep(1) # Give user time to read startup messages
+    if os.path.exists(SEQUENCE_CHECKPOINT_PATH):
+        print(f"{COLORS.WARNING}Sequence checkpoint found: resuming the interrupted action sequence.{COLORS.ENDC}")
+    else:
+        time.sleep(1) # Give user time to read startup messages
 
-    # Start the main monitoring logic
-    monitor_status_change(FILE_TO_WATCH, POLLING_INTERVAL)
+    # Start the main monitoring logic (one asyncio loop)
+    try:
+        asyncio.run(monitor_status_change(FILE_TO_WATCH, POLLING_INTERVAL, drivers))
+    except KeyboardInterrupt:
+        pass
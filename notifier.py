@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Non-blocking Discord webhook notifier.
+
+notify() only puts the message on a bounded queue; a background thread
+delivers it over a kept-alive requests.Session. Messages that arrive close
+together are combined into one post, HTTP 429 'retry_after' is honoured,
+and anything that cannot be delivered is appended to a spool file on disk
+and re-sent once the webhook is reachable again, ahead of newer messages.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+
+import telemetry
+
+DISCORD_MAX_CONTENT = 2000 # Discord's limit for 'content'
+REQUEST_TIMEOUT_SECONDS = 5
+COALESCE_WINDOW_SECONDS = 0.5 # Collect messages arriving within this window into one post
+SPOOL_RETRY_SECONDS = 30 # How often to retry spooled messages while idle
+MAX_QUEUE_SIZE = 200
+MAX_RATE_LIMIT_WAIT_SECONDS = 60
+
+
+def split_content(text, limit=DISCORD_MAX_CONTENT):
+  """
+  Split 'text' into parts of at most 'limit' characters, at line breaks
+  where possible.
+  """
+  parts = []
+  while len(text) > limit:
+    cut = text.rfind("\n", 0, limit + 1)
+    if cut <= 0:
+      cut = limit
+    parts.append(text[:cut])
+    text = text[cut:].lstrip("\n")
+  parts.append(text)
+  return parts
+
+
+class DiscordNotifier:
+  """
+  Background sender for one webhook.
+
+  log(text, ok) is called from the sender thread to report each delivery
+  attempt (ok is True/False). on_delivered(latency, prefix) is called for
+  each message once posted, with the seconds since notify() queued it
+  (not for messages re-sent from the spool).
+  """
+
+  def __init__(self, webhook_url, spool_path, username="LH2 Monitor Bot", log=None,
+               max_queue=MAX_QUEUE_SIZE, coalesce_window=COALESCE_WINDOW_SECONDS,
+               timeout=REQUEST_TIMEOUT_SECONDS, on_delivered=None):
+    self.webhook_url = webhook_url
+    self.spool_path = spool_path
+    self.username = username
+    self.log = log or (lambda text, ok: None)
+    self.on_delivered = on_delivered or (lambda latency, prefix: None)
+    self.coalesce_window = coalesce_window
+    self.timeout = timeout
+    self._queue = queue.Queue(maxsize=max_queue)
+    self._session = requests.Session()
+    self._spool_lock = threading.Lock()
+    self._thread = None
+    self._stopping = threading.Event()
+
+  # --- Producer side (never blocks) ---
+
+  def notify(self, message, log_prefix="Action Log"):
+    """
+    Queue a message for delivery. Returns immediately. If the queue is full
+    the message goes straight to the spool file. A message longer than
+    Discord's limit is sent as several posts.
+    """
+    queued = time.time()
+    parts = split_content(f"[{time.ctime()}] {message}")
+    for i, part in enumerate(parts):
+      item = {"content": part, "prefix": log_prefix, "queued": queued}
+      try:
+        self._queue.put_nowait(item)
+      except queue.Full:
+        self._spool([dict(item, content=rest) for rest in parts[i:]])
+        self.log(f"({log_prefix}) Notification queue full; message spooled to disk.", False)
+        return
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name="discord-notifier", daemon=True)
+      self._thread.start()
+
+  def stop(self, timeout=5.0):
+    """
+    Deliver (or spool) what is queued, then stop the sender thread.
+    """
+    self._stopping.set()
+    if self._thread is not None:
+      self._thread.join(timeout)
+    # Anything still queued is kept for the next start
+    leftovers = []
+    while True:
+      try:
+        leftovers.append(self._queue.get_nowait())
+      except queue.Empty:
+        break
+    if leftovers:
+      self._spool(leftovers)
+
+  def pending(self):
+    return self._queue.qsize()
+
+  # --- Sender thread ---
+
+  def _run(self):
+    last_spool_try = 0.0
+    while not (self._stopping.is_set() and self._queue.empty()):
+      batch = []
+      try:
+        try:
+          first = self._queue.get(timeout=1.0)
+        except queue.Empty:
+          first = None
+
+        if first is not None:
+          batch = [first] + self._collect_burst()
+          # Older undelivered messages go first; while they are stuck, new ones queue up behind them
+          last_spool_try = time.monotonic()
+          if not self._flush_spool() or not self._deliver(batch):
+            self._spool(batch)
+          continue
+
+        # Idle: retry the spool now and then
+        now = time.monotonic()
+        if now - last_spool_try >= SPOOL_RETRY_SECONDS:
+          last_spool_try = now
+          self._flush_spool()
+      except Exception as e:
+        # Keep the sender alive; what was being sent is kept in the spool
+        self.log(f"ERROR in the Discord notifier: {e!r}", False)
+        if batch:
+          self._spool(batch)
+        self._stopping.wait(1.0)
+
+  def _collect_burst(self):
+    """
+    Gather further messages that arrive within the coalescing window.
+    """
+    batch = []
+    deadline = time.monotonic() + self.coalesce_window
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return batch
+      try:
+        batch.append(self._queue.get(timeout=remaining))
+      except queue.Empty:
+        return batch
+
+  def _deliver(self, items):
+    """
+    Post items, combined into as few messages as the length limit allows.
+    Returns False (nothing more sent) at the first failure; items already
+    delivered are dropped from 'items' so the caller spools only the rest.
+    """
+    while items:
+      chunk, length = [], 0
+      for item in items:
+        extra = len(item["content"]) + (1 if chunk else 0)
+        if chunk and length + extra > DISCORD_MAX_CONTENT:
+          break
+        chunk.append(item)
+        length += extra
+      content = "\n".join(item["content"] for item in chunk)
+      prefixes = ", ".join(dict.fromkeys(item["prefix"] for item in chunk))
+      if not self._post(content, prefixes):
+        return False
+      now = time.time()
+      for item in chunk:
+        if "queued" in item:
+          self.on_delivered(now - item["queued"], item["prefix"])
+      del items[:len(chunk)]
+    return True
+
+  def _post(self, content, prefixes):
+    with telemetry.span("discord.post", prefixes=prefixes, length=len(content)) as span:
+      ok = self._post_once(content, prefixes)
+      if not ok:
+        span.fail("not delivered")
+      return ok
+
+  def _post_once(self, content, prefixes):
+    data = {"content": content, "username": self.username}
+    while True:
+      try:
+        response = self._session.post(self.webhook_url, json=data, timeout=self.timeout)
+      except requests.exceptions.RequestException as e:
+        self.log(f"({prefixes}) ERROR sending Discord notification: {e}", False)
+        return False
+
+      if response.status_code in (200, 204):
+        self.log(f"({prefixes}) Discord notification sent.", True)
+        return True
+
+      if response.status_code == 429:
+        # Rate limited: wait as long as Discord asks, then try again
+        try:
+          body = response.json()
+        except ValueError:
+          body = None
+        if isinstance(body, dict) and "retry_after" in body:
+          retry_after = float(body["retry_after"])
+        else:
+          retry_after = float(response.headers.get("Retry-After", 1.0))
+        if retry_after > MAX_RATE_LIMIT_WAIT_SECONDS:
+          self.log(f"({prefixes}) Discord rate limit ({retry_after:.0f}s) too long; spooling.", False)
+          return False
+        time.sleep(retry_after)
+        continue
+
+      self.log(f"({prefixes}) ERROR sending Discord notification (Status code: {response.status_code})", False)
+      return False
+
+  # --- Spool file (one JSON object per line) ---
+
+  def _spool(self, items):
+    with self._spool_lock:
+      try:
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+          for item in items:
+            f.write(json.dumps(item) + "\n")
+      except OSError as e:
+        self.log(f"ERROR writing notification spool {self.spool_path}: {e}", False)
+
+  def _read_spool(self):
+    """
+    (items, size) of the spool file, or (None, 0) if there is none.
+    Lines that cannot be parsed are moved to the '.bad' file next to it.
+    """
+    with self._spool_lock:
+      if not os.path.exists(self.spool_path):
+        return None, 0
+      try:
+        with open(self.spool_path, "rb") as f:
+          data = f.read()
+      except OSError as e:
+        self.log(f"ERROR reading notification spool {self.spool_path}: {e}", False)
+        return None, 0
+      items, good, bad = [], [], []
+      for line in data.splitlines(keepends=True):
+        if not line.strip():
+          continue
+        line = line if line.endswith(b"\n") else line + b"\n"
+        try:
+          item = json.loads(line.decode("utf-8"))
+          if not isinstance(item, dict) or not isinstance(item.get("content"), str):
+            raise ValueError("not a spooled message")
+        except ValueError:
+          bad.append(line)
+          continue
+        items.append(item)
+        good.append(line)
+      if not bad:
+        return items, len(data)
+      try:
+        with open(self.spool_path + ".bad", "ab") as f:
+          f.writelines(bad)
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+          f.writelines(good)
+        os.replace(tmp_path, self.spool_path)
+      except OSError as e:
+        self.log(f"ERROR moving unreadable lines of {self.spool_path} to {self.spool_path}.bad: {e}", False)
+        return None, 0
+      self.log(f"Moved {len(bad)} unreadable line(s) of {self.spool_path} to {self.spool_path}.bad", False)
+      return items, sum(map(len, good))
+
+  def _rewrite_spool(self, remaining, size):
+    """
+    Replace the first 'size' bytes of the spool (the part that was read)
+    with 'remaining', keeping anything appended since.
+    """
+    with self._spool_lock:
+      try:
+        with open(self.spool_path, "rb") as f:
+          f.seek(size)
+          newer = f.read()
+        if not remaining and not newer:
+          os.remove(self.spool_path)
+          return
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+          for item in remaining:
+            f.write((json.dumps(item) + "\n").encode("utf-8"))
+          f.write(newer)
+        os.replace(tmp_path, self.spool_path)
+      except OSError as e:
+        self.log(f"ERROR writing notification spool {self.spool_path}: {e}", False)
+
+  def _flush_spool(self):
+    """
+    Re-send the spooled messages. Returns True if none are left.
+    """
+    # The lock is not held while posting, so notify() can spool meanwhile
+    items, size = self._read_spool()
+    if items is None:
+      return True
+    if not items:
+      self._rewrite_spool([], size) # Only unreadable lines (moved to .bad)
+      return True
+    # Entries spooled before long messages were split are split here
+    items = [dict(item, content=part) for item in items for part in split_content(item["content"])]
+    # No 'queued': the time spent in the spool is not a delivery latency
+    to_send = [{"content": item["content"], "prefix": "Spooled " + item.get("prefix", "")} for item in items]
+    delivered = self._deliver(to_send)
+    # Keep whatever could not be delivered
+    self._rewrite_spool(items[len(items) - len(to_send):], size)
+    return delivered
@@ -1,6 +1,7 @@
 #!/bin/bash
 
-./toggle_kikusui.py on
+# Kikusui supplies .42 and .45 (monitor: "python3 control.py restore" also verifies each step)
+./toggle_kikusui.py 42,45 on
 
 # --- Configuration (check and modify for your environment) ---
 
@@ -26,27 +27,31 @@ SSH_OPTS="-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null"
 
 echo "Turning ON USB ports..."
 
-# Loop through each host
-for host in "${TARGET_HOSTS[@]}"; do
-    echo "--- [ Target Host: $host ] ---"
+# Enable all ports of one host in a single SSH session
+enable_ports() {
+    local host=$1
+    local remote_cmd=""
 
-    # Loop through each port
     for port in "${PORTS_TO_ENABLE[@]}"; do
+        # (-a 1 = power ON); report failures per port but keep going
+        remote_cmd+="sudo $UHUBCTL_PATH -l $HUB_LOCATION -p $port -a 1 > /dev/null || echo '  [ERROR] Command failed on $host port $port.'; "
+    done
 
-        # Define the remote command to execute (-a 1 = power ON)
-        REMOTE_CMD="sudo $UHUBCTL_PATH -l $HUB_LOCATION -p $port -a 1"
-
-        echo "  Enabling port $port... (ssh $TARGET_USER@$host ...)"
+    echo "--- [ Target Host: $host ] enabling ports ${PORTS_TO_ENABLE[*]} (ssh $TARGET_USER@$host ...) ---"
 
-        # Execute the command via SSH
-        ssh $SSH_OPTS "$TARGET_USER@$host" "$REMOTE_CMD"
+    # Execute the batch via SSH
+    ssh $SSH_OPTS "$TARGET_USER@$host" "$remote_cmd"
 
-        # Check the exit code (simple error message)
-        if [ $? -ne 0 ]; then
-            echo "  [ERROR] Command failed on $host port $port."
-        fi
+    # Check the exit code (simple error message)
+    if [ $? -ne 0 ]; then
+        echo "  [ERROR] SSH to $host failed."
+    fi
+}
 
-    done
+# Run all hosts in parallel
+for host in "${TARGET_HOSTS[@]}"; do
+    enable_ports "$host" &
 done
+wait
 
 echo "--- All done ---"
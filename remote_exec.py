@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Remote command execution on the Raspberry Pis over SSH.
+
+Each host keeps one multiplexed OpenSSH master connection (ControlMaster),
+so only the first command pays for the key exchange. All commands for a
+host are sent as one batch in a single session, and several hosts are
+handled in parallel.
+"""
+import os
+import shlex
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+SSH_CONTROL_DIR = "/tmp/lh2-ssh" # Where the master sockets live
+SSH_CONTROL_PERSIST = "1h" # Keep an idle master open this long (covers the Action 4 wait)
+SSH_CONNECT_TIMEOUT = 5 # Seconds
+SSH_CONTROL_TIMEOUT = 5 # Seconds for a master check/exit (and on top of the connect timeout for open)
+
+_EXIT_MARKER = "__lh2_exit__"
+
+
+class RemoteCommandError(Exception):
+  """
+  Raised when ssh itself fails or one of the batched commands exits non-zero.
+  """
+
+
+class RemoteHost:
+  """
+  One SSH target with a reusable master connection.
+  """
+
+  def __init__(self, user, host, control_dir=SSH_CONTROL_DIR, persist=SSH_CONTROL_PERSIST,
+               connect_timeout=SSH_CONNECT_TIMEOUT):
+    self.user = user
+    self.host = host
+    self.target = f"{user}@{host}"
+    self.control_dir = control_dir
+    self.persist = persist
+    self.connect_timeout = connect_timeout
+    self._open_lock = threading.Lock()
+
+  def ssh_args(self):
+    """
+    Common ssh options: multiplexing, no host key prompt, no password prompt.
+    """
+    return [
+      "ssh", "-T",
+      "-o", "StrictHostKeyChecking=no",
+      "-o", "BatchMode=yes",
+      "-o", f"ConnectTimeout={self.connect_timeout}",
+      "-o", "ServerAliveInterval=30",
+      "-o", "ControlMaster=auto",
+      "-o", f"ControlPath={self.control_dir}/%r@%h:%p",
+      "-o", f"ControlPersist={self.persist}",
+    ]
+
+  def is_open(self):
+    """
+    True if a master connection to this host is alive (False if it does
+    not answer within SSH_CONTROL_TIMEOUT).
+    """
+    try:
+      result = subprocess.run(self.ssh_args() + ["-O", "check", self.target],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=SSH_CONTROL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+      return False
+    return result.returncode == 0
+
+  def open(self):
+    """
+    Start the master connection in the background (no-op if already open).
+    """
+    os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+    with self._open_lock:
+      if self.is_open():
+        return
+      # 'ssh -f -N' with ControlMaster=auto forks a persistent master and returns
+      with telemetry.span("ssh.open", host=self.host) as span:
+        try:
+          result = subprocess.run(self.ssh_args() + ["-f", "-N", self.target],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                  timeout=self.connect_timeout + SSH_CONTROL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+          span.fail("timeout")
+          raise RemoteCommandError(f"{self.host}: could not open SSH connection: timed out") from None
+        if result.returncode != 0:
+          span.fail(result.stderr.strip())
+      if result.returncode != 0:
+        raise RemoteCommandError(f"{self.host}: could not open SSH connection: {result.stderr.strip()}")
+
+  def run(self, commands, timeout=None):
+    """
+    Run 'commands' on the host in one SSH session. Every command runs even if
+    an earlier one fails. Returns [(command, exit_code), ...] and raises
+    RemoteCommandError if any command failed.
+    """
+    os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+    script = "; ".join(f"{cmd}; echo {_EXIT_MARKER}{i}=$?" for i, cmd in enumerate(commands))
+    with telemetry.span("ssh.run", host=self.host, commands=len(commands)) as span:
+      result = subprocess.run(self.ssh_args() + [self.target, script],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+      span.set(returncode=result.returncode)
+
+    exit_codes = {}
+    for line in result.stdout.splitlines():
+      if line.startswith(_EXIT_MARKER):
+        index, _, code = line[len(_EXIT_MARKER):].partition("=")
+        exit_codes[int(index)] = int(code)
+
+    results = [(cmd, exit_codes.get(i)) for i, cmd in enumerate(commands)]
+    failed = [f"'{cmd}' (exit {code})" for cmd, code in results if code != 0]
+    if result.returncode == 255 and not exit_codes:
+      raise RemoteCommandError(f"{self.host}: ssh failed: {result.stderr.strip()}")
+    if failed:
+      raise RemoteCommandError(f"{self.host}: " + ", ".join(failed))
+    return results
+
+  def output(self, command, timeout=None):
+    """
+    Run one command (e.g. a status query) and return its standard output.
+    Raises RemoteCommandError if it exits non-zero.
+    """
+    os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+    with telemetry.span("ssh.run", host=self.host, commands=1) as span:
+      result = subprocess.run(self.ssh_args() + [self.target, command],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+      span.set(returncode=result.returncode)
+    if result.returncode != 0:
+      raise RemoteCommandError(f"{self.host}: '{command}' failed (exit {result.returncode}): {result.stderr.strip()}")
+    return result.stdout
+
+  def close(self):
+    """
+    Stop the master connection, if any. Gives up after SSH_CONTROL_TIMEOUT
+    (the master then ends at ControlPersist).
+    """
+    try:
+      subprocess.run(self.ssh_args() + ["-O", "exit", self.target],
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=SSH_CONTROL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+      pass
+
+
+def run_on_hosts(remote_hosts, commands, timeout=None):
+  """
+  Run the same batch of commands on several hosts in parallel.
+  Returns {host: results or exception}.
+  """
+  def run_one(remote):
+    try:
+      return remote.run(commands, timeout=timeout)
+    except (RemoteCommandError, subprocess.SubprocessError) as e:
+      return e
+
+  with ThreadPoolExecutor(max_workers=max(1, len(remote_hosts))) as pool:
+    futures = {remote.host: pool.submit(run_one, remote) for remote in remote_hosts}
+    return {host: future.result() for host, future in futures.items()}
+
+
+def preopen(remote_hosts):
+  """
+  Open the master connections of all hosts in background threads.
+  Failures are ignored here; they show up when the commands run.
+  """
+  def open_quietly(remote):
+    try:
+      remote.open()
+    except (RemoteCommandError, OSError):
+      pass
+
+  for remote in remote_hosts:
+    threading.Thread(target=open_quietly, args=(remote,), daemon=True).start()
+
+
+if __name__ == "__main__":
+  import argparse
+  parser = argparse.ArgumentParser(description="Run commands on several hosts over multiplexed SSH.")
+  parser.add_argument("--user", default="sks")
+  parser.add_argument("--host", action="append", required=True, help="Target host (repeatable).")
+  parser.add_argument("command", nargs="+", help="Commands to run (each one quoted).")
+  args = parser.parse_args()
+
+  hosts = [RemoteHost(args.user, h) for h in args.host]
+  failed = False
+  for host, outcome in run_on_hosts(hosts, args.command).items():
+    if isinstance(outcome, Exception):
+      failed = True
+      print(f"[ERROR] {outcome}")
+    else:
+      for cmd, code in outcome:
+        print(f"{host}: {shlex.quote(cmd)} -> exit {code}")
+  raise SystemExit(1 if failed else 0)
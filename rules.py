@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Declarative alarm rules checked against status snapshots.
+
+A rule is a condition on one snapshot (transition rules also see the
+previous snapshot of the same source). The RuleEngine keeps the state of
+every (rule, source) pair and reports edges only: a rule is raised when
+its condition becomes true and cleared when it becomes false again, so a
+flag that stays set is reported once. Transition rules have no state and
+fire on every matching change.
+
+Values are looked up with snapshot.get(key), so rules work on any file
+that status_file.py parses. Each new snapshot is checked only against the
+rules of its own source, in a single pass and without I/O.
+"""
+import abc
+import time
+from collections import namedtuple
+
+# What the caller does when a rule is raised
+NOTIFY = "notify"
+SHUTDOWN = "shutdown"
+
+# RuleEvent kinds
+RAISED = "raised"
+CLEARED = "cleared"
+CHANGED = "changed" # Transition rules
+INITIAL = "initial" # Already true in the first snapshot of a source
+
+RuleEvent = namedtuple("RuleEvent", "kind rule source detail")
+
+
+def _number(value):
+  """
+  Numeric value of a field (values of unknown keys are strings), or None.
+  """
+  if value is None or isinstance(value, (int, float)):
+    return value
+  try:
+    return float(value)
+  except ValueError:
+    return None
+
+
+class Rule(abc.ABC):
+  """
+  Base class. 'source' limits the rule to one status source (None: all
+  sources); 'action' is NOTIFY or SHUTDOWN. Subclasses implement check().
+  """
+  momentary = False
+
+  def __init__(self, name, action=NOTIFY, source=None):
+    if action not in (NOTIFY, SHUTDOWN):
+      raise ValueError(f"rule '{name}': unknown action '{action}'")
+    self.name = name
+    self.action = action
+    self.source = source
+
+  @abc.abstractmethod
+  def check(self, snapshot, previous, active):
+    """
+    Return (active, detail) for a new snapshot. 'previous' is the last
+    snapshot of the same source (None at first); 'active' the current state.
+    """
+
+
+class Flag(Rule):
+  """
+  True while 'key' equals 'value' (e.g. an Alert_* flag set to 1).
+  """
+
+  def __init__(self, name, key, value=1, **kwargs):
+    super().__init__(name, **kwargs)
+    self.key = key
+    self.value = value
+
+  def check(self, snapshot, previous, active):
+    value = _number(snapshot.get(self.key))
+    if value is None:
+      return active, f"{self.key} missing"
+    return value == self.value, f"{self.key} = {value:g}"
+
+
+class Threshold(Rule):
+  """
+  True while 'key' is above 'above' (or below 'below'). Once raised, the
+  value must come back by 'hysteresis' before the rule clears. A missing
+  value keeps the current state.
+  """
+
+  def __init__(self, name, key, above=None, below=None, hysteresis=0.0, **kwargs):
+    super().__init__(name, **kwargs)
+    if (above is None) == (below is None):
+      raise ValueError(f"rule '{name}': give exactly one of 'above' and 'below'")
+    self.key = key
+    self.above = above
+    self.below = below
+    self.hysteresis = hysteresis
+
+  def check(self, snapshot, previous, active):
+    value = _number(snapshot.get(self.key))
+    if value is None:
+      return active, f"{self.key} missing"
+    margin = self.hysteresis if active else 0.0
+    if self.above is not None:
+      return value > self.above - margin, f"{self.key} = {value:g} (limit > {self.above:g})"
+    return value < self.below + margin, f"{self.key} = {value:g} (limit < {self.below:g})"
+
+
+class CountAbove(Rule):
+  """
+  True while at least 'count' of 'keys' are above 'limit' (e.g. two of the
+  three H2 leak sensors), with the same hysteresis as Threshold.
+  """
+
+  def __init__(self, name, keys, limit, count, hysteresis=0.0, **kwargs):
+    super().__init__(name, **kwargs)
+    if not 1 <= count <= len(keys):
+      raise ValueError(f"rule '{name}': count must be between 1 and {len(keys)}")
+    self.keys = tuple(keys)
+    self.limit = limit
+    self.count = count
+    self.hysteresis = hysteresis
+
+  def check(self, snapshot, previous, active):
+    limit = self.limit - (self.hysteresis if active else 0.0)
+    high = []
+    for key in self.keys:
+      value = _number(snapshot.get(key))
+      if value is not None and value > limit:
+        high.append(f"{key} {value:g}")
+    detail = f"{len(high)} of {len(self.keys)} above {self.limit:g}" + (f" ({', '.join(high)})" if high else "")
+    return len(high) >= self.count, detail
+
+
+class Transition(Rule):
+  """
+  Fires on every change of 'key', or only on changes from 'from_value'
+  and/or to 'to_value'.
+  """
+  momentary = True
+
+  def __init__(self, name, key, from_value=None, to_value=None, **kwargs):
+    super().__init__(name, **kwargs)
+    self.key = key
+    self.from_value = from_value
+    self.to_value = to_value
+
+  def check(self, snapshot, previous, active):
+    if previous is None:
+      return False, None
+    old, new = _number(previous.get(self.key)), _number(snapshot.get(self.key))
+    if old is None or new is None or old == new:
+      return False, None
+    if self.from_value is not None and old != self.from_value:
+      return False, None
+    if self.to_value is not None and new != self.to_value:
+      return False, None
+    return True, f"{self.key} {old:g} -> {new:g}"
+
+
+class RuleEngine:
+  """
+  Check rules against the snapshots of any number of sources. Not
+  thread-safe: the monitor calls it from its event loop only.
+  """
+
+  def __init__(self, rules):
+    self.rules = list(rules)
+    names = [r.name for r in self.rules]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+      raise ValueError(f"duplicate rule names: {', '.join(duplicates)}")
+    self._by_source = {}
+    self._active = {} # (rule name, source) -> (since, detail)
+    self._previous = {}
+
+  def rules_for(self, source):
+    rules = self._by_source.get(source)
+    if rules is None:
+      rules = self._by_source[source] = [r for r in self.rules if r.source in (None, source)]
+    return rules
+
+  def evaluate(self, source, snapshot, now=None):
+    """
+    Check a new snapshot of 'source' and return the resulting RuleEvents.
+    """
+    now = time.time() if now is None else now
+    previous = self._previous.get(source)
+    self._previous[source] = snapshot
+    events = []
+    for rule in self.rules_for(source):
+      key = (rule.name, source)
+      was_active = key in self._active
+      active, detail = rule.check(snapshot, previous, was_active)
+      if rule.momentary:
+        if active:
+          events.append(RuleEvent(CHANGED, rule, source, detail))
+      elif active:
+        self._active[key] = (self._active[key][0] if was_active else now, detail)
+        if not was_active:
+          events.append(RuleEvent(RAISED if previous is not None else INITIAL, rule, source, detail))
+      elif was_active:
+        del self._active[key]
+        events.append(RuleEvent(CLEARED, rule, source, detail))
+    return events
+
+  def active(self):
+    """
+    [(rule name, source, since, detail)] of the raised rules, oldest first.
+    """
+    return sorted(((name, source, since, detail) for (name, source), (since, detail) in self._active.items()),
+                  key=lambda item: item[2])
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Adaptive sampling rate for the status file.
+
+The monitor samples at a slow base interval while the watched channels are
+steady. A record in which a channel moved by more than its 'enter' step
+since the previous record, or in which an Alert_* flag changed, switches
+to the burst interval at once. Dropping back needs confirmation: 'quiet'
+records in a row, each with every channel within its smaller 'exit' step
+(hysteresis), and at least 'hold' seconds in burst mode.
+
+SamplingStats keeps the numbers reported as metrics: the average read
+rate and the worst detection latency over a sliding window.
+"""
+import collections
+import time
+from collections import namedtuple
+
+# key, change between two records that starts a burst, change that still counts as quiet
+SamplingChannel = namedtuple("SamplingChannel", "key enter exit")
+
+
+class AdaptiveSampler:
+  """
+  Pick the sampling interval from the records seen so far. update() is
+  called with every new snapshot; 'interval' is the wait before the next
+  sample. 'reason' says what started the current burst.
+  """
+
+  def __init__(self, base_interval, burst_interval, channels, flags=(), quiet=5, hold=30.0):
+    self.base_interval = base_interval
+    self.burst_interval = burst_interval
+    self.channels = [SamplingChannel(*c) for c in channels]
+    self.flags = tuple(flags)
+    self.quiet = quiet
+    self.hold = hold
+    self.burst = False
+    self.reason = None
+    self.burst_since = None
+    self.bursts = 0
+    self._quiet_count = 0
+    self._previous = None
+
+  @property
+  def interval(self):
+    return self.burst_interval if self.burst else self.base_interval
+
+  def _changes(self, previous, snapshot):
+    """
+    (trigger, quiet): what moved past an 'enter' step (or None), and
+    whether every channel stayed within its 'exit' step.
+    """
+    trigger, quiet = None, True
+    for channel in self.channels:
+      old, new = previous.get(channel.key), snapshot.get(channel.key)
+      if old is None or new is None:
+        continue
+      step = new - old
+      if abs(step) > channel.enter and trigger is None:
+        trigger = f"{channel.key} {step:+g}"
+      if abs(step) > channel.exit:
+        quiet = False
+    for key in self.flags:
+      old, new = previous.get(key), snapshot.get(key)
+      if old != new and old is not None and new is not None:
+        quiet = False
+        if trigger is None:
+          trigger = f"{key} {old} -> {new}"
+    return trigger, quiet
+
+  def update(self, snapshot, now=None):
+    """
+    Feed a new snapshot. Returns True when the mode (burst or base) changed.
+    """
+    now = time.time() if now is None else now
+    previous, self._previous = self._previous, snapshot
+    if previous is None:
+      return False
+    trigger, quiet = self._changes(previous, snapshot)
+    if trigger is not None:
+      self._quiet_count = 0
+      if not self.burst:
+        self.burst = True
+        self.reason = trigger
+        self.burst_since = now
+        self.bursts += 1
+        return True
+      return False
+    if not self.burst:
+      return False
+    self._quiet_count = self._quiet_count + 1 if quiet else 0
+    if self._quiet_count >= self.quiet and now - self.burst_since >= self.hold:
+      self.burst = False
+      self.reason = None
+      self._quiet_count = 0
+      return True
+    return False
+
+
+class SamplingStats:
+  """
+  Reads and detection latencies of the last 'window' seconds.
+  """
+
+  def __init__(self, window=300.0):
+    self.window = window
+    self.started = time.monotonic()
+    self._reads = collections.deque()
+    self._latencies = collections.deque() # (time, latency)
+
+  def _trim(self, now):
+    limit = now - self.window
+    while self._reads and self._reads[0] < limit:
+      self._reads.popleft()
+    while self._latencies and self._latencies[0][0] < limit:
+      self._latencies.popleft()
+
+  def read(self, now=None):
+    now = time.monotonic() if now is None else now
+    self._reads.append(now)
+    self._trim(now)
+
+  def detected(self, latency, now=None):
+    now = time.monotonic() if now is None else now
+    self._latencies.append((now, latency))
+    self._trim(now)
+
+  def read_rate(self, now=None):
+    """
+    Average reads per second over the window (or since start, if shorter).
+    """
+    now = time.monotonic() if now is None else now
+    self._trim(now)
+    span = min(self.window, now - self.started)
+    return len(self._reads) / span if span > 0 else 0.0
+
+  def worst_latency(self, now=None):
+    """
+    Largest detection latency in the window, or None if nothing changed.
+    """
+    self._trim(time.monotonic() if now is None else now)
+    return max((latency for _, latency in self._latencies), default=None)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Parser for H2tgtPresentStatus.txt.
+
+The whole record is read in a single pass into a StatusSnapshot. Snapshots
+are cached by (mtime, size, inode), so an unchanged file is only stat'ed,
+never re-read: on the network share this is one metadata call per poll.
+
+A changed file is read with one bulk read. The read is rejected as torn
+when the file's metadata moved during the read, or when the record looks
+cut short (no final newline, fewer fields than the last good record)
+until a re-read gives the same CRC32 and metadata. Such reads raise TornReadError, and
+the caller keeps its last good snapshot.
+"""
+import os
+import time
+import zlib
+
+# (key in file, attribute name, converter)
+FIELDS = (
+  ("Temp_Ref1st",    "temp_ref1st",    float),
+  ("Temp_CondUp",    "temp_condup",    float),
+  ("Temp_CondDw",    "temp_conddw",    float),
+  ("Temp_TgtUp",     "temp_tgtup",     float),
+  ("Temp_TgtDw",     "temp_tgtdw",     float),
+  ("Temp_Room",      "temp_room",      float),
+  ("H2_press",       "h2_press",       float),
+  ("Heater_V",       "heater_v",       float),
+  ("Vac_cryo",       "vac_cryo",       float),
+  ("Vac_tank",       "vac_tank",       float),
+  ("Press.diff",     "press_diff",     float),
+  ("H2leak_1",       "h2leak_1",       float),
+  ("H2leak_2",       "h2leak_2",       float),
+  ("H2leak_3",       "h2leak_3",       float),
+  ("Fan_ON/OFF",     "fan_on",         int),
+  ("Ref.ON/OFF",     "ref_on",         int),
+  ("Alert_YBox",     "alert_ybox",     int),
+  ("Alert_GL860",    "alert_gl860",    int),
+  ("Alert_H2leak",   "alert_h2leak",   int),
+  ("Alert_User",     "alert_user",     int),
+  ("HDexhaust_flow", "hdexhaust_flow", float),
+)
+
+TIME_KEY = "Time"
+TIME_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+READ_ATTEMPTS = 3 # Bulk reads before a changing/incomplete record is rejected
+READ_RETRY_SECONDS = 0.02
+
+_FIELD_BY_KEY = {key: (attr, conv) for key, attr, conv in FIELDS}
+_ATTR_BY_KEY = {key: attr for key, attr, _ in FIELDS}
+
+
+class StatusSnapshot:
+  """
+  One parsed status record. Every known field is an attribute (None when
+  missing or unparseable). Unknown keys are kept as strings in 'extra'.
+  """
+  __slots__ = ("time_str", "timestamp", "signature", "checksum", "extra") + tuple(attr for _, attr, _ in FIELDS)
+
+  def __init__(self):
+    for name in self.__slots__:
+      setattr(self, name, None)
+
+  def get(self, key, default=None):
+    """
+    Look up a value by its key in the file (e.g. 'Press.diff').
+    """
+    attr = _ATTR_BY_KEY.get(key)
+    if attr is not None:
+      value = getattr(self, attr)
+      return default if value is None else value
+    if self.extra and key in self.extra:
+      return self.extra[key]
+    return default
+
+  def items(self):
+    """
+    (key, value) pairs in file order, including missing (None) fields.
+    """
+    for key, attr, _ in FIELDS:
+      yield key, getattr(self, attr)
+    if self.extra:
+      yield from self.extra.items()
+
+  def missing(self):
+    return [key for key, attr, _ in FIELDS if getattr(self, attr) is None]
+
+  def age(self, now=None):
+    """
+    Seconds since the record was written, from its Time: header (the file
+    mtime if the header is missing), or None if neither is known.
+    """
+    if self.timestamp is not None:
+      stamp = self.timestamp
+    elif self.signature is not None:
+      stamp = self.signature[0] / 1e9
+    else:
+      return None
+    return (time.time() if now is None else now) - stamp
+
+
+class TornReadError(ValueError):
+  """
+  The status file was being written while it was read.
+  """
+
+
+def read_bulk(filepath):
+  """
+  Read the whole file in one read() call (more only if it grew meanwhile).
+  Returns (data, signature, stable): stable is False when the file's size
+  or mtime changed during the read.
+  """
+  fd = os.open(filepath, os.O_RDONLY)
+  try:
+    before = os.fstat(fd)
+    chunks = []
+    while True:
+      chunk = os.read(fd, before.st_size + 4096)
+      if not chunk:
+        break
+      chunks.append(chunk)
+      if len(chunk) < before.st_size + 4096:
+        break
+    after = os.fstat(fd)
+  finally:
+    os.close(fd)
+  data = b"".join(chunks)
+  signature = (after.st_mtime_ns, after.st_size, after.st_ino)
+  stable = ((before.st_mtime_ns, before.st_size) == (after.st_mtime_ns, after.st_size)
+            and len(data) == after.st_size)
+  return data, signature, stable
+
+
+def parse_status(text, signature=None):
+  """
+  Parse the full status record in one pass and return a StatusSnapshot.
+  """
+  snapshot = StatusSnapshot()
+  snapshot.signature = signature
+  for line in text.splitlines():
+    key, sep, value = line.partition(":")
+    if not sep:
+      continue # '#####' separators and blank lines
+    key = key.strip()
+    value = value.strip()
+    field = _FIELD_BY_KEY.get(key)
+    if field is not None:
+      attr, conv = field
+      try:
+        setattr(snapshot, attr, conv(value))
+      except ValueError:
+        pass # Leave as None (e.g. half-written value)
+    elif key == TIME_KEY:
+      snapshot.time_str = value
+      try:
+        snapshot.timestamp = time.mktime(time.strptime(value, TIME_FORMAT))
+      except ValueError:
+        pass
+    elif key:
+      if snapshot.extra is None:
+        snapshot.extra = {}
+      snapshot.extra[key] = value
+  return snapshot
+
+
+class StatusFileReader:
+  """
+  Read the status file, reusing the last snapshot while the file's
+  (mtime, size, inode) signature is unchanged. torn_count counts rejected
+  (partly written) reads.
+  """
+
+  def __init__(self, filepath):
+    self.filepath = filepath
+    self.snapshot = None
+    self.parse_count = 0
+    self.torn_count = 0
+
+  def _looks_complete(self, data, snapshot):
+    if not data.endswith(b"\n") or snapshot.time_str is None:
+      return False
+    if self.snapshot is None:
+      return True
+    return len(FIELDS) - len(snapshot.missing()) >= len(FIELDS) - len(self.snapshot.missing())
+
+  def read(self):
+    """
+    Return the current StatusSnapshot. Raises OSError if the file cannot be
+    read and TornReadError if it kept changing under the reads.
+    """
+    st = os.stat(self.filepath)
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    if self.snapshot is not None and self.snapshot.signature == signature:
+      return self.snapshot
+
+    previous = None
+    for attempt in range(READ_ATTEMPTS):
+      if attempt:
+        time.sleep(READ_RETRY_SECONDS)
+      data, signature, stable = read_bulk(self.filepath)
+      if not stable or not data: # Empty: truncated by the writer, not yet rewritten
+        continue
+      checksum = zlib.crc32(data)
+      if self.snapshot is not None and checksum == self.snapshot.checksum:
+        # Rewritten with identical content
+        self.snapshot.signature = signature
+        return self.snapshot
+      snapshot = parse_status(data.decode("utf-8", "replace"), signature)
+      snapshot.checksum = checksum
+      # An incomplete-looking record is accepted once a re-read finds the
+      # same bytes and the file not rewritten in between
+      if self._looks_complete(data, snapshot) or (checksum, signature) == previous:
+        self.snapshot = snapshot
+        self.parse_count += 1
+        return snapshot
+      previous = (checksum, signature)
+
+    self.torn_count += 1
+    raise TornReadError(f"{self.filepath} was still being written after {READ_ATTEMPTS} reads")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Fixed-width binary ring file holding every parsed status snapshot.
+
+The file is a small header followed by 'capacity' records of RECORD_DTYPE.
+Both are memory-mapped with NumPy, so an append is a single record
+assignment (a few microseconds) and any time range can be loaded as arrays
+without parsing text. When the ring is full the oldest records are
+overwritten. Other programs can map the records directly with
+np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE).
+
+Keep the file on local disk: sparse files and shared mappings are not
+reliable on NFS. Dirty pages are flushed every 'flush_interval' seconds,
+so a crash loses at most that much history. Records are stored in the
+order they were appended; 't' is the wall clock and can step back (NTP),
+which the header counts in 'backsteps' (queries then scan the whole file).
+
+Usage (query CLI):
+  python status_recorder.py --info
+  python status_recorder.py --from "2026/10/17 12:00" --to "2026/10/17 13:00" --fields H2leak_1,Press.diff
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from status_file import FIELDS
+
+DEFAULT_PATH = "/var/tmp/lh2-monitor/status_history.ring"
+
+MAGIC = b"LH2RING1"
+HEADER_SIZE = 4096 # Bytes reserved for the header (records start page-aligned)
+DEFAULT_CAPACITY = 120 * 24 * 3600 # About four months of 1 Hz data (~1.04 GB at 100 bytes per record)
+FLUSH_INTERVAL_SECONDS = 10
+
+HEADER_DTYPE = np.dtype([
+  ("magic", "S8"),
+  ("record_size", "<u4"),
+  ("n_fields", "<u4"),
+  ("capacity", "<u8"),
+  ("count", "<u8"), # Total records ever appended (write position = count % capacity)
+  ("backsteps", "<u8"), # Appends whose 't' was below the previous one (0 in files from before)
+])
+
+# t: wall-clock time the snapshot was read; record_time: the file's 'Time:' header
+RECORD_DTYPE = np.dtype(
+  [("t", "<f8"), ("record_time", "<f8")] + [(attr, "<f4") for _, attr, _ in FIELDS])
+
+FIELD_BY_KEY = {key: attr for key, attr, _ in FIELDS}
+_ATTRS = tuple(attr for _, attr, _ in FIELDS)
+
+
+class StatusRecorder:
+  """
+  Append-only (ring) recorder. Opens the file, creating it if needed.
+  """
+
+  def __init__(self, path, capacity=DEFAULT_CAPACITY, readonly=False, flush_interval=FLUSH_INTERVAL_SECONDS):
+    self.path = path
+    self.flush_interval = flush_interval
+    if not os.path.exists(path):
+      if readonly:
+        raise FileNotFoundError(path)
+      self._create(path, capacity)
+    mode = "r" if readonly else "r+"
+    self._header = np.memmap(path, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+    head = self._header[0]
+    if bytes(head["magic"]) != MAGIC or head["record_size"] != RECORD_DTYPE.itemsize:
+      raise ValueError(f"{path} is not a status ring file with the current record layout")
+    self.capacity = int(head["capacity"])
+    self._data = np.memmap(path, dtype=RECORD_DTYPE, mode=mode, offset=HEADER_SIZE, shape=(self.capacity,))
+    self._total = int(head["count"])
+    self._last_t = float(self._data[(self._total - 1) % self.capacity]["t"]) if self._total else -np.inf
+    self._flushed = time.monotonic()
+
+  @staticmethod
+  def _create(path, capacity):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["n_fields"] = len(FIELDS)
+    header["capacity"] = capacity
+    with open(path, "wb") as f:
+      f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+      # Sparse file: disk blocks are only allocated as records are written
+      f.truncate(HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+
+  @property
+  def count(self):
+    """
+    Number of records currently stored.
+    """
+    return min(int(self._header[0]["count"]), self.capacity)
+
+  def append(self, snapshot, t=None):
+    """
+    Store one StatusSnapshot. Missing fields are stored as NaN.
+    """
+    t = time.time() if t is None else t
+    row = (t, np.nan if snapshot.timestamp is None else snapshot.timestamp,
+           *[np.nan if v is None else v for v in map(snapshot.__getattribute__, _ATTRS)])
+    self._data[self._total % self.capacity] = row
+    if t < self._last_t:
+      self._header["backsteps"] += 1 # Clock stepped back: 't' is no longer sorted
+    self._last_t = t
+    # Publish the record only after it is written
+    self._total += 1
+    self._header["count"] = self._total
+    if time.monotonic() - self._flushed >= self.flush_interval:
+      self.flush()
+
+  def flush(self):
+    self._data.flush()
+    self._header.flush()
+    self._flushed = time.monotonic()
+
+  @property
+  def backsteps(self):
+    return int(self._header[0]["backsteps"])
+
+  def close(self):
+    self.flush()
+    del self._data
+    del self._header
+
+  def _segments(self):
+    """
+    The stored records as chronological contiguous slices of the ring.
+    """
+    total = int(self._header[0]["count"])
+    if total <= self.capacity:
+      return [self._data[:total]]
+    start = total % self.capacity
+    return [self._data[start:], self._data[:start]]
+
+  def query(self, start=None, end=None, fields=None):
+    """
+    Return the records with start <= t < end as a structured array (a copy),
+    in recording order. 'fields' optionally selects columns by file key
+    ('Press.diff') or attribute name ('press_diff'); 't' is always included.
+    While 't' never stepped back the range is found by binary search,
+    otherwise every record is checked.
+    """
+    parts = []
+    ordered = self.backsteps == 0
+    for seg in self._segments():
+      if len(seg) == 0:
+        continue
+      if ordered:
+        lo = 0 if start is None else np.searchsorted(seg["t"], start, side="left")
+        hi = len(seg) if end is None else np.searchsorted(seg["t"], end, side="left")
+        if hi > lo:
+          parts.append(seg[lo:hi])
+        continue
+      mask = np.ones(len(seg), dtype=bool)
+      if start is not None:
+        mask &= seg["t"] >= start
+      if end is not None:
+        mask &= seg["t"] < end
+      if mask.any():
+        parts.append(seg[mask])
+    result = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+    if fields:
+      names = ["t"] + [FIELD_BY_KEY.get(f, f) for f in fields if FIELD_BY_KEY.get(f, f) != "t"]
+      result = result[names]
+    return np.array(result)
+
+  def time_range(self):
+    segments = [seg for seg in self._segments() if len(seg)]
+    if not segments:
+      return None
+    if self.backsteps:
+      return min(float(seg["t"].min()) for seg in segments), max(float(seg["t"].max()) for seg in segments)
+    return float(segments[0]["t"][0]), float(segments[-1]["t"][-1])
+
+
+def load(path, start=None, end=None, fields=None):
+  """
+  Convenience reader: load a time range from a ring file as a structured array.
+  """
+  recorder = StatusRecorder(path, readonly=True)
+  return recorder.query(start, end, fields)
+
+
+def parse_time(text):
+  """
+  Accept epoch seconds or 'YYYY/MM/DD HH:MM[:SS]' (local time).
+  """
+  try:
+    return float(text)
+  except ValueError:
+    pass
+  for fmt in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+    try:
+      return time.mktime(time.strptime(text, fmt))
+    except ValueError:
+      continue
+  raise argparse.ArgumentTypeError(f"Invalid time '{text}'")
+
+
+def main():
+  default_path = DEFAULT_PATH
+  parser = argparse.ArgumentParser(description="Query the LH2 status history ring file.")
+  parser.add_argument("--file", default=default_path, help=f"Ring file (default: {default_path})")
+  parser.add_argument("--from", dest="start", type=parse_time, help="Start time (epoch or 'YYYY/MM/DD HH:MM[:SS]')")
+  parser.add_argument("--to", dest="end", type=parse_time, help="End time (exclusive)")
+  parser.add_argument("--fields", help="Comma-separated keys, e.g. H2leak_1,Press.diff (default: all)")
+  parser.add_argument("--info", action="store_true", help="Show file size, capacity and time range")
+  parser.add_argument("--npy", help="Save the selected records to this .npy file instead of printing")
+  args = parser.parse_args()
+
+  recorder = StatusRecorder(args.file, readonly=True)
+  if args.info:
+    span = recorder.time_range()
+    print(f"File:     {args.file}")
+    print(f"Records:  {recorder.count} / {recorder.capacity} ({RECORD_DTYPE.itemsize} bytes each)")
+    if recorder.backsteps:
+      print(f"Clock:    stepped back {recorder.backsteps} time(s) while recording (records kept in recording order)")
+    if span:
+      print(f"Range:    {time.ctime(span[0])} -> {time.ctime(span[1])}")
+    return
+
+  fields = args.fields.split(",") if args.fields else None
+  records = recorder.query(args.start, args.end, fields)
+  if args.npy:
+    np.save(args.npy, records)
+    print(f"Saved {len(records)} records to {args.npy}")
+    return
+
+  names = records.dtype.names
+  print("\t".join(names))
+  for rec in records:
+    print("\t".join(time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(rec[n])) if n in ("t", "record_time")
+                    and np.isfinite(rec[n]) else f"{rec[n]:.6g}" for n in names))
+
+
+if __name__ == "__main__":
+  try:
+    main()
+  except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}", file=sys.stderr)
+    sys.exit(1)
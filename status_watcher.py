@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Change detection for the status file written by the LH2 target logger.
+
+Uses inotify (called through libc, no extra packages needed) when the
+file is on a local filesystem, so a rewrite is seen within milliseconds.
+Falls back to stat polling when inotify is unavailable or the file lives
+on a network share where inotify does not see writes from other hosts.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# --- inotify constants (from <sys/inotify.h>) ---
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+# Filesystems on which inotify misses writes made by other hosts
+REMOTE_FS_TYPES = {
+  "nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "afs", "ceph",
+  "fuse.sshfs", "fuse.glusterfs", "glusterfs", "fuse.gvfsd-fuse",
+}
+
+# Events that mean the watched file has new content (or disappeared).
+# The whole directory is watched so that editors and 'sed -i', which
+# replace the file with a new inode, are also seen.
+STATUS_EVENT_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+
+
+def _load_libc():
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.inotify_init1 # Raises AttributeError on non-Linux systems
+    return libc
+  except (OSError, AttributeError):
+    return None
+
+_libc = _load_libc()
+
+
+def filesystem_type(path):
+  """
+  Return the filesystem type (e.g. 'ext4', 'nfs') that holds 'path',
+  or None if it cannot be determined.
+  """
+  path = os.path.realpath(path)
+  best_mount, best_type = "", None
+  try:
+    with open("/proc/self/mounts", "r", encoding="utf-8") as f:
+      for line in f:
+        fields = line.split()
+        if len(fields) < 3:
+          continue
+        mount_point = fields[1].replace("\\040", " ")
+        if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+          if len(mount_point) >= len(best_mount):
+            best_mount, best_type = mount_point, fields[2]
+  except OSError:
+    return None
+  return best_type
+
+
+def inotify_supported(directory):
+  """
+  Return (True, None) if inotify can be trusted for 'directory',
+  otherwise (False, reason).
+  """
+  if _libc is None:
+    return False, "inotify not available on this system"
+  if not os.path.isdir(directory):
+    return False, f"directory {directory} not found"
+  fs_type = filesystem_type(directory)
+  if fs_type in REMOTE_FS_TYPES:
+    return False, f"{directory} is on a network filesystem ({fs_type})"
+  return True, None
+
+
+class InotifyWatch:
+  """
+  Minimal inotify wrapper: watch one directory and report which entries
+  changed. Usable with select() through fileno().
+  """
+
+  def __init__(self, directory, mask):
+    if _libc is None:
+      raise OSError(errno.ENOSYS, "inotify not available")
+    self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd < 0:
+      err = ctypes.get_errno()
+      raise OSError(err, os.strerror(err))
+    wd = _libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+    if wd < 0:
+      err = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(err, f"inotify_add_watch({directory}): {os.strerror(err)}")
+
+  def fileno(self):
+    return self.fd
+
+  def read_names(self):
+    """
+    Drain pending events and return the set of changed entry names.
+    An empty name ('') means the queue overflowed and anything may have changed.
+    """
+    names = set()
+    while True:
+      try:
+        buf = os.read(self.fd, 64 * 1024)
+      except BlockingIOError:
+        return names
+      offset = 0
+      while offset + _EVENT_HEADER.size <= len(buf):
+        _wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+        offset += _EVENT_HEADER.size
+        name = buf[offset:offset + length].rstrip(b"\0")
+        offset += length
+        names.add("" if mask & IN_Q_OVERFLOW else os.fsdecode(name))
+
+  def close(self):
+    if self.fd >= 0:
+      os.close(self.fd)
+      self.fd = -1
+
+
+def _file_signature(filepath):
+  try:
+    st = os.stat(filepath)
+  except OSError:
+    return None
+  return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class StatusWatcher:
+  """
+  Wait for the status file to change.
+
+  backend is 'inotify' or 'polling'; fallback_reason explains why polling
+  was chosen. last_latency is the time (s) between the file's mtime and the
+  moment the change was detected, or None before the first detection.
+  """
+
+  def __init__(self, filepath, interval):
+    self.filepath = filepath
+    self.interval = interval
+    self.directory = os.path.dirname(os.path.abspath(filepath))
+    self.filename = os.path.basename(filepath)
+    self.last_latency = None
+    self.fallback_reason = None
+    self._inotify = None
+    self._signature = _file_signature(filepath)
+
+    ok, reason = inotify_supported(self.directory)
+    if ok:
+      try:
+        self._inotify = InotifyWatch(self.directory, STATUS_EVENT_MASK)
+      except OSError as e:
+        reason = str(e)
+    self.fallback_reason = None if self._inotify else reason
+
+  @property
+  def backend(self):
+    return "inotify" if self._inotify else "polling"
+
+  def wait(self, timeout):
+    """
+    Block until the file changes or 'timeout' seconds pass.
+    Returns True if a change was detected.
+    """
+    if self._inotify:
+      changed = self._wait_inotify(timeout)
+    else:
+      time.sleep(timeout)
+      changed = False
+    return self._check(changed)
+
+  async def wait_async(self, timeout):
+    """
+    wait() for an asyncio loop: the inotify descriptor is a loop reader,
+    so other tasks keep running while this one waits.
+    """
+    if self._inotify:
+      changed = await self._wait_inotify_async(timeout)
+    else:
+      await asyncio.sleep(timeout)
+      changed = False
+    return self._check(changed)
+
+  def _check(self, changed):
+    signature = _file_signature(self.filepath)
+    if signature != self._signature:
+      # Polling backend, or an inotify event for our file
+      changed = True
+    self._signature = signature
+    if changed and signature is not None:
+      self.last_latency = max(0.0, time.time() - signature[0] / 1e9)
+    return changed
+
+  def _wait_inotify(self, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return False
+      readable, _, _ = select.select([self._inotify], [], [], remaining)
+      if not readable:
+        return False
+      names = self._inotify.read_names()
+      if self.filename in names or "" in names:
+        return True
+
+  async def _wait_inotify_async(self, timeout):
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    fd = self._inotify.fileno()
+    loop.add_reader(fd, readable.set)
+    try:
+      deadline = loop.time() + timeout
+      while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+          return False
+        try:
+          await asyncio.wait_for(readable.wait(), remaining)
+        except asyncio.TimeoutError:
+          return False
+        readable.clear()
+        names = self._inotify.read_names()
+        if self.filename in names or "" in names:
+          return True
+    finally:
+      loop.remove_reader(fd)
+
+  def describe(self):
+    if self._inotify:
+      return f"inotify on {self.directory}"
+    return f"polling every {self.interval}s ({self.fallback_reason})"
+
+  def close(self):
+    if self._inotify:
+      self._inotify.close()
+      self._inotify = None
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Structured instrumentation: timing spans as JSON Lines and Prometheus metrics.
+
+Spans: every action step and device call writes one JSON object per line
+(start 'ts', 'end', 'duration' in seconds, 'outcome' ok/error, 'error' and
+call-specific attributes) to the file given to spans.configure(), or to
+$LH2_SPAN_LOG so device scripts started as subprocesses log to the same
+file. Until a file is configured, spans cost a couple of time() calls.
+
+Metrics: counters, gauges and histograms in a Registry, rendered in the
+Prometheus text format and exported as a textfile (for node_exporter's
+textfile collector) and/or over HTTP on /metrics.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SPAN_LOG_ENV = "LH2_SPAN_LOG"
+
+# Seconds; covers sub-millisecond parses up to the 15-minute wait
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800)
+
+
+# --- Spans (JSON Lines) ---
+
+class Span:
+  """
+  A running span. set() adds attributes, fail() marks it as an error
+  without raising.
+  """
+  __slots__ = ("name", "attrs", "start", "outcome", "error")
+
+  def __init__(self, name, attrs):
+    self.name = name
+    self.attrs = attrs
+    self.start = time.time()
+    self.outcome = "ok"
+    self.error = None
+
+  def set(self, **attrs):
+    self.attrs.update(attrs)
+
+  def fail(self, error):
+    self.outcome = "error"
+    self.error = str(error)
+
+
+class SpanLog:
+  """
+  Thread-safe JSON Lines writer. 'context' is added to every record (the
+  monitor puts the id of the running action sequence there).
+  With max_bytes, the file is rolled over to path.1 (path.1 to path.2, ...,
+  keeping 'backups' old files) once it has grown past that size.
+  """
+
+  def __init__(self):
+    self.path = None
+    self.context = {}
+    self.max_bytes = None
+    self.backups = 0
+    self._file = None
+    self._lock = threading.Lock()
+
+  @property
+  def enabled(self):
+    return self._file is not None
+
+  def configure(self, path, max_bytes=None, backups=3):
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+      self.path = path
+      self.max_bytes = max_bytes
+      self.backups = backups
+      self._file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+  def _rotate(self):
+    """
+    Roll the file over (called with the lock held). Device scripts that
+    still have it open finish their lines in path.1.
+    """
+    self._file.close()
+    try:
+      for i in range(self.backups - 1, 0, -1):
+        if os.path.exists(f"{self.path}.{i}"):
+          os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+      if self.backups > 0:
+        os.replace(self.path, f"{self.path}.1")
+      else:
+        os.remove(self.path)
+    except OSError:
+      pass # Keep appending to the current file rather than losing spans
+    self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+  def close(self):
+    self.configure(None)
+
+  def _write(self, record):
+    line = json.dumps(record, default=str)
+    with self._lock:
+      if self._file is not None:
+        self._file.write(line + "\n")
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+          self._rotate()
+
+  def record(self, name, start, end, outcome="ok", error=None, **attrs):
+    """
+    Write a span whose times were measured elsewhere (e.g. action steps).
+    """
+    if self._file is None:
+      return
+    record = {"ts": start, "end": end, "duration": round(end - start, 6), "name": name,
+              "outcome": outcome, "pid": os.getpid(), "thread": threading.current_thread().name}
+    if error is not None:
+      record["error"] = str(error)
+    record.update(self.context)
+    record.update(attrs)
+    self._write(record)
+
+  def event(self, name, **attrs):
+    """
+    Write a point-in-time record (no duration).
+    """
+    if self._file is None:
+      return
+    record = {"ts": time.time(), "name": name, "pid": os.getpid()}
+    record.update(self.context)
+    record.update(attrs)
+    self._write(record)
+
+  @contextmanager
+  def span(self, name, **attrs):
+    """
+    Time the enclosed block. An exception marks the span as an error and
+    is re-raised.
+    """
+    s = Span(name, attrs)
+    try:
+      yield s
+    except BaseException as e:
+      s.fail(e)
+      raise
+    finally:
+      self.record(s.name, s.start, time.time(), s.outcome, s.error, **s.attrs)
+
+
+spans = SpanLog()
+if os.environ.get(SPAN_LOG_ENV):
+  try:
+    spans.configure(os.environ[SPAN_LOG_ENV])
+  except OSError:
+    pass
+
+span = spans.span
+record_span = spans.record
+event = spans.event
+
+
+# --- Metrics (Prometheus text format) ---
+
+def _escape(value):
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+  kind = None
+
+  def __init__(self, name, help_text):
+    self.name = name
+    self.help = help_text
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def header(self):
+    return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+  kind = "counter"
+
+  def inc(self, amount=1, **labels):
+    key = tuple(sorted(labels.items()))
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def render(self):
+    with self._lock:
+      return self.header() + [f"{self.name}{_label_text(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+  kind = "gauge"
+
+  def set(self, value, **labels):
+    with self._lock:
+      self._values[tuple(sorted(labels.items()))] = value
+
+  def render(self):
+    with self._lock:
+      return self.header() + [f"{self.name}{_label_text(k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+  kind = "histogram"
+
+  def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+    super().__init__(name, help_text)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with self._lock:
+      entry = self._values.get(key)
+      if entry is None:
+        entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # bucket counts, sum, count
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          entry[0][i] += 1
+          break
+      entry[1] += value
+      entry[2] += 1
+
+  def render(self):
+    lines = self.header()
+    with self._lock:
+      for key, (counts, total, count) in self._values.items():
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+          cumulative += n
+          lines.append(f"{self.name}_bucket{_label_text(key + (('le', _format_value(float(bound))),))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {count}")
+        lines.append(f"{self.name}_sum{_label_text(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_label_text(key)} {count}")
+    return lines
+
+
+class Registry:
+
+  def __init__(self):
+    self._metrics = []
+
+  def _add(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def counter(self, name, help_text):
+    return self._add(Counter(name, help_text))
+
+  def gauge(self, name, help_text):
+    return self._add(Gauge(name, help_text))
+
+  def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+    return self._add(Histogram(name, help_text, buckets))
+
+  def render(self):
+    lines = []
+    for metric in self._metrics:
+      lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+  """
+  Publish a Registry as a textfile rewritten every 'interval' seconds
+  (atomically, via rename) and/or on http://host:port/metrics.
+  """
+
+  def __init__(self, registry, textfile=None, interval=15.0, http_port=None, http_host="127.0.0.1"):
+    self.registry = registry
+    self.textfile = textfile
+    self.interval = interval
+    self._stop = threading.Event()
+    self._thread = None
+    self._server = None
+    if http_port is not None:
+      exporter = self
+
+      class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+          pass
+
+        def do_GET(self):
+          if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+          data = exporter.registry.render().encode("utf-8")
+          self.send_response(200)
+          self.send_header("Content-Type", "text/plain; version=0.0.4")
+          self.send_header("Content-Length", str(len(data)))
+          self.end_headers()
+          self.wfile.write(data)
+
+      self._server = ThreadingHTTPServer((http_host, http_port), Handler)
+      self._server.daemon_threads = True
+
+  def write_textfile(self):
+    tmp_path = self.textfile + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      f.write(self.registry.render())
+    os.replace(tmp_path, self.textfile)
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      try:
+        self.write_textfile()
+      except OSError:
+        pass
+
+  def start(self):
+    if self.textfile:
+      self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+      self._thread.start()
+    if self._server is not None:
+      threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+
+  def stop(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join(2.0)
+    if self.textfile:
+      try:
+        self.write_textfile()
+      except OSError:
+        pass
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
@@ -1,38 +1,185 @@
 #!/usr/bin/env python3
 import socket
 import sys
-import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
 
 # --- Settings ---
 IP_BASE = "192.168.20." # Common part of the IP address
 PORT = 5025            # Port number
 VOLTAGE_ON = 5.0       # Voltage when ON (V)
+TIMEOUT_SECONDS = 3    # Connect / reply timeout
+MAX_ERRORS_READ = 10   # Entries drained from the error queue at most
 # --- End Settings ---
 
-def scpi_send(sock, cmd):
-    """Send SCPI command (includes wait)"""
-    sock.sendall((cmd + "\n").encode("ascii"))
-    time.sleep(0.1)  # Wait for stability between commands
+# Measured state of one supply
+SupplyStatus = namedtuple("SupplyStatus", "output_on voltage current")
+
+
+class KikusuiError(Exception):
+    """Raised when the supply reports an SCPI error or does not answer"""
+
+
+class KikusuiClient:
+    """
+    One supply, with a persistent SCPI connection.
+
+    Commands are sent together with '*OPC?' and 'SYST:ERR?' in a single
+    write: the replies mean the commands are complete and whether they
+    failed, so no fixed sleeps are needed. Queries are also batched, one
+    write for all of them. A dropped connection is reopened once and the
+    transaction is repeated (all commands used here are idempotent).
+    """
+
+    def __init__(self, ip, port=PORT, timeout=TIMEOUT_SECONDS):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def _disconnect(self):
+        for f in (self._rfile, self._sock):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._sock = None
+        self._rfile = None
+
+    def _readline(self):
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError(f"{self.ip}: connection closed by the supply")
+        return line.decode("ascii").strip()
+
+    def _exchange(self, lines, n_replies):
+        """Write all lines at once and read n_replies reply lines"""
+        if self._sock is None:
+            self._connect()
+        self._sock.sendall(("\n".join(lines) + "\n").encode("ascii"))
+        return [self._readline() for _ in range(n_replies)]
+
+    def _transaction(self, lines, n_replies):
+        with self._lock, telemetry.span("kikusui.transaction", ip=self.ip, commands=lines) as span:
+            try:
+                return self._exchange(lines, n_replies)
+            except OSError:
+                span.set(reconnected=True)
+                # Stale connection (e.g. closed by the supply while idle): retry once
+                self._disconnect()
+                try:
+                    return self._exchange(lines, n_replies)
+                except OSError as e:
+                    self._disconnect()
+                    raise KikusuiError(f"{self.ip}: {e}") from e
+
+    def _raise_on_error(self, error_reply):
+        code = error_reply.split(",", 1)[0].strip()
+        if code in ("0", "+0"):
+            return
+        errors = [error_reply]
+        # Drain the rest of the error queue for the message
+        for _ in range(MAX_ERRORS_READ - 1):
+            reply = self._transaction(["SYST:ERR?"], 1)[0]
+            if reply.split(",", 1)[0].strip() in ("0", "+0"):
+                break
+            errors.append(reply)
+        raise KikusuiError(f"{self.ip}: " + "; ".join(errors))
+
+    def command(self, *cmds):
+        """Send commands and wait until the supply has executed them (raises KikusuiError)"""
+        opc, error_reply = self._transaction(list(cmds) + ["*OPC?", "SYST:ERR?"], 2)
+        if opc != "1":
+            raise KikusuiError(f"{self.ip}: unexpected *OPC? reply '{opc}'")
+        self._raise_on_error(error_reply)
+
+    def query(self, *queries):
+        """Send several queries in one write and return their replies (strings)"""
+        replies = self._transaction(list(queries) + ["SYST:ERR?"], len(queries) + 1)
+        self._raise_on_error(replies[-1])
+        return replies[:-1]
+
+    def power_on(self, voltage=VOLTAGE_ON):
+        self.command(f"VOLT {voltage:.3f}", "OUTP ON")
 
-def scpi_query(sock, cmd):
-    """Send SCPI query and return response string"""
-    scpi_send(sock, cmd)
-    data = sock.recv(1024).decode("ascii").strip()
-    return data
+    def power_off(self):
+        self.command("OUTP OFF")
+
+    def read_status(self):
+        outp_state, meas_v, meas_i = self.query("OUTP?", "MEAS:VOLT?", "MEAS:CURR?")
+        return SupplyStatus(outp_state in ("1", "ON"), float(meas_v), float(meas_i))
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+# --- One client (and connection) per supply, shared by all callers ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(ip):
+    with _clients_lock:
+        if ip not in _clients:
+            _clients[ip] = KikusuiClient(ip)
+        return _clients[ip]
+
+def ip_from_octet(ip_last_octet):
+    """Build the full IP address from its last octet (e.g. 42 -> 192.168.20.42)"""
+    return IP_BASE + str(int(ip_last_octet))
+
+def power_on(ip, voltage=VOLTAGE_ON):
+    """Set the output voltage and switch the output ON"""
+    get_client(ip).power_on(voltage)
+
+def power_off(ip):
+    """Switch the output OFF"""
+    get_client(ip).power_off()
+
+def read_status(ip):
+    """Return SupplyStatus(output_on, voltage, current) with measured V and I"""
+    return get_client(ip).read_status()
+
+def for_each_supply(ips, func):
+    """
+    Call func(ip) for several supplies at the same time.
+    Returns {ip: result or exception}, in the order given.
+    """
+    def call(ip):
+        try:
+            return func(ip)
+        except (KikusuiError, OSError, ValueError) as e:
+            return e
+
+    ips = list(ips)
+    with ThreadPoolExecutor(max_workers=max(1, len(ips))) as pool:
+        futures = [pool.submit(call, ip) for ip in ips]
+        return {ip: f.result() for ip, f in zip(ips, futures)}
 
 def main():
-    USAGE = f"Usage: {sys.argv[0]} <ip_last_octet> [on|off]"
-    
+    USAGE = f"Usage: {sys.argv[0]} <ip_last_octet>[,<ip_last_octet>...] [on|off]"
+
     # --- 1. Parse Arguments ---
     if len(sys.argv) < 2 or len(sys.argv) > 3:
         print(USAGE)
         sys.exit(1)
 
     try:
-        # Construct the IP address from the first argument
-        ip_last_octet = sys.argv[1]
-        int(ip_last_octet) # Simple check to ensure it's a number
-        IP = IP_BASE + ip_last_octet
+        # Construct the IP addresses from the first argument (e.g. '42' or '42,45')
+        ips = [ip_from_octet(octet) for octet in sys.argv[1].split(",")]
     except ValueError:
         print(f"Error: Invalid IP octet '{sys.argv[1]}'. Must be a number.")
         print(USAGE)
@@ -49,34 +196,35 @@ def main():
             print(USAGE)
             sys.exit(1)
 
-    # --- 2. Connect and Execute ---
-    try:
-        print(f"Connecting to {IP}:{PORT}...")
-        with socket.create_connection((IP, PORT), timeout=3) as s:
-            
-            if mode == "status":
-                # Only IP octet provided: check status
-                print(f"Querying status for {IP}...")
-                outp_state = scpi_query(s, "OUTP?")
-                meas_v = scpi_query(s, "MEAS:VOLT?")
-                meas_i = scpi_query(s, "MEAS:CURR?")
-                print(f"  Output: {'ON' if outp_state.strip() == '1' else 'OFF'}")
-                print(f"  Measured Voltage: {float(meas_v):.3f} V")
-                print(f"  Measured Current: {float(meas_i):.3f} A")
-
-            elif mode == "control":
-                # IP octet and [on|off] provided: send command
-                if command == "on":
-                    scpi_send(s, f"VOLT {VOLTAGE_ON:.1f}")
-                    scpi_send(s, "OUTP ON")
-                    print(f"Power ON complete for {IP}. Set voltage = {VOLTAGE_ON:.1f} V")
-                elif command == "off":
-                    scpi_send(s, "OUTP OFF")
-                    print(f"Power OFF complete for {IP}.")
-
-    except Exception as e:
-        print(f"{Colors.FAIL}Error: Connection or command failed for {IP}.{Colors.ENDC}")
-        print(f"Details: {e}")
+    # --- 2. Connect and Execute (all supplies at the same time) ---
+    print(f"Connecting to {', '.join(f'{ip}:{PORT}' for ip in ips)}...")
+    if mode == "status":
+        # Only IP octet provided: check status
+        results = for_each_supply(ips, read_status)
+    elif command == "on":
+        results = for_each_supply(ips, power_on)
+    else:
+        results = for_each_supply(ips, power_off)
+
+    failed = False
+    for ip, result in results.items():
+        if isinstance(result, Exception):
+            failed = True
+            print(f"{Colors.FAIL}Error: Connection or command failed for {ip}.{Colors.ENDC}")
+            print(f"Details: {result}")
+        elif mode == "status":
+            print(f"Status of {ip}:")
+            print(f"  Output: {'ON' if result.output_on else 'OFF'}")
+            print(f"  Measured Voltage: {result.voltage:.3f} V")
+            print(f"  Measured Current: {result.current:.3f} A")
+        elif command == "on":
+            print(f"Power ON complete for {ip}. Set voltage = {VOLTAGE_ON:.1f} V")
+        else:
+            print(f"Power OFF complete for {ip}.")
+
+    for client in _clients.values():
+        client.close()
+    if failed:
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -84,5 +232,5 @@ if __name__ == "__main__":
     class Colors:
         FAIL = '\033[91m'
         ENDC = '\033[0m'
-        
+
     main()
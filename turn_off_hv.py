@@ -1,70 +1,196 @@
 import requests
 import json
 import argparse
+import random
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import telemetry
 
 # --- Constants ---
 DEFAULT_CONTROLLER_PORT = 8000
 IP_BASE = "192.168.20." # Assuming the first three parts are fixed
-RETRY_DELAY_SECONDS = 2
+RETRY_DELAY_SECONDS = 2 # Upper limit of the backoff between retries
+RETRY_BASE_DELAY_SECONDS = 0.1 # First backoff (doubles on every retry, with jitter)
+REQUEST_TIMEOUT_SECONDS = 10 # Per-request timeout (also capped by the deadline)
+DEFAULT_DEADLINE_SECONDS = 30 # Give up on a port after this many seconds
+NUM_PORTS = 4 # Ports per controller
+
+# Outcome of one TURN_OFF command
+PortResult = namedtuple("PortResult", "controller_ip port_id ok attempts elapsed error")
+
+
+class HVCommandError(Exception):
+    """Raised when one or more ports could not be switched before the deadline"""
+
+    def __init__(self, results):
+        self.results = results
+        failed = [f"{r.controller_ip} port {r.port_id}: {r.error}" for r in results if not r.ok]
+        super().__init__("; ".join(failed))
+
 
-def send_turn_off_command(controller_ip_last: str, target_port_id: int):
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for the given retry number (1, 2, ...)"""
+    delay = min(RETRY_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class HVController:
     """
-    Sends the TURN_OFF command to the specified port on the HV controller.
-    Retries indefinitely until successful.
+    One HV controller. Keeps a pooled keep-alive requests.Session so that
+    repeated commands (and the four ports turned off in parallel) reuse
+    the same connections.
     """
-    controller_ip = IP_BASE + controller_ip_last
-    api_url = f"http://{controller_ip}:{DEFAULT_CONTROLLER_PORT}/serial/command"
-    payload = {
-        "port_id": target_port_id,
-        "command_type": "TURN_OFF",
-    }
-
-    while True: # Loop indefinitely until success
-        try:
-            # Send HTTP POST request
-            response = requests.post(
-                api_url,
-                headers={"Content-Type": "application/json"},
-                json=payload,
-                timeout=10 # Set timeout to 10 seconds
-            )
-
-            # Check server response
-            response.raise_for_status() # Raise exception for non-2xx status codes
-
-            # If successful, break the loop
-            # No print statement for success as requested
-            # print("Success!")
-            # print(f"Server response: {response.json()}")
-            break # Exit the while loop on success
-
-        except requests.exceptions.ConnectionError as e:
-            print(f"\nError: Could not connect to controller at {controller_ip}:{DEFAULT_CONTROLLER_PORT}.")
-            print(f"Details: {e}")
-            print(f"Retrying in {RETRY_DELAY_SECONDS} seconds...")
-
-        except requests.exceptions.Timeout:
-            print(f"\nError: Request to controller timed out.")
-            print(f"Retrying in {RETRY_DELAY_SECONDS} seconds...")
-
-        except requests.exceptions.RequestException as e:
-            print(f"\nAn error occurred: {e}")
+
+    def __init__(self, controller_ip_last, port=DEFAULT_CONTROLLER_PORT):
+        self.controller_ip = IP_BASE + str(controller_ip_last)
+        self.api_url = f"http://{self.controller_ip}:{port}/serial/command"
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=NUM_PORTS)
+        self.session.mount("http://", adapter)
+
+    def send_command(self, target_port_id, command_type, deadline_seconds=DEFAULT_DEADLINE_SECONDS, verbose=True):
+        """
+        Send one command to a port, retrying with jittered exponential backoff
+        until it succeeds or the deadline passes. Returns a PortResult.
+        """
+        with telemetry.span("hv.send_command", controller=self.controller_ip, port=target_port_id,
+                            command=command_type) as span:
+            result = self._send_command(target_port_id, command_type, deadline_seconds, verbose)
+            span.set(attempts=result.attempts)
+            if not result.ok:
+                span.fail(result.error)
+            return result
+
+    def _send_command(self, target_port_id, command_type, deadline_seconds, verbose):
+        payload = {
+            "port_id": target_port_id,
+            "command_type": command_type,
+        }
+        start = time.monotonic()
+        deadline = start + deadline_seconds
+        attempts = 0
+        error = None
+
+        while True:
+            attempts += 1
+            remaining = deadline - time.monotonic()
+            response = None
             try:
-                # Attempt to print server error details if available
-                print(f"Server error details: {response.text}")
-            except NameError:
-                pass # response might not be defined if connection failed early
-            except Exception as detail_err:
-                 print(f"(Could not get error details: {detail_err})")
-            print(f"Retrying in {RETRY_DELAY_SECONDS} seconds...")
+                # Send HTTP POST request
+                response = self.session.post(
+                    self.api_url,
+                    json=payload,
+                    timeout=max(0.1, min(REQUEST_TIMEOUT_SECONDS, remaining))
+                )
+
+                # Check server response
+                response.raise_for_status() # Raise exception for non-2xx status codes
+                return PortResult(self.controller_ip, target_port_id, True, attempts,
+                                  time.monotonic() - start, None)
+
+            except requests.exceptions.ConnectionError as e:
+                error = f"Could not connect to controller at {self.controller_ip}: {e}"
+
+            except requests.exceptions.Timeout:
+                error = "Request to controller timed out"
+
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+                if response is not None and response.text:
+                    # Keep the server error details if available
+                    error += f" (server: {response.text.strip()})"
+
+            delay = backoff_delay(attempts)
+            if time.monotonic() + delay >= deadline:
+                if verbose:
+                    print(f"\nError: Port {target_port_id} on {self.controller_ip}: {error}. "
+                          f"Giving up after {attempts} attempt(s).")
+                return PortResult(self.controller_ip, target_port_id, False, attempts,
+                                  time.monotonic() - start, error)
+
+            if verbose:
+                print(f"\nError: Port {target_port_id} on {self.controller_ip}: {error}")
+                print(f"Retrying in {delay:.2f} seconds...")
+            # Wait before retrying
+            time.sleep(delay)
+
+    def turn_off(self, target_port_id, deadline_seconds=DEFAULT_DEADLINE_SECONDS, verbose=True):
+        return self.send_command(target_port_id, "TURN_OFF", deadline_seconds, verbose)
+
+    def turn_on(self, target_port_id, deadline_seconds=DEFAULT_DEADLINE_SECONDS, verbose=True):
+        return self.send_command(target_port_id, "TURN_ON", deadline_seconds, verbose)
+
+    def _each_port(self, switch, port_ids, deadline_seconds, verbose):
+        port_ids = list(port_ids)
+        with ThreadPoolExecutor(max_workers=len(port_ids)) as pool:
+            futures = [pool.submit(switch, p, deadline_seconds, verbose) for p in port_ids]
+            return [f.result() for f in futures]
+
+    def turn_off_ports(self, port_ids=range(NUM_PORTS), deadline_seconds=DEFAULT_DEADLINE_SECONDS, verbose=True):
+        """
+        Turn off several ports concurrently over the shared session.
+        Returns one PortResult per port, in the order given.
+        """
+        return self._each_port(self.turn_off, port_ids, deadline_seconds, verbose)
 
-        # Wait before retrying
-        time.sleep(RETRY_DELAY_SECONDS)
+    def turn_on_ports(self, port_ids=range(NUM_PORTS), deadline_seconds=DEFAULT_DEADLINE_SECONDS, verbose=True):
+        """
+        Turn several ports back on concurrently (power restore).
+        Returns one PortResult per port, in the order given.
+        """
+        return self._each_port(self.turn_on, port_ids, deadline_seconds, verbose)
+
+    def close(self):
+        self.session.close()
+
+
+# --- One controller object (and session) per IP, shared by all callers ---
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_controller(controller_ip_last):
+    with _controllers_lock:
+        key = str(controller_ip_last)
+        if key not in _controllers:
+            _controllers[key] = HVController(key)
+        return _controllers[key]
+
+
+def send_turn_off_command(controller_ip_last: str, target_port_id: int,
+                          deadline_seconds: float = DEFAULT_DEADLINE_SECONDS):
+    """
+    Sends the TURN_OFF command to the specified port on the HV controller.
+    Retries with backoff until successful or the deadline passes.
+    Returns a PortResult.
+    """
+    return get_controller(controller_ip_last).turn_off(target_port_id, deadline_seconds)
+
+
+def turn_off_ports(controller_ip_last, port_ids=range(NUM_PORTS),
+                   deadline_seconds: float = DEFAULT_DEADLINE_SECONDS, verbose=True):
+    """
+    Turns off all given ports of one controller concurrently.
+    Returns a list of PortResult. verbose=False keeps the retry messages off stdout.
+    """
+    return get_controller(controller_ip_last).turn_off_ports(port_ids, deadline_seconds, verbose)
+
+
+def turn_on_ports(controller_ip_last, port_ids=range(NUM_PORTS),
+                  deadline_seconds: float = DEFAULT_DEADLINE_SECONDS, verbose=True):
+    """
+    Turns all given ports of one controller back on concurrently.
+    Returns a list of PortResult. verbose=False keeps the retry messages off stdout.
+    """
+    return get_controller(controller_ip_last).turn_on_ports(port_ids, deadline_seconds, verbose)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Send TURN_OFF command to HV Controller.")
+    parser = argparse.ArgumentParser(description="Send TURN_OFF (or TURN_ON) command to HV Controller.")
     parser.add_argument(
         "--ip_last",
         type=str,
@@ -74,13 +200,40 @@ if __name__ == "__main__":
     parser.add_argument(
         "--port",
         type=int,
+        nargs="+",
         required=True,
-        help="The target Port ID to turn off."
+        help="The target Port ID(s) to turn off. Several ports are turned off concurrently."
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE_SECONDS,
+        help=f"Give up after this many seconds (default: {DEFAULT_DEADLINE_SECONDS})."
+    )
+    parser.add_argument(
+        "--on",
+        action="store_true",
+        help="Send TURN_ON instead (power restore)."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the per-port results as JSON."
     )
 
     args = parser.parse_args()
 
     # Call the function to send the command with retries
-    send_turn_off_command(args.ip_last, args.port)
-    # The script will only exit this function call upon success.
-    print(f"TURN_OFF command successfully sent to Port {args.port} on {IP_BASE}{args.ip_last}.")
+    switch = turn_on_ports if args.on else turn_off_ports
+    command_type = "TURN_ON" if args.on else "TURN_OFF"
+    results = switch(args.ip_last, args.port, args.deadline)
+    if args.json:
+        print(json.dumps([r._asdict() for r in results]))
+    else:
+        for r in results:
+            if r.ok:
+                print(f"{command_type} command successfully sent to Port {r.port_id} on {r.controller_ip}.")
+            else:
+                print(f"{command_type} command FAILED for Port {r.port_id} on {r.controller_ip}: {r.error}")
+    if not all(r.ok for r in results):
+        raise SystemExit(1)